@@ -0,0 +1,71 @@
+import os
+import sqlite3
+
+class ArgIndex(object):
+    """
+    Persistent record of a digest of each node's sorted args, used to check
+    whether a node's args have changed since the previous run.
+
+    Digests are stored in an sqlite3 database and are looked up one node at
+    a time, so nothing is read for nodes which are never checked. When the
+    index is saved only rows whose digest has changed are written.
+    """
+    # Increment if the way digests are calculated changes, saved digests
+    # from a different version are discarded.
+    version = 1
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self._conn = None
+        self.saved = {}
+
+    def index_filename(self):
+        return os.path.join(self.wrapper.artifacts_dir, "batch.args.sqlite3")
+
+    def connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.index_filename(), check_same_thread=False)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != self.version:
+                conn.execute("DROP TABLE IF EXISTS args")
+                conn.execute("CREATE TABLE args (key TEXT PRIMARY KEY, digest TEXT)")
+                conn.execute("PRAGMA user_version = %d" % self.version)
+                conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self.saved = {}
+
+    def saved_digest(self, node_key):
+        """
+        Returns the args digest saved for node_key by the previous run, or None.
+        """
+        if not node_key in self.saved:
+            if not os.path.exists(self.index_filename()):
+                return None
+            row = self.connect().execute(
+                    "SELECT digest FROM args WHERE key = ?",
+                    (node_key,)).fetchone()
+            self.saved[node_key] = row and row[0]
+        return self.saved[node_key]
+
+    def save(self, nodes):
+        """
+        Writes args digests for nodes, removing entries for any other nodes.
+        """
+        digests = dict((node.key_with_class(), node.args_digest()) for node in nodes)
+
+        conn = self.connect()
+        saved = dict(conn.execute("SELECT key, digest FROM args"))
+        stale_keys = [(k,) for k in saved if not k in digests]
+        changed = [(k, v) for k, v in digests.iteritems() if saved.get(k) != v]
+
+        conn.executemany("DELETE FROM args WHERE key = ?", stale_keys)
+        conn.executemany("INSERT OR REPLACE INTO args VALUES (?, ?)", changed)
+        conn.commit()
+
+        self.saved = digests
@@ -0,0 +1,203 @@
+from dexy.utils import md5_file
+import os
+import shutil
+
+class ArtifactStore(object):
+    """
+    Content-addressed store for cache files produced by previous runs.
+
+    Each entry is keyed by a document's artifact key, which is calculated from
+    the contents of the document and its inputs, its filters and its
+    arguments. File contents are copied once into the objects directory under
+    their own digest and are shared by every entry which refers to them.
+    Objects are deleted when no entry refers to them any more.
+
+    Objects are always copied to and from the cache, never hard linked, so
+    writing to a cache file in place can't change a stored object.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.entries = None
+        self.refcounts = None
+        self.current = None
+        self.run_number = 0
+
+    def __contains__(self, artifact_key):
+        self.load()
+        return artifact_key in self.entries
+
+    def store_dir(self):
+        return os.path.join(self.wrapper.artifacts_dir, "objects")
+
+    def index_filename(self):
+        return os.path.join(self.store_dir(), "index.pickle")
+
+    def object_filepath(self, digest):
+        return os.path.join(self.store_dir(), digest[0:2], digest)
+
+    def load(self):
+        """
+        Loads the index of entries saved by the previous run, if not already
+        loaded.
+        """
+        if self.entries is not None:
+            return
+
+        try:
+            with open(self.index_filename(), 'rb') as f:
+                pickle = self.wrapper.pickle_lib()
+                info = pickle.load(f)
+            self.entries = info['entries']
+            self.current = info['current']
+            self.run_number = info['run-number'] + 1
+        except IOError:
+            self.entries = {}
+            self.current = {}
+            self.run_number = 0
+
+        self.refcounts = {}
+        for entry in self.entries.values():
+            for digest in entry['files'].values():
+                self.incref(digest)
+
+    def save(self):
+        self.load()
+
+        try:
+            os.makedirs(self.store_dir())
+        except OSError:
+            pass
+
+        info = {
+            'entries' : self.entries,
+            'current' : self.current,
+            'run-number' : self.run_number
+            }
+
+        with open(self.index_filename(), 'wb') as f:
+            pickle = self.wrapper.pickle_lib()
+            pickle.dump(info, f)
+
+    def incref(self, digest):
+        self.refcounts[digest] = self.refcounts.get(digest, 0) + 1
+
+    def decref(self, digest):
+        """
+        Decrements the reference count for an object, removing the object
+        file once nothing refers to it.
+        """
+        self.refcounts[digest] -= 1
+        if self.refcounts[digest] == 0:
+            del self.refcounts[digest]
+            try:
+                os.remove(self.object_filepath(digest))
+            except OSError:
+                pass
+
+    def remove_entry(self, artifact_key):
+        entry = self.entries.pop(artifact_key)
+        for digest in entry['files'].values():
+            self.decref(digest)
+
+    def add_object(self, filepath):
+        """
+        Adds the file to the objects directory, unless an identical object is
+        already present, and returns its digest.
+        """
+        digest = md5_file(filepath)
+        object_filepath = self.object_filepath(digest)
+
+        if not os.path.exists(object_filepath):
+            try:
+                os.makedirs(os.path.dirname(object_filepath))
+            except OSError:
+                pass
+
+            shutil.copy2(filepath, object_filepath)
+
+        return digest
+
+    def add(self, node_hashid, artifact_key, cache_dir, relpaths):
+        """
+        Records the files at relpaths (relative to cache_dir) as the artifacts
+        for artifact_key. Returns False if any of the files are missing.
+        """
+        self.load()
+
+        filepaths = [os.path.join(cache_dir, relpath) for relpath in relpaths]
+        if not all(os.path.exists(filepath) for filepath in filepaths):
+            return False
+
+        files = {}
+        for relpath, filepath in zip(relpaths, filepaths):
+            files[relpath] = self.add_object(filepath)
+
+        for digest in files.values():
+            self.incref(digest)
+
+        if artifact_key in self.entries:
+            self.remove_entry(artifact_key)
+
+        self.entries[artifact_key] = {
+                'files' : files,
+                'run' : self.run_number
+                }
+        self.current[node_hashid] = artifact_key
+        return True
+
+    def touch(self, node_hashid):
+        """
+        Marks the entry most recently recorded for a node as used in this run.
+        """
+        self.load()
+        artifact_key = self.current.get(node_hashid)
+        if artifact_key in self.entries:
+            self.entries[artifact_key]['run'] = self.run_number
+
+    def restore(self, node_hashid, artifact_key, cache_dir):
+        """
+        Copies the files recorded for artifact_key into cache_dir. Returns
+        False if there is no complete entry for artifact_key.
+        """
+        self.load()
+        entry = self.entries.get(artifact_key)
+        if not entry:
+            return False
+
+        for digest in entry['files'].values():
+            if not os.path.exists(self.object_filepath(digest)):
+                self.remove_entry(artifact_key)
+                return False
+
+        for relpath, digest in entry['files'].iteritems():
+            filepath = os.path.join(cache_dir, relpath)
+
+            try:
+                os.makedirs(os.path.dirname(filepath))
+            except OSError:
+                pass
+
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+            shutil.copy2(self.object_filepath(digest), filepath)
+
+        entry['run'] = self.run_number
+        self.current[node_hashid] = artifact_key
+        return True
+
+    def collect_garbage(self):
+        """
+        Removes entries which have not been used within the number of runs
+        set by artifact_store_runs, and any objects left unreferenced.
+        """
+        self.load()
+        keep_runs = int(self.wrapper.artifact_store_runs)
+        for artifact_key, entry in self.entries.items():
+            if self.run_number - entry['run'] >= keep_runs:
+                self.remove_entry(artifact_key)
+
+        live = set(self.entries)
+        for node_hashid, artifact_key in self.current.items():
+            if not artifact_key in live:
+                del self.current[node_hashid]
@@ -1,24 +1,88 @@
+from UserDict import DictMixin
 import uuid
 import os
 import dexy.data
+import sqlite3
+
+class SavedBatchDocs(DictMixin):
+    """
+    Read-only mapping of doc keys to batch info for a saved batch, which
+    reads each doc's info from the batch database when it is first needed.
+    """
+    def __init__(self, batch):
+        self.batch = batch
+        self.cache = {}
+
+    def __getitem__(self, doc_key):
+        if not doc_key in self.cache:
+            row = self.batch.query("SELECT info FROM docs WHERE doc_key = ?",
+                    (doc_key,)).fetchone()
+            if row is None:
+                raise KeyError(doc_key)
+            pickle = dexy.utils.pickle_lib(self.batch.wrapper)
+            self.cache[doc_key] = pickle.loads(str(row[0]))
+        return self.cache[doc_key]
+
+    def __contains__(self, doc_key):
+        row = self.batch.query("SELECT 1 FROM docs WHERE doc_key = ?",
+                (doc_key,)).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        for row in self.batch.query("SELECT doc_key FROM docs ORDER BY position"):
+            yield row[0]
+
+    def __len__(self):
+        return self.batch.query("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def keys(self):
+        return list(self)
+
+class SavedBatchDocKeys(DictMixin):
+    """
+    Read-only mapping of storage keys to doc keys for a saved batch.
+    """
+    def __init__(self, batch):
+        self.batch = batch
+
+    def __getitem__(self, storage_key):
+        row = self.batch.query("SELECT doc_key FROM docs WHERE storage_key = ?",
+                (storage_key,)).fetchone()
+        if row is None:
+            raise KeyError(storage_key)
+        return row[0]
+
+    def __contains__(self, storage_key):
+        try:
+            self[storage_key]
+            return True
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        for row in self.batch.query("SELECT storage_key FROM docs ORDER BY position"):
+            yield row[0]
+
+    def keys(self):
+        return list(self)
 
 class Batch(object):
     def __init__(self, wrapper):
         self.wrapper = wrapper
         self.docs = {}
         self.doc_keys = {}
+        self.doc_filters = {}
         self.filters_used = []
         self.uuid = str(uuid.uuid4())
         self.start_time = None
         self.end_time = None
+        self._db = None
 
     def __repr__(self):
         return "Batch(%s)" % self.uuid
 
     def __iter__(self):
-        for doc_key in self.docs:
-            if self.docs[doc_key]['state'] in ('uncached',):
-                continue
+        for doc_key in self.doc_keys_excluding_states('uncached'):
             yield self.output_data(doc_key)
 
     def add_doc(self, doc):
@@ -30,6 +94,7 @@ class Batch(object):
             storage_key = doc.output_data().storage_key
             self.doc_keys[storage_key] = doc_key
             self.update_doc_info(doc)
+            self.doc_filters[doc_key] = list(doc.filter_aliases)
             self.filters_used.extend(doc.filter_aliases)
 
     def update_doc_info(self, doc):
@@ -43,6 +108,63 @@ class Batch(object):
 
     def doc_info(self, doc_key):
         return self.docs[doc_key]
+
+    def query(self, sql, args=()):
+        return self._db.execute(sql, args)
+
+    def doc_keys_excluding_states(self, *states):
+        """
+        Returns keys of docs whose state is not one of states.
+        """
+        if self._db:
+            sql = "SELECT doc_key FROM docs WHERE state NOT IN (%s) ORDER BY position"
+            sql = sql % ", ".join("?" for state in states)
+            return [row[0] for row in self.query(sql, states)]
+        else:
+            return [doc_key for doc_key in self.docs
+                    if not self.docs[doc_key]['state'] in states]
+
+    def doc_keys_with_state(self, state):
+        if self._db:
+            sql = "SELECT doc_key FROM docs WHERE state = ? ORDER BY position"
+            return [row[0] for row in self.query(sql, (state,))]
+        else:
+            return [doc_key for doc_key in self.docs
+                    if self.docs[doc_key]['state'] == state]
+
+    def doc_keys_with_filter(self, filter_alias):
+        if self._db:
+            sql = """SELECT doc_key FROM doc_filters WHERE filter_alias = ?
+                ORDER BY doc_key"""
+            return [row[0] for row in self.query(sql, (filter_alias,))]
+        else:
+            return sorted(doc_key for doc_key, aliases in self.doc_filters.iteritems()
+                    if filter_alias in aliases)
+
+    def output_datas_matching(self, expr=None, key=None):
+        """
+        Returns output data objects for docs which are not uncached and
+        whose output data key contains expr, or is equal to key.
+        """
+        if self._db:
+            if expr is not None:
+                sql = """SELECT doc_key FROM docs WHERE state != 'uncached'
+                    AND instr(output_key, ?) > 0 ORDER BY position"""
+                args = (expr,)
+            else:
+                sql = """SELECT doc_key FROM docs WHERE state != 'uncached'
+                    AND output_key = ? ORDER BY position"""
+                args = (key,)
+            doc_keys = [row[0] for row in self.query(sql, args)]
+        else:
+            doc_keys = []
+            for doc_key in self.doc_keys_excluding_states('uncached'):
+                output_key = self.docs[doc_key]['output-data'][1]
+                if (expr is not None and expr in output_key) or \
+                        (expr is None and output_key == key):
+                    doc_keys.append(doc_key)
+
+        return [self.output_data(doc_key) for doc_key in doc_keys]
    
     def doc_key(self, storage_key):
         return self.doc_keys[storage_key]
@@ -55,7 +177,7 @@ class Batch(object):
         doc_key = self.doc_key(storage_key)
         return self.data(doc_key, input_or_output)
 
-    def data(self, doc_key, input_or_output='output'):
+    def data(self, doc_key, input_or_output='output', connect=True):
         """
         Retrieves a data object given the doc key.
         """
@@ -64,7 +186,7 @@ class Batch(object):
         args.append(self.wrapper)
         data = dexy.data.Data.create_instance(*args)
         data.setup_storage()
-        if hasattr(data.storage, 'connect'):
+        if connect and hasattr(data.storage, 'connect'):
             data.storage.connect()
         return data
 
@@ -75,6 +197,12 @@ class Batch(object):
             return 0
 
     def filename(self):
+        return "%s.sqlite3" % self.uuid
+
+    def pickle_filename(self):
+        """
+        Name of batch files saved by earlier versions of dexy.
+        """
         return "%s.pickle" % self.uuid
 
     def filepath(self):
@@ -91,24 +219,94 @@ class Batch(object):
         return dict((k, getattr(self, k),) for k in attr_names)
 
     def save_to_file(self):
+        """
+        Saves the batch to a sqlite database with a row for each doc, so
+        saved batches can be queried without loading every doc's info.
+        """
         try:
             os.makedirs(self.batch_dir())
         except OSError:
             pass
 
-        with open(self.filepath(), 'w') as f:
-            pickle = dexy.utils.pickle_lib(self.wrapper)
-            pickle.dump(self.to_dict(), f)
+        tmp_filepath = "%s-tmp" % self.filepath()
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+
+        pickle = dexy.utils.pickle_lib(self.wrapper)
+        db = sqlite3.connect(tmp_filepath)
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("CREATE TABLE batch (name TEXT PRIMARY KEY, value BLOB)")
+        db.execute("""CREATE TABLE docs (doc_key TEXT PRIMARY KEY,
+            position INTEGER, storage_key TEXT, output_key TEXT, state TEXT,
+            info BLOB)""")
+        db.execute("CREATE TABLE doc_filters (doc_key TEXT, filter_alias TEXT)")
+
+        batch_info = {
+                'uuid' : self.uuid,
+                'filters_used' : self.filters_used,
+                'start_time' : self.start_time,
+                'end_time' : self.end_time
+                }
+        db.executemany("INSERT INTO batch VALUES (?, ?)",
+                ((k, sqlite3.Binary(pickle.dumps(v, 2))) for k, v in batch_info.iteritems()))
+
+        storage_keys = dict((v, k) for k, v in self.doc_keys.iteritems())
+
+        def doc_rows():
+            for position, (doc_key, info) in enumerate(self.docs.iteritems()):
+                yield (doc_key, position, storage_keys.get(doc_key),
+                        info['output-data'][1], info['state'],
+                        sqlite3.Binary(pickle.dumps(info, 2)))
+        db.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?, ?)", doc_rows())
+
+        db.executemany("INSERT INTO doc_filters VALUES (?, ?)",
+                ((doc_key, alias) for doc_key, aliases in self.doc_filters.iteritems()
+                    for alias in aliases))
+
+        db.execute("CREATE INDEX docs_storage_key ON docs (storage_key)")
+        db.execute("CREATE INDEX docs_output_key ON docs (output_key)")
+        db.execute("CREATE INDEX docs_state ON docs (state)")
+        db.execute("CREATE INDEX doc_filters_alias ON doc_filters (filter_alias)")
+        db.commit()
+        db.close()
+
+        os.rename(tmp_filepath, self.filepath())
 
         with open(self.most_recent_filename(), 'w') as f:
             f.write(self.uuid)
 
     def load_from_file(self):
+        """
+        Opens the saved batch database. Docs' info is read from it as needed.
+        """
         pickle = dexy.utils.pickle_lib(self.wrapper)
-        with open(self.filepath(), 'r') as f:
-            d = pickle.load(f)
-            for k, v in d.iteritems():
-                setattr(self, k, v)
+        pickle_filepath = os.path.join(self.batch_dir(), self.pickle_filename())
+
+        if not os.path.exists(self.filepath()) and os.path.exists(pickle_filepath):
+            with open(pickle_filepath, 'r') as f:
+                d = pickle.load(f)
+                for k, v in d.iteritems():
+                    setattr(self, k, v)
+            return
+
+        if not os.path.exists(self.filepath()):
+            raise IOError("no batch file %s" % self.filepath())
+
+        self._db = sqlite3.connect(self.filepath(), check_same_thread=False)
+        for name, value in self.query("SELECT name, value FROM batch"):
+            setattr(self, name, pickle.loads(str(value)))
+
+        self.docs = SavedBatchDocs(self)
+        self.doc_keys = SavedBatchDocKeys(self)
+
+    def close(self):
+        """
+        Closes the saved batch database, if one was opened by load_from_file.
+        """
+        if self._db:
+            self._db.close()
+            self._db = None
 
     @classmethod
     def load_most_recent(klass, wrapper):
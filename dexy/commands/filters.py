@@ -1,8 +1,11 @@
 from dexy.commands.utils import template_text
+from dexy.utils import defaults
 from pygments import highlight
 from pygments.lexers import PythonLexer
 import dexy.filter
+import dexy.versions
 import inspect
+import os
 import pygments.formatters
 
 extra_nodoc_aliases = ('-',)
@@ -104,7 +107,15 @@ def help_for_filter(alias, run_example, show_source, nocolor):
 
 def list_filters(versions):
         print "Installed filters:"
-        for filter_instance in dexy.filter.Filter:
+        filter_instances = list(dexy.filter.Filter)
+
+        if versions:
+            if os.path.isdir(defaults['artifacts_dir']):
+                versions_file = os.path.join(defaults['artifacts_dir'], "versions.json")
+                dexy.versions.probes.load(versions_file)
+            dexy.versions.probe_filter_versions(filter_instances)
+
+        for filter_instance in filter_instances:
             # Should we show this filter?
             no_aliases = not filter_instance.setting('aliases')
             no_doc = filter_instance.setting('nodoc')
@@ -49,12 +49,13 @@ def grep_command(
     if not batch:
         print "you need to run dexy first"
         sys.exit(1)
-    else:
+
+    try:
         if expr:
-            matches = sorted([data for data in batch if expr in data.key],
+            matches = sorted(batch.output_datas_matching(expr=expr),
                     key=attrgetter('key'))
         elif key:
-            matches = sorted([data for data in batch if key == data.key],
+            matches = sorted(batch.output_datas_matching(key=key),
                     key=attrgetter('key'))
         else:
             raise dexy.exceptions.UserFeedback("Must specify either expr or key")
@@ -66,6 +67,8 @@ def grep_command(
 
         for match in matches:
             print_match(match, keys, keyexpr, contents, keylimit, lines)
+    finally:
+        batch.close()
 
 def print_match(match, keys, keyexpr, contents, keylimit, lines):
     print match.key, "\tcache key:", match.storage_key
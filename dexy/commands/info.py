@@ -4,7 +4,9 @@ from dexy.commands.utils import print_indented
 from dexy.commands.utils import print_rewrapped
 from dexy.utils import defaults
 from operator import attrgetter
+import cashew.exceptions
 import dexy.exceptions
+import dexy.filter
 import sys
 
 ### "info-keys"
@@ -44,6 +46,12 @@ def links_command(
     wrapper.setup_log()
     wrapper.batch = batch
 
+    try:
+        print_links(wrapper)
+    finally:
+        batch.close()
+
+def print_links(wrapper):
     wrapper.add_lookups()
 
     if wrapper.lookup_nodes:
@@ -75,6 +83,22 @@ def links_command(
         print_indented("%r" % node, 4)
         print ''
 
+def filter_versions(data):
+    """
+    Returns the installed versions of the filters applied to data which have
+    version commands, using the cached results of the version commands.
+    """
+    versions = []
+    for alias in data.key.split("|")[1:]:
+        try:
+            filter_instance = dexy.filter.Filter.create_instance(alias)
+        except (cashew.exceptions.NoPlugin, dexy.exceptions.InactivePlugin):
+            continue
+
+        if hasattr(filter_instance, 'version') and filter_instance.version_command():
+            versions.append((alias, filter_instance.version() or "not available"))
+    return versions
+
 ### "info-com"
 def info_command(
         __cli_options=False,
@@ -97,13 +121,20 @@ def info_command(
     wrapper.setup_log()
     batch = Batch.load_most_recent(wrapper)
     wrapper.batch = batch
+    wrapper.load_version_probes()
+
+    try:
+        print_info(wrapper, batch, expr, key, ws)
+    finally:
+        batch.close()
 
+def print_info(wrapper, batch, expr, key, ws):
     if expr:
         print "search expr:", expr
-        matches = sorted([data for data in batch if expr in data.key],
+        matches = sorted(batch.output_datas_matching(expr=expr),
                 key=attrgetter('key'))
     elif key:
-        matches = sorted([data for data in batch if key == data.key],
+        matches = sorted(batch.output_datas_matching(key=key),
                 key=attrgetter('key'))
     else:
         raise dexy.exceptions.UserFeedback("Must specify either expr or key")
@@ -131,6 +162,13 @@ def info_command(
             print_indented("%s(): %s" % (fname, getattr(match, fname)()), 4)
         print ""
 
+        versions = filter_versions(match)
+        if versions:
+            print_indented("filter versions:", 2)
+            for alias, version in versions:
+                print_indented("%s: %s" % (alias, version), 4)
+            print ""
+
         if storage_methods:
             print_indented("storage methods:", 2)
             for fname in sorted(storage_methods):
@@ -24,6 +24,8 @@ def dexy_command(
         h=False, #nodoc
         hashfunction=defaults['hashfunction'], # What hash function to use, set to crc32 or adler32 for more speed but less reliability
         include=defaults['include'], # Locations to include which would normally be excluded.
+        j=False, # Shortcut for -jobs.
+        jobs=defaults['jobs'], # Number of documents to process in parallel.
         logdir=defaults['log_dir'], # DEPRECATED
         logfile=defaults['log_file'], # name of log file
         logformat=defaults['log_format'], # format of log entries
@@ -57,6 +59,9 @@ def dexy_command(
     if r or reset:
         dexy.commands.dirs.reset_command(artifactsdir=artifactsdir, logdir=logdir)
 
+    if j:
+        jobs = j
+
     if silent:
         print "sorry, -silent option not implemented yet https://github.com/ananelson/dexy/issues/33"
 
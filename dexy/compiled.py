@@ -0,0 +1,132 @@
+from dexy.utils import md5_hash
+import json
+import os
+import shutil
+import threading
+
+class CompiledExecutables(object):
+    """
+    Store of executables built by compiling filters, shared between
+    documents and runs.
+
+    An executable is keyed by the digest of the source it was compiled from,
+    the compiler command and the compiler version, so documents which compile
+    the same source the same way only need to run the compiler once. Entries
+    which have not been used within the number of runs set by
+    artifact_store_runs are removed.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.lock = threading.Lock()
+        self.entries = None
+        self.run_number = 0
+
+    def store_dir(self):
+        return os.path.join(self.wrapper.artifacts_dir, "compiled")
+
+    def index_filename(self):
+        return os.path.join(self.store_dir(), "index.pickle")
+
+    def entry_filepath(self, key):
+        return os.path.join(self.store_dir(), key[0:2], key)
+
+    def key(self, *info):
+        return md5_hash(json.dumps(info))
+
+    def load(self):
+        if self.entries is not None:
+            return
+
+        try:
+            with open(self.index_filename(), 'rb') as f:
+                pickle = self.wrapper.pickle_lib()
+                info = pickle.load(f)
+            self.entries = info['entries']
+            self.run_number = info['run-number'] + 1
+        except IOError:
+            self.entries = {}
+            self.run_number = 0
+
+    def save(self):
+        if self.entries is None:
+            return
+
+        try:
+            os.makedirs(self.store_dir())
+        except OSError:
+            pass
+
+        info = {
+            'entries' : self.entries,
+            'run-number' : self.run_number
+            }
+
+        with open(self.index_filename(), 'wb') as f:
+            pickle = self.wrapper.pickle_lib()
+            pickle.dump(info, f)
+
+    def fetch(self, key, filepath):
+        """
+        Links the executable stored under key to filepath. Returns False if
+        there is no such executable.
+        """
+        with self.lock:
+            self.load()
+            entry_filepath = self.entry_filepath(key)
+            if not key in self.entries or not os.path.exists(entry_filepath):
+                return False
+
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+            try:
+                os.link(entry_filepath, filepath)
+            except (OSError, AttributeError):
+                shutil.copy2(entry_filepath, filepath)
+
+            self.entries[key] = self.run_number
+            return True
+
+    def add(self, key, filepath):
+        """
+        Stores the executable at filepath under key.
+        """
+        with self.lock:
+            self.load()
+            entry_filepath = self.entry_filepath(key)
+            try:
+                os.makedirs(os.path.dirname(entry_filepath))
+            except OSError:
+                pass
+
+            tmp_filepath = "%s-tmp" % entry_filepath
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+
+            try:
+                os.link(filepath, tmp_filepath)
+            except (OSError, AttributeError):
+                shutil.copy2(filepath, tmp_filepath)
+
+            os.rename(tmp_filepath, entry_filepath)
+            self.entries[key] = self.run_number
+
+    def collect_garbage(self):
+        """
+        Removes executables which have not been used recently and saves the
+        index.
+        """
+        if self.entries is None and not os.path.exists(self.index_filename()):
+            return
+
+        self.load()
+        keep_runs = int(self.wrapper.artifact_store_runs)
+        for key, run in self.entries.items():
+            if self.run_number - run >= keep_runs:
+                del self.entries[key]
+                try:
+                    os.remove(self.entry_filepath(key))
+                except OSError:
+                    pass
+
+        self.save()
@@ -3,12 +3,17 @@ import dexy.plugin
 import dexy.storage
 import dexy.utils
 import dexy.wrapper
+import codecs
 import inflection
+import io
 import os
 import posixpath
+import re
 import shutil
 import urllib
 
+html_header_re = re.compile("<(html|body|head)")
+
 class Data(dexy.plugin.Plugin):
     """
     Base class for types of Data.
@@ -29,17 +34,7 @@ class Data(dexy.plugin.Plugin):
             ('ready', 'ready')
             )
 
-    def add_to_lookup_nodes(self):
-        if self.setting('canonical-output'):
-            self.wrapper.add_data_to_lookup_nodes(self.key, self)
-            self.wrapper.add_data_to_lookup_nodes(self.output_name(), self)
-            self.wrapper.add_data_to_lookup_nodes(self.title(), self)
-
-    def add_to_lookup_sections(self):
-        if self.setting('canonical-output'):
-            for section_name in self.keys():
-                if not section_name == '1':
-                    self.wrapper.add_data_to_lookup_sections(section_name, self)
+    _title = None
 
     def __init__(self, key, ext, storage_key, settings, wrapper):
         self.key = key
@@ -158,6 +153,20 @@ class Data(dexy.plugin.Plugin):
         self._data = data
         self.save()
 
+    def iterlines(self):
+        """
+        Yields lines of the document's text, split at newlines only and
+        including the newline character.
+        """
+        for line in io.StringIO(unicode(self)):
+            yield line
+
+    def write_chunks(self, chunks):
+        """
+        Saves data supplied as an iterable of text chunks.
+        """
+        self.set_data(u"".join(chunks))
+
     def is_cached(self, this=None):
         if this is None:
             this = (self.wrapper.state in ('walked', 'running'))
@@ -220,6 +229,11 @@ class Data(dexy.plugin.Plugin):
         if self.setting('title'):
             return self.setting('title')
 
+        if self._title is None:
+            self._title = self.title_from_name()
+        return self._title
+
+    def title_from_name(self):
         if self.is_index_page():
             subdir = posixpath.split(posixpath.dirname(self.name))[-1]
             if subdir == "/":
@@ -231,6 +245,18 @@ class Data(dexy.plugin.Plugin):
         else:
             return inflection.titleize(self.baserootname())
 
+    def has_html_header(self):
+        """
+        Whether the document contains <html, <body or <head tags.
+        """
+        return bool(html_header_re.search(unicode(self)))
+
+    def section_id(self, key):
+        """
+        Returns the id of the section named key.
+        """
+        return self[key]['id']
+
     def relative_path_to(self, relative_to):
         """
         Returns a relative path from this document to the passed other
@@ -331,6 +357,74 @@ class Generic(Data):
                 raise dexy.exceptions.UserFeedback(msg % self.key)
             self.storage.write_data(self._data)
 
+    def open_data(self, mode="rb"):
+        """
+        Returns an open file object for reading or writing the stored data.
+        """
+        if not "r" in mode:
+            self._data = None
+        return self.storage.open_data(mode)
+
+    def has_html_header(self):
+        """
+        Whether the document contains <html, <body or <head tags. When data
+        is not loaded, the data file is scanned in chunks and the result is
+        saved with the data file's metadata.
+        """
+        if self._data or not os.path.exists(self.storage.data_file()):
+            return Data.has_html_header(self)
+
+        metadata = self.storage.read_metadata() or {}
+        if not 'html-header' in metadata:
+            metadata['html-header'] = self.scan_for_html_header()
+            self.storage.write_metadata(metadata)
+        return metadata['html-header']
+
+    def scan_for_html_header(self):
+        tail = ""
+        for chunk in self.storage.iter_data():
+            text = tail + chunk
+            if html_header_re.search(text):
+                return True
+            tail = text[-5:]
+        return False
+
+    def iterlines(self, chunk_size=65536):
+        """
+        Yields lines of the document's text, split at newlines only and
+        including the newline character. Reads the data file in chunks
+        rather than all at once if data has not already been loaded.
+        """
+        if self._data:
+            for line in Data.iterlines(self):
+                yield line
+            return
+
+        decoder = None
+        pending = u""
+        for chunk in self.storage.iter_data(chunk_size):
+            if decoder is None:
+                encoding = self.wrapper.detect_encoding(chunk)
+                decoder = codecs.getincrementaldecoder(encoding)()
+            pending += decoder.decode(chunk)
+            lines = pending.split(u"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line + u"\n"
+
+        if decoder is not None:
+            pending += decoder.decode("", True)
+        if pending:
+            yield pending
+
+    def write_chunks(self, chunks):
+        """
+        Writes an iterable of text chunks directly to the data file without
+        holding all the data in memory.
+        """
+        self._data = None
+        self.storage.write_chunks(chunks)
+
     def __unicode__(self):
         if isinstance(self.data(), unicode):
             return self.data()
@@ -420,7 +514,10 @@ class SectionValue(object):
         return self.data[key]
 
     def __setitem__(self, key, value):
+        self.data[key] = value
         self.parent.data()[self.parentindex+1][key] = value
+        if key == 'name':
+            self.parent._name_index = None
 
     def splitlines(self):
         return unicode(self).splitlines()
@@ -437,6 +534,9 @@ class Sectioned(Data):
             'storage-type' : 'jsonsectioned'
             }
 
+    _name_index = None
+    _storage_index = None
+
     def setup(self):
         self.setup_storage()
         self._data = [{}]
@@ -448,6 +548,22 @@ class Sectioned(Data):
         except Exception as e:
             msg = "Problem saving '%s': %s" % (self.key, str(e))
             raise dexy.exceptions.InternalDexyProblem(msg)
+        self._storage_index = None
+
+    def is_loaded(self):
+        return self._data and self._data != [{}]
+
+    def storage_index(self):
+        """
+        Returns the stored index of section names and positions if the
+        sections have not been loaded into memory, otherwise None.
+        """
+        if self.is_loaded() or not hasattr(self.storage, 'read_index'):
+            return None
+
+        if self._storage_index is None:
+            self._storage_index = self.storage.read_index()
+        return self._storage_index
 
     def __unicode__(self):
         return u"\n".join(unicode(v) for v in self.values() if unicode(v))
@@ -456,10 +572,14 @@ class Sectioned(Data):
         """
         The number of sections.
         """
-        return len(self.data())-1
+        index = self.storage_index()
+        if index:
+            return len(index['names'])
+        else:
+            return len(self.data())-1
 
     def __setitem__(self, key, value):
-        keyindex = self.keyindex(key)
+        keyindex = self.loaded_keyindex(key)
         if keyindex >= 0:
             # Existing section.
             assert self._data[keyindex+1]['name'] == key
@@ -470,11 +590,15 @@ class Sectioned(Data):
             self._data.append(section_dict)
 
     def __delitem__(self, key):
-        index = self.keyindex(key)
+        index = self.loaded_keyindex(key)
         self.data().pop(index+1)
 
     def keys(self):
-        return [a['name'] for a in self.data()[1:]]
+        index = self.storage_index()
+        if index:
+            return list(index['names'])
+        else:
+            return [a['name'] for a in self.data()[1:]]
 
     def values(self):
         return [SectionValue(a, self, i) for i, a in enumerate(self.data()[1:])]
@@ -486,28 +610,68 @@ class Sectioned(Data):
         with open(filepath, "wb") as f:
             f.write(unicode(self).encode("utf-8"))
 
-    def keyindex(self, key):
+    def loaded_keyindex(self, key):
+        """
+        Returns the position of the first section named key in the loaded
+        sections, or -1.
+        """
         if self._data == [{}]:
             return -1
 
-        try:
-            return self.keys().index(key)
-        except ValueError:
-            return -1
+        data = self.data()
+        if not self._name_index or self._name_index[0] != (id(data), len(data)):
+            positions = {}
+            for i, section in enumerate(data[1:]):
+                positions.setdefault(section['name'], i)
+            self._name_index = ((id(data), len(data)), positions)
+
+        i = self._name_index[1].get(key, -1)
+        if i > -1 and data[i+1]['name'] != key:
+            # Sections were changed in place, rebuild the index.
+            self._name_index = None
+            return self.loaded_keyindex(key)
+        return i
+
+    def keyindex(self, key):
+        index = self.storage_index()
+        if index:
+            return index['positions'].get(key, -1)
+        else:
+            return self.loaded_keyindex(key)
+
+    def section_id(self, key):
+        index = self.storage_index()
+        if index and 'ids' in index and key in index['positions']:
+            return index['ids'][index['positions'][key]]
+        else:
+            return self[key]['id']
 
     def value(self, key):
-        index = self.keyindex(key)
-        if index > -1:
-            return self.values()[index]
+        index = self.storage_index()
+        if index:
+            i = index['positions'].get(key, -1)
+            if i > -1:
+                section = self.storage.read_item(index, i+1)
+                return SectionValue(section, self, i)
+            metadata = self.storage.read_item(index, 0)
         else:
-            try:
-                return self.data()[0][key]
-            except KeyError:
-                msg = "No value for %s available in sections or metadata."
-                msgargs = (key)
-                raise dexy.exceptions.UserFeedback(msg % msgargs)
+            data = self.data()
+            i = self.loaded_keyindex(key)
+            if i > -1:
+                return SectionValue(data[i+1], self, i)
+            metadata = data[0]
+
+        try:
+            return metadata[key]
+        except KeyError:
+            msg = "No value for %s available in sections or metadata."
+            msgargs = (key)
+            raise dexy.exceptions.UserFeedback(msg % msgargs)
 
     def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return self.value(key)
+
         try:
             return self.data()[key+1]
         except TypeError:
@@ -565,6 +729,12 @@ class KeyValue(Data):
     def append(self, key, value):
         self.storage.append(key, value)
 
+    def append_many(self, items):
+        """
+        Appends an iterable of (key, value) pairs in a single batch.
+        """
+        self.storage.append_many(items)
+
     def query(self, query):
         return self.storage.query(query)
 
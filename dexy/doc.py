@@ -1,6 +1,8 @@
+from dexy.utils import md5_hash
 import dexy.exceptions
 import dexy.filter
 import dexy.node
+import json
 import os
 import shutil
 import stat
@@ -160,14 +162,10 @@ class Doc(dexy.node.Node):
         if self.state == 'cached':
             self.setup_datas()
 
-            # move cache files to new cache
-            for d in self.datas():
-                if os.path.exists(d.storage.last_data_file()):
-                    shutil.move(d.storage.last_data_file(), d.storage.this_data_file())
-                    self.log_debug("Moving %s from %s to %s" % (d.key, d.storage.last_data_file(), d.storage.this_data_file()))
-
-            if os.path.exists(self.runtime_info_filename(False)):
-                shutil.move(self.runtime_info_filename(False), self.runtime_info_filename(True))
+            # move cache files to new cache, unless the whole last/ cache
+            # has already been renamed to this/
+            if os.path.exists(self.wrapper.last_cache_dir()):
+                self.move_cache_files()
 
             self.apply_runtime_info()
 
@@ -176,6 +174,19 @@ class Doc(dexy.node.Node):
                     d.storage.connect()
             self.transition('consolidated')
 
+    def move_cache_files(self):
+        for d in self.datas():
+            if os.path.exists(d.storage.last_data_file()):
+                shutil.move(d.storage.last_data_file(), d.storage.this_data_file())
+                self.log_debug("Moving %s from %s to %s" % (d.key, d.storage.last_data_file(), d.storage.this_data_file()))
+
+            for last_file, this_file in zip(d.storage.index_files(False), d.storage.index_files(True)):
+                if os.path.exists(last_file):
+                    shutil.move(last_file, this_file)
+
+        if os.path.exists(self.runtime_info_filename(False)):
+            shutil.move(self.runtime_info_filename(False), self.runtime_info_filename(True))
+
     def apply_runtime_info(self):
             runtime_info = self.load_runtime_info()
             if runtime_info:
@@ -215,17 +226,29 @@ class Doc(dexy.node.Node):
                 for d in self.datas())
 
     def check_doc_changed(self):
-        if self.name in self.wrapper.filemap:
-            live_stat = self.wrapper.filemap[self.name]['stat']
+        self.initial_data.setup()
+
+        in_this_cache = os.path.exists(self.initial_data.storage.this_data_file())
+        in_last_cache = os.path.exists(self.initial_data.storage.last_data_file())
 
-            self.initial_data.setup()
+        saved_digest = self.wrapper.hash_index.source_digest(self.hashid)
 
-            in_this_cache = os.path.exists(self.initial_data.storage.this_data_file())
-            in_last_cache = os.path.exists(self.initial_data.storage.last_data_file())
+        if saved_digest and (in_this_cache or in_last_cache):
+            # compare digest of current contents to digest of contents when
+            # document was last run
+            live_digest = self.source_digest()
+            msg = "    saved digest %s live digest %s changed %s"
+            msgargs = (saved_digest, live_digest, live_digest != saved_digest)
+            self.log_debug(msg % msgargs)
+            return live_digest != saved_digest
+
+        elif self.name in self.wrapper.filemap:
+            live_stat = self.wrapper.filemap[self.name]['stat']
 
             if in_this_cache or in_last_cache:
-                # we have a file in the cache from a previous run, compare its
-                # mtime to filemap to determine whether it has changed
+                # we have a file in the cache from a previous run but no saved
+                # digest, compare its mtime to filemap to determine whether it
+                # has changed
                 if in_this_cache:
                     cache_stat = os.stat(self.initial_data.storage.this_data_file())
                 else:
@@ -241,9 +264,70 @@ class Doc(dexy.node.Node):
                 # there is no file in the cache, therefore it has 'changed'
                 return True
         else:
-            # TODO check hash of contents of virtual files
             return False
 
+    def source_digest(self):
+        """
+        Returns a digest of the document's original contents.
+        """
+        if self.name in self.wrapper.filemap:
+            fileinfo = self.wrapper.filemap[self.name]
+            return self.wrapper.hash_index.file_digest(fileinfo['ospath'], fileinfo['stat'])
+        else:
+            contents = self.get_contents()
+            if isinstance(contents, unicode):
+                contents = contents.encode("utf-8")
+            elif not isinstance(contents, str):
+                contents = json.dumps(contents, sort_keys=True)
+            return md5_hash(contents)
+
+    def artifact_key_info(self):
+        input_nodes = [node for node in self.input_nodes(True)
+                if not node in self.additional_docs]
+        return [
+                self.key_with_class(),
+                self.sorted_arg_string(),
+                self.source_digest(),
+                [f.artifact_key_info() for f in self.filters],
+                [node.artifact_key() for node in input_nodes]
+                ]
+
+    def cache_file_relpaths(self):
+        """
+        Returns paths, relative to the cache dir, of all files which need to
+        be present for this document (and its additional docs) to be cached,
+        along with any index files stored next to its data files.
+        """
+        cache_dir = self.wrapper.this_cache_dir()
+        filepaths = []
+        for d in self.datas():
+            filepaths.append(d.storage.this_data_file())
+            filepaths.extend(f for f in d.storage.index_files(True) if os.path.exists(f))
+        filepaths.append(self.runtime_info_filename())
+        relpaths = [os.path.relpath(f, cache_dir) for f in filepaths]
+
+        for doc in self.additional_docs:
+            relpaths.extend(doc.cache_file_relpaths())
+
+        return relpaths
+
+    def restore_from_artifact_store(self):
+        self.setup_datas()
+        restored = self.wrapper.artifact_store.restore(
+                self.hashid,
+                self.artifact_key(),
+                self.wrapper.last_cache_dir())
+        if restored:
+            self.wrapper.hash_index.set_source_digest(self.hashid, self.source_digest())
+        return restored
+
+    def add_to_artifact_store(self):
+        self.wrapper.artifact_store.add(
+                self.hashid,
+                self.artifact_key(),
+                self.wrapper.this_cache_dir(),
+                self.cache_file_relpaths())
+
     def data_class_alias(self):
         data_class_alias = self.setting('data-type')
 
@@ -323,6 +407,8 @@ class Doc(dexy.node.Node):
             else:
                 self.initial_data.set_data(self.get_contents())
 
+        self.wrapper.hash_index.set_source_digest(self.hashid, self.source_digest())
+
         for f in self.filters:
             f.start_time = time.time()
             if f.output_data.state == 'new':
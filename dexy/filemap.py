@@ -0,0 +1,235 @@
+from bisect import bisect_left
+from dexy.utils import mtime_is_racy
+import fnmatch
+import os
+import posixpath
+import re
+import time
+
+class FileInfo(dict):
+    """
+    Entry in the wrapper's filemap. The 'stat' key is only calculated when
+    first requested, since most files in a project are never processed.
+    """
+    def __missing__(self, key):
+        if key == 'stat':
+            self['stat'] = os.stat(self['ospath'])
+            return self['stat']
+        raise KeyError(key)
+
+class DirectorySnapshot(object):
+    """
+    Persistent record of the contents of each project directory.
+
+    A directory is only listed again if its mtime or inode has changed since
+    the snapshot was saved, otherwise the saved listing is used.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.dirs = None
+        self.visited = {}
+        self.changed = False
+
+    def snapshot_filename(self):
+        return os.path.join(self.wrapper.artifacts_dir, "dirsnapshot.pickle")
+
+    def load(self):
+        try:
+            with open(self.snapshot_filename(), 'rb') as f:
+                pickle = self.wrapper.pickle_lib()
+                self.dirs = pickle.load(f)
+        except (IOError, EOFError):
+            self.dirs = {}
+
+    def save(self):
+        """
+        Saves listings for the directories visited in this walk, if any
+        directory was listed again or is no longer present. Directories whose
+        mtime is too recent to trust are left out, so they are listed again.
+        """
+        if not self.changed and len(self.visited) == len(self.dirs):
+            return
+
+        if not os.path.exists(self.wrapper.artifacts_dir):
+            return
+
+        now = time.time()
+        dirs = dict((dirpath, entry) for dirpath, entry in self.visited.iteritems()
+                if not mtime_is_racy(entry[0][0], now))
+
+        with open(self.snapshot_filename(), 'wb') as f:
+            pickle = self.wrapper.pickle_lib()
+            pickle.dump(dirs, f)
+
+    def listdir(self, dirpath):
+        """
+        Returns lists of subdirectory names and file names in dirpath.
+        """
+        try:
+            stat = os.stat(dirpath)
+        except OSError:
+            return [], []
+
+        signature = (stat.st_mtime, stat.st_ino)
+        entry = self.dirs.get(dirpath)
+
+        if not entry or entry[0] != signature:
+            dirnames = []
+            filenames = []
+            for name in os.listdir(dirpath):
+                if os.path.isdir(os.path.join(dirpath, name)):
+                    dirnames.append(name)
+                else:
+                    filenames.append(name)
+            entry = (signature, dirnames, filenames)
+            self.changed = True
+
+        self.visited[dirpath] = entry
+        return list(entry[1]), list(entry[2])
+
+    def walk(self, top):
+        """
+        Works like os.walk(top, followlinks=True), callers may prune the
+        dirnames list to avoid descending into directories.
+        """
+        dirnames, filenames = self.listdir(top)
+        yield top, dirnames, filenames
+        for dirname in dirnames:
+            for entry in self.walk(os.path.join(top, dirname)):
+                yield entry
+
+def file_ext(filepath):
+    """
+    Returns the extension of the final path component, including a leading
+    dot, or an empty string.
+    """
+    basename = posixpath.basename(filepath)
+    if "." in basename:
+        return ".%s" % basename.rsplit(".", 1)[1]
+    else:
+        return ""
+
+WILDCARDS = "*?["
+
+def literal_head_and_tail(pattern):
+    """
+    Returns the literal text before the first wildcard in a glob pattern and
+    after the last one. Returns (pattern, pattern) if there are no wildcards.
+    """
+    wildcard_positions = [pattern.find(c) for c in WILDCARDS if c in pattern]
+    if not wildcard_positions:
+        return pattern, pattern
+
+    head = pattern[0:min(wildcard_positions)]
+    tail = pattern[max(pattern.rfind(c) for c in WILDCARDS)+1:]
+    return head, tail
+
+def required_ext(tail):
+    """
+    Returns the extension which any path ending in the literal tail of a
+    pattern must have, or None if the tail does not determine one.
+    """
+    if "." in tail and not "/" in tail.rsplit(".", 1)[1] and not "]" in tail:
+        return file_ext(tail)
+
+def dir_prefixes(filepath):
+    """
+    Yields '' and then each parent directory of filepath with a trailing
+    slash, e.g. '', 'a/', 'a/b/' for 'a/b/c.txt'.
+    """
+    yield ""
+    i = filepath.find("/")
+    while i > -1:
+        yield filepath[0:i+1]
+        i = filepath.find("/", i+1)
+
+class PatternMatcher(object):
+    """
+    Matches a set of glob patterns against a list of paths in a single pass.
+
+    Patterns are stored by the directory part of their literal prefix and
+    then by the extension their literal suffix requires, so each path is
+    only tested against the patterns which could possibly match it.
+    """
+    def __init__(self, patterns):
+        self.patterns = set(patterns)
+        self.tree = {}
+        for pattern in self.patterns:
+            head, tail = literal_head_and_tail(pattern)
+            dirprefix = head[0:head.rfind("/")+1]
+            matcher = re.compile(fnmatch.translate(pattern)).match
+            buckets = self.tree.setdefault(dirprefix, {})
+            buckets.setdefault(required_ext(tail), []).append((pattern, matcher))
+
+    def match(self, paths):
+        """
+        Returns a dict mapping each pattern to the list of paths it matches,
+        in the order they appear in paths.
+        """
+        matches = dict((pattern, []) for pattern in self.patterns)
+        for filepath in paths:
+            ext = file_ext(filepath)
+            for dirprefix in dir_prefixes(filepath):
+                buckets = self.tree.get(dirprefix)
+                if not buckets:
+                    continue
+                for bucket in (buckets.get(ext), buckets.get(None)):
+                    if bucket:
+                        for pattern, matcher in bucket:
+                            if matcher(filepath):
+                                matches[pattern].append(filepath)
+        return matches
+
+class FileIndex(object):
+    """
+    Index of filemap keys by extension and by path prefix, used to narrow
+    down the files which need to be tested against a glob pattern.
+    """
+    def __init__(self, filemap):
+        self.filemap = filemap
+        self.paths = sorted(filemap)
+        self.matches = {}
+        self.by_ext = {}
+        for filepath in self.paths:
+            self.by_ext.setdefault(file_ext(filepath), []).append(filepath)
+
+    def candidates(self, pattern):
+        """
+        Returns a sorted list of paths which might match the glob pattern.
+        """
+        head, tail = literal_head_and_tail(pattern)
+        if head == pattern:
+            if pattern in self.filemap:
+                return [pattern]
+            else:
+                return []
+
+        ext = required_ext(tail)
+        if ext is not None:
+            paths = self.by_ext.get(ext, [])
+            return [p for p in paths if p.startswith(head)]
+        elif head:
+            start = bisect_left(self.paths, head)
+            end = start
+            while end < len(self.paths) and self.paths[end].startswith(head):
+                end += 1
+            return self.paths[start:end]
+        else:
+            return self.paths
+
+    def match_patterns(self, patterns):
+        """
+        Calculates matches for all the patterns in one pass over the index,
+        to be returned by later calls to `matching`.
+        """
+        new_patterns = [p for p in patterns if not p in self.matches]
+        if new_patterns:
+            self.matches.update(PatternMatcher(new_patterns).match(self.paths))
+
+    def matching(self, pattern):
+        """
+        Returns a sorted list of paths in the filemap matching the glob pattern.
+        """
+        if pattern in self.matches:
+            return self.matches[pattern]
+        return [p for p in self.candidates(pattern) if fnmatch.fnmatch(p, pattern)]
@@ -1,5 +1,7 @@
 from dexy.utils import copy_or_link
 from dexy.utils import os_to_posix
+from dexy.version import DEXY_VERSION
+from dexy.workspace import symlinked_dir
 from operator import attrgetter
 import dexy.doc
 import dexy.exceptions
@@ -82,6 +84,14 @@ class Filter(dexy.plugin.Plugin):
             'preserve-prior-data-class' : (
                 "Whether output data class should be set to match the input data class.",
                 False),
+            'symlink-input-dirs' : (
+                """Whether to populate the workspace by symlinking input
+                directories outside the working dir to a shared tree of
+                inputs, rather than linking every input file. Only use this
+                if the filter does not write into those directories: writes
+                change the shared tree, new files there are not found by
+                add-new-files, and '..' inside them resolves to the tree.""",
+                False),
             'require-output' : (
                 "Should dexy raise an exception if no output is produced by this filter?",
                 True),
@@ -251,6 +261,13 @@ class Filter(dexy.plugin.Plugin):
                     msg = "no file extension found but checked already for disjointed, should not be here"
                     raise dexy.exceptions.InternalDexyProblem(msg)
 
+    def artifact_key_info(self):
+        """
+        Returns information about this filter to include in the artifact key
+        of documents which use it.
+        """
+        return [self.alias, self.__class__.__name__, DEXY_VERSION]
+
     def templates(self):
         """
         List of dexy templates which refer to this filter.
@@ -462,8 +479,12 @@ class Filter(dexy.plugin.Plugin):
                 self.log_debug("Including %s because not excluded" % inpt)
                 return True
 
-    def makedirs(self):
-        mkdirs = self.setting('mkdirs')
+    def setting_mkdirs(self):
+        """
+        Returns list of directories to be created in the workspace, combining
+        the 'mkdirs' and 'mkdir' settings.
+        """
+        mkdirs = list(self.setting('mkdirs'))
 
         # mkdir should be a string, but handle either string or list
         mkdir = self.setting('mkdir')
@@ -473,7 +494,10 @@ class Filter(dexy.plugin.Plugin):
             else:
                 mkdirs.extend(mkdir)
 
-        for d in mkdirs:
+        return [os_to_posix(d).strip("/") for d in mkdirs]
+
+    def makedirs(self):
+        for d in self.setting_mkdirs():
             dirpath = os.path.join(self.workspace(), d)
             self.log_debug("Creating directory %s" % dirpath)
             os.makedirs(dirpath)
@@ -501,16 +525,46 @@ class Filter(dexy.plugin.Plugin):
 
         self.makedirs()
 
-        self.log_debug("input docs %s" % list(self.doc.walk_input_docs()))
+        datas = []
         for inpt in self.doc.walk_input_docs():
-            if not self.include_input_in_workspace(inpt):
+            if self.include_input_in_workspace(inpt):
+                datas.append(inpt.output_data())
+            else:
                 self.log_debug("not populating workspace with input '%s'" % inpt.key)
-                continue
+        self.log_debug("input datas %s" % datas)
 
-            data = inpt.output_data()
+        tree_dir = None
+        protected_dirs = [self.output_data.parent_dir()] + self.setting_mkdirs()
+        if self.setting('symlink-input-dirs') and not dexy.utils.is_windows:
+            if any(symlinked_dir(data.name, protected_dirs) for data in datas):
+                try:
+                    tree_dir = self.doc.wrapper.input_trees.tree(datas)
+                except OSError as e:
+                    self.log_debug("not using input tree: %s" % e)
 
+        symlinked_dirs = set()
+        for data in datas:
             filepath = data.name
 
+            if tree_dir:
+                dirpath = symlinked_dir(filepath, protected_dirs)
+                if dirpath:
+                    if not dirpath in symlinked_dirs:
+                        parent_dir = os.path.join(self.workspace(), os.path.dirname(dirpath))
+                        if not parent_dir in already_created_dirs:
+                            try:
+                                os.makedirs(parent_dir)
+                            except OSError:
+                                pass
+                            already_created_dirs.add(parent_dir)
+
+                        link_source = os.path.abspath(os.path.join(tree_dir, dirpath))
+                        os.symlink(link_source, os.path.join(self.workspace(), dirpath))
+                        symlinked_dirs.add(dirpath)
+
+                    self._files_workspace_populated_with.add(filepath)
+                    continue
+
             # Ensure parent dir exists.
             parent_dir = os.path.join(self.workspace(), os.path.dirname(filepath))
             if not parent_dir in already_created_dirs:
@@ -521,7 +575,7 @@ class Filter(dexy.plugin.Plugin):
                     pass
 
             # Save contents of file to workspace
-            self.log_debug("populating workspace with %s for %s" % (filepath, inpt.key))
+            self.log_debug("populating workspace with %s for %s" % (filepath, data.key))
             file_dest = os.path.join(self.workspace(), filepath)
 
             try:
@@ -575,7 +629,10 @@ class DexyFilter(Filter):
     aliases = ['dexy']
 
     def process(self):
-        if hasattr(self, "process_text"):
+        if hasattr(self, "process_lines"):
+            lines = self.input_data.iterlines()
+            self.output_data.write_chunks(self.process_lines(lines))
+        elif hasattr(self, "process_text"):
             output = self.process_text(unicode(self.input_data))
             self.output_data.set_data(output)
         else:
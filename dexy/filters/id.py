@@ -1,6 +1,5 @@
 from dexy.exceptions import UserFeedback, InternalDexyProblem
 from dexy.filters.pyg import PygmentsFilter
-from pygments import highlight
 import ply.lex as lex
 import ply.yacc as yacc
 
@@ -76,6 +75,7 @@ class Id(PygmentsFilter):
         start_new_section(_lexer, 0, 0, _lexer.level)
 
         parser.parse(input_text + "\n", lexer=_lexer)
+        join_section_contents(_lexer)
         strip_trailing_newline(_lexer)
         parser_output = _lexer.sections
 
@@ -92,9 +92,10 @@ class Id(PygmentsFilter):
             else:
                 do_highlight = True
 
+        highlight_cache = self.doc.wrapper.highlight_cache
         for section in parser_output:
             if do_highlight:
-                section['contents'] = highlight(section['contents'], pyg_lexer, pyg_formatter)
+                section['contents'] = highlight_cache.highlight(section['contents'], pyg_lexer, pyg_formatter)
             self.output_data._data.append(section)
         self.output_data.save()
 
@@ -114,13 +115,13 @@ def append_text(lexer, code):
     """
     Append to the currently active section.
     """
-    set_current_section_contents(lexer, current_section_contents(lexer) + code)
+    lexer.sections[-1]['contents'].append(code)
 
 def current_section_exists(lexer):
     return len(lexer.sections) > 0
 
 def current_section_empty(lexer):
-    return len(current_section_contents(lexer)) == 0
+    return not any(current_section_contents(lexer))
 
 def current_section_contents(lexer):
     return lexer.sections[-1]['contents']
@@ -131,6 +132,13 @@ def set_current_section_contents(lexer, text):
 def strip_trailing_newline(lexer):
     set_current_section_contents(lexer, current_section_contents(lexer).rsplit("\n",1)[0])
 
+def join_section_contents(lexer):
+    """
+    Section contents are accumulated in lists while parsing, join them.
+    """
+    for section in lexer.sections:
+        section['contents'] = u''.join(section['contents'])
+
 def start_new_section(lexer, position, lineno, new_level, name=None):
     if name:
         if lexer.remove_leading:
@@ -150,7 +158,7 @@ def start_new_section(lexer, position, lineno, new_level, name=None):
             'name' : name.rstrip(),
             'position' : position,
             'lineno' : lineno,
-            'contents' : u'',
+            'contents' : [],
             'level' : lexer.level
             })
 
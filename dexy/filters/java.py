@@ -10,6 +10,7 @@ class Scala(SubprocessCompileFilter):
     """
     aliases = ['scala']
     _settings = {
+            'cache-compiled' : False,
             'executable' : 'scalac',
             'tags' : ['code', 'scala', 'compiled', 'jvm'],
             'compiler-command-string' : "%(prog)s %(compiler_args)s %(script_file)s",
@@ -96,6 +97,7 @@ class JavaFilter(SubprocessCompileFilter):
     """
     aliases = ['java']
     _settings = {
+            'cache-compiled' : False,
             'check-return-code' : True,
             'classpath' : ("Custom entries in classpath.", []),
             'tags' : ['code', 'java', 'jvm', 'compiled'],
@@ -2,8 +2,10 @@ from dexy.exceptions import InternalDexyProblem
 from dexy.exceptions import UserFeedback
 from dexy.exceptions import InactivePlugin
 from dexy.filters.process import SubprocessFilter
-import re
+import atexit
 import os
+import re
+import threading
 
 try:
     import pexpect
@@ -14,6 +16,51 @@ except ImportError:
 class DexyEOFException(UserFeedback):
     pass
 
+class ReplSessionPool(object):
+    """
+    Idle REPL processes which can be reused by later documents, keyed by
+    executable and environment.
+    """
+    # Maximum number of idle processes to keep for each key.
+    max_idle = 4
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def checkout(self, key):
+        """
+        Returns a live (proc, initial_transcript) tuple for key, or None.
+        """
+        with self.lock:
+            sessions = self.sessions.get(key, [])
+            while sessions:
+                proc, start = sessions.pop()
+                if proc.isalive():
+                    return proc, start
+                proc.close()
+
+    def checkin(self, key, proc, start):
+        with self.lock:
+            sessions = self.sessions.setdefault(key, [])
+            if len(sessions) < self.max_idle:
+                sessions.append((proc, start))
+                return
+        proc.close()
+
+    def close_all(self):
+        with self.lock:
+            for sessions in self.sessions.values():
+                for proc, start in sessions:
+                    try:
+                        proc.close()
+                    except Exception:
+                        pass
+            self.sessions = {}
+
+session_pool = ReplSessionPool()
+atexit.register(session_pool.close_all)
+
 class PexpectReplFilter(SubprocessFilter):
     """
     Use pexpect to retrieve output line-by-line based on detecting prompts.
@@ -35,8 +82,19 @@ class PexpectReplFilter(SubprocessFilter):
             'strip-regex' : ("Regex to strip", None),
             'data-type' : 'sectioned',
             'allow-match-prompt-without-newline' : ("Whether to require a newline before prompt.", False),
+            'batch-send' : ("""Whether to send lines to the REPL in batches rather than
+                waiting for the prompt after each one. Only suitable for REPLs
+                which echo input as they read it, e.g. those using readline.""", False),
+            'reuse-session' : ("""Whether to keep the REPL process running for use by later
+                documents. Requires reset-command.""", False),
+            'reset-command' : ("""Command to send to a reused REPL to clear state left by the
+                previous document and change to the working dir %(wd)s.""", None),
             }
 
+    # Maximum number of bytes to send at once in batch-send mode, kept small
+    # so the pty input buffer can't fill while output is not being read.
+    batch_send_size = 1024
+
     def is_active(klass):
         return AVAILABLE
 
@@ -124,7 +182,6 @@ class PexpectReplFilter(SubprocessFilter):
         env['TERM'] = self.setting('term')
 
         timeout = self.setup_timeout()
-        initial_timeout = self.setup_initial_timeout()
 
         self.log_debug("timeout set to '%s'" % timeout)
 
@@ -133,6 +190,132 @@ class PexpectReplFilter(SubprocessFilter):
         else:
             wd = os.getcwd()
 
+        reuse_session = self.setting('reuse-session') and self.setting('reset-command')
+        session_key = (self.setting('executable'), tuple(sorted(env.items())))
+
+        session = None
+        if reuse_session:
+            session = session_pool.checkout(session_key)
+
+        if session:
+            proc, initial_transcript = session
+            self.log_debug("reusing process %s" % proc.pid)
+            self.reset_session(proc, wd, search_terms, timeout)
+        else:
+            proc, initial_transcript = self.spawn(env, wd, search_terms)
+
+        start = initial_transcript
+
+        for section_key, section_text in input_sections:
+            section_transcript = start
+            start = ""
+
+            lines = self.lines_for_section(section_text)
+            for batch in self.send_batches(lines):
+                batch_text = "".join(l.rstrip() + self.setting('send-line-ending') for l in batch)
+                self.log_debug(u"Sending '%s'" % batch_text)
+                proc.send(batch_text)
+
+                for l in batch:
+                    section_transcript += start
+                    before, start = self.expect_prompt(proc, search_terms, timeout)
+                    section_transcript += self.strip_newlines(before)
+
+            if self.setting('strip-regex'):
+                section_transcript = re.sub(self.setting('strip-regex'), "", section_transcript)
+
+            yield section_key, section_transcript
+
+        if self.setting('add-new-files'):
+            self.add_new_files()
+
+        if reuse_session:
+            session_pool.checkin(session_key, proc, initial_transcript)
+            return
+
+        try:
+            proc.close()
+        except pexpect.ExceptionPexpect:
+            msg = "process %s may not have closed for %s"
+            msgargs = (proc.pid, self.key)
+            raise UserFeedback(msg % msgargs)
+
+        if proc.exitstatus and self.setting('check-return-code'):
+            self.handle_subprocess_proc_return(self.setting('executable'), proc.exitstatus, section_transcript)
+
+    def send_batches(self, lines):
+        """
+        Yields lists of lines to be sent together. Each line is sent on its
+        own unless batch-send is enabled.
+        """
+        if not self.setting('batch-send'):
+            for l in lines:
+                yield [l]
+            return
+
+        batch = []
+        batch_size = 0
+        for l in lines:
+            if batch and batch_size + len(l) > self.batch_send_size:
+                yield batch
+                batch = []
+                batch_size = 0
+            batch.append(l)
+            batch_size += len(l) + 1
+        if batch:
+            yield batch
+
+    def expect_prompt(self, proc, search_terms, timeout):
+        """
+        Waits for the next prompt, returns the text received before the prompt
+        and the prompt itself.
+        """
+        try:
+            if self.setting('prompt-regex'):
+                proc.expect(search_terms, timeout=timeout)
+            else:
+                proc.expect_exact(search_terms, timeout=timeout)
+
+            self.log_debug(u"Received '%s'" % unicode(proc.before, errors='replace'))
+            return proc.before, proc.after
+
+        except pexpect.EOF:
+            self.log_debug("EOF occurred!")
+            raise DexyEOFException()
+        except pexpect.TIMEOUT as e:
+            for c in proc.before:
+                print ord(c), ":", c
+            msg = "pexpect timeout error. failed at matching prompt within %s seconds. " % timeout
+            msg += "received '%s', tried to match with '%s'" % (proc.before, search_terms)
+            msg += "something may have gone wrong, or you may need to set a longer timeout"
+            self.log_warn(msg)
+            raise UserFeedback(msg)
+        except pexpect.ExceptionPexpect as e:
+            raise UserFeedback(unicode(e))
+
+    def reset_command(self, wd):
+        args = {
+                'wd' : os.path.abspath(wd),
+                'work_cache_dir' : os.path.abspath(self.doc.wrapper.work_cache_dir())
+                }
+        return self.setting('reset-command') % args
+
+    def reset_session(self, proc, wd, search_terms, timeout):
+        """
+        Sends the reset command to a reused REPL and discards its output.
+        """
+        command = self.reset_command(wd)
+        self.log_debug(u"Sending reset command '%s'" % command)
+        proc.send(command + self.setting('send-line-ending'))
+        self.expect_prompt(proc, search_terms, timeout)
+
+    def spawn(self, env, wd, search_terms):
+        """
+        Starts the REPL and waits for the initial prompt. Returns the process
+        and the text received up to and including the prompt.
+        """
+        initial_timeout = self.setup_initial_timeout()
+
         executable = self.setting('executable')
         self.log_debug("about to spawn new process '%s' in '%s'" % (executable, wd))
 
@@ -177,58 +360,7 @@ class PexpectReplFilter(SubprocessFilter):
         self.log_debug(u"Initial prompt captured!")
         self.log_debug(unicode(start))
 
-        for section_key, section_text in input_sections:
-            section_transcript = start
-            start = ""
-
-            lines = self.lines_for_section(section_text)
-            for l in lines:
-                self.log_debug(u"Sending '%s'" % l)
-                section_transcript += start
-                proc.send(l.rstrip() + self.setting('send-line-ending'))
-                try:
-                    if self.setting('prompt-regex'):
-                        proc.expect(search_terms, timeout=timeout)
-                    else:
-                        proc.expect_exact(search_terms, timeout=timeout)
-
-                    self.log_debug(u"Received '%s'" % unicode(proc.before, errors='replace'))
-
-                    section_transcript += self.strip_newlines(proc.before)
-                    start = proc.after
-                except pexpect.EOF:
-                    self.log_debug("EOF occurred!")
-                    raise DexyEOFException()
-                except pexpect.TIMEOUT as e:
-                    for c in proc.before:
-                        print ord(c), ":", c
-                    msg = "pexpect timeout error. failed at matching prompt within %s seconds. " % timeout
-                    msg += "received '%s', tried to match with '%s'" % (proc.before, search_terms)
-                    msg += "something may have gone wrong, or you may need to set a longer timeout"
-                    self.log_warn(msg)
-                    raise UserFeedback(msg)
-                except pexpect.ExceptionPexpect as e:
-                    raise UserFeedback(unicode(e))
-                except pexpect.EOF as e:
-                    raise UserFeedback(unicode(e))
-
-            if self.setting('strip-regex'):
-                section_transcript = re.sub(self.setting('strip-regex'), "", section_transcript)
-
-            yield section_key, section_transcript
-
-        if self.setting('add-new-files'):
-            self.add_new_files()
-
-        try:
-            proc.close()
-        except pexpect.ExceptionPexpect:
-            msg = "process %s may not have closed for %s"
-            msgargs = (proc.pid, self.key)
-            raise UserFeedback(msg % msgargs)
-
-        if proc.exitstatus and self.setting('check-return-code'):
-            self.handle_subprocess_proc_return(self.setting('executable'), proc.exitstatus, section_transcript)
+        return proc, start
 
     def process(self):
         self.log_debug("about to populate_workspace")
@@ -310,6 +442,17 @@ class PythonConsole(PexpectReplFilter):
             'input-extensions' : [".txt", ".py"],
             'output-extensions' : ['.pycon'],
             'version-command' : 'python --version',
+            'reset-command' : """def dexy__reset(g):
+    import os, sys
+    os.chdir(%(wd)r)
+    for k, m in list(sys.modules.items()):
+        f = getattr(m, '__file__', None)
+        if f and os.path.abspath(f).startswith(%(work_cache_dir)r):
+            del sys.modules[k]
+    for k in list(g):
+        if not k.startswith('__'):
+            del g[k]
+dexy__reset(globals())""",
             'save-vars-to-json-cmd' : """import json
 with open("%s-vars.json", "w") as dexy__vars_file:
     dexy__x = {}
@@ -320,3 +463,8 @@ with open("%s-vars.json", "w") as dexy__vars_file:
             pass
     json.dump(dexy__x, dexy__vars_file)"""}
 
+    def reset_command(self, wd):
+        """
+        Wraps the reset code in exec so it can be sent as a single line.
+        """
+        return "exec(%r)" % PexpectReplFilter.reset_command(self, wd)
@@ -1,10 +1,15 @@
 from dexy.filter import Filter
 from dexy.utils import file_exists
+from dexy.utils import md5_file
 import dexy.exceptions
+import dexy.versions
 import fnmatch
 import os
 import platform
+import Queue
 import subprocess
+import sys
+import threading
 
 class SubprocessFilter(Filter):
     """
@@ -20,6 +25,7 @@ class SubprocessFilter(Filter):
             'env' : ("Dictionary of key-value pairs to be added to environment for runs.", {}),
             'executable' : ('The executable to be run', None),
             'initial-timeout' : ('', 10),
+            'jobs' : ("Number of sections or inputs to run at the same time, for filters which run a process for each.", 1),
             'path-extensions' : ("strings to extend path with", []),
             'record-vars' : ("Whether to add code that will automatically record values of variables.", False),
             'scriptargs' : ("Arguments to be passed to the executable.", ''),
@@ -40,18 +46,10 @@ class SubprocessFilter(Filter):
     def version(klass):
         command = klass.version_command()
         if command:
-            proc = subprocess.Popen(
-                       command,
-                       shell=True,
-                       stdout=subprocess.PIPE,
-                       stderr=subprocess.STDOUT
-                   )
-
-            stdout, stderr = proc.communicate()
-            if proc.returncode > 0:
-                return False
-            else:
-                return stdout.strip().split("\n")[0]
+            return dexy.versions.probes.version(command)
+
+    def artifact_key_info(self):
+        return Filter.artifact_key_info(self) + [self.version()]
 
     def process(self):
         command = self.command_string()
@@ -216,7 +214,12 @@ class SubprocessFilter(Filter):
         if new_files_added > 10:
             self.log_warn("%s additional files added" % (new_files_added))
 
-    def run_command(self, command, env, input_text=None):
+    def run_command(self, command, env, input_text=None, stdout_file=None):
+        """
+        Runs command, returning the process and its output. If stdout_file
+        is given, output is written to that file instead and None is
+        returned in place of the output.
+        """
         if self.setting('use-wd'):
             ws = self.workspace()
             if os.path.exists(ws):
@@ -224,7 +227,10 @@ class SubprocessFilter(Filter):
             else:
                 self.populate_workspace()
 
-        stdout = subprocess.PIPE
+        if stdout_file:
+            stdout = stdout_file
+        else:
+            stdout = subprocess.PIPE
 
         if input_text:
             stdin = subprocess.PIPE
@@ -253,7 +259,8 @@ class SubprocessFilter(Filter):
             self.log_debug("about to send input_text '%s'" % input_text)
 
         stdout, stderr = proc.communicate(input_text)
-        self.log_debug(u"stdout is '%s'" % stdout.decode('utf-8'))
+        if stdout is not None:
+            self.log_debug(u"stdout is '%s'" % stdout.decode('utf-8'))
 
         if stderr:
             self.log_debug(u"stderr is '%s'" % stderr.decode('utf-8'))
@@ -261,6 +268,53 @@ class SubprocessFilter(Filter):
 
         return (proc, stdout)
 
+    def run_command_for_inputs(self, command, inputs):
+        """
+        Runs command once for each (name, input_text) pair in inputs, with up
+        to 'jobs' processes running at a time. Returns a list of (name, proc,
+        stdout) tuples in the same order as inputs.
+        """
+        inputs = list(inputs)
+        env = self.setup_env()
+        jobs = min(int(self.setting('jobs')), len(inputs))
+
+        if jobs <= 1:
+            return [(name,) + self.run_command(command, env, input_text)
+                    for name, input_text in inputs]
+
+        if self.setting('use-wd') and not os.path.exists(self.workspace()):
+            self.populate_workspace()
+
+        results = [None] * len(inputs)
+        errors = []
+        pending = Queue.Queue()
+        for i in range(len(inputs)):
+            pending.put(i)
+
+        def worker():
+            while not errors:
+                try:
+                    i = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                name, input_text = inputs[i]
+                try:
+                    results[i] = (name,) + self.run_command(command, env, input_text)
+                except Exception:
+                    errors.append(sys.exc_info())
+
+        workers = [threading.Thread(target=worker) for _ in range(jobs)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        if errors:
+            e, v, tb = errors[0]
+            raise e, v, tb
+
+        return results
+
     def copy_canonical_file(self):
         canonical_file = os.path.join(self.workspace(), self.output_data.name)
         if not self.output_data.is_cached() and file_exists(canonical_file):
@@ -283,9 +337,21 @@ class SubprocessStdoutFilter(SubprocessFilter):
 
     def process(self):
         command = self.command_string()
-        proc, stdout = self.run_command(command, self.setup_env())
-        self.handle_subprocess_proc_return(command, proc.returncode, stdout)
-        self.output_data.set_data(stdout)
+
+        if hasattr(self.output_data, 'open_data'):
+            # Write stdout straight to the output file.
+            with self.output_data.open_data("wb") as f:
+                proc, stdout = self.run_command(command, self.setup_env(), stdout_file=f)
+
+            if proc.returncode != 0:
+                stdout = self.output_data.storage.read_data()
+                self.output_data.clear_cache()
+                self.handle_subprocess_proc_return(command, proc.returncode, stdout)
+                self.output_data.set_data(stdout)
+        else:
+            proc, stdout = self.run_command(command, self.setup_env())
+            self.handle_subprocess_proc_return(command, proc.returncode, stdout)
+            self.output_data.set_data(stdout)
 
         if self.setting('add-new-files'):
             self.add_new_files()
@@ -296,8 +362,10 @@ class SubprocessCompileFilter(SubprocessFilter):
     """
     _settings = {
             'add-new-files' : False,
+            'cache-compiled' : ("Whether to reuse the executable from an earlier compilation of the same source with the same compiler command and version.", True),
             'check-return-code' : False,
             'compiled-extension' : ("Extension which compiled files end with.", ".o"),
+            'compiler-input-extensions' : ("Extensions of input documents, in addition to input-extensions, which the compiler may read, e.g. headers.", ['.h', '.hh', '.hpp', '.inc']),
             'compiler-command-string' : (
                 "Command string to call compiler.",
                 "%(prog)s %(compiler_args)s %(script_file)s -o %(compiled_filename)s"
@@ -321,16 +389,58 @@ class SubprocessCompileFilter(SubprocessFilter):
         args['compiled_filename'] = self.compiled_filename()
         return "./%(compiled_filename)s %(args)s" % args
 
-    def process(self):
-        env = self.setup_env()
+    def compiled_cache_key(self, command):
+        """
+        Key identifying the executable built by command, calculated from the
+        source and any inputs the compiler may read, the command itself and
+        the compiler version.
+        """
+        extensions = set(self.setting('input-extensions'))
+        extensions.update(self.setting('compiler-input-extensions'))
 
-        # Compile the code
+        sources = [(self.work_input_filename(), md5_file(self.input_data.storage.data_file()))]
+        for doc in self.doc.walk_input_docs():
+            data = doc.output_data()
+            if data.ext in extensions:
+                sources.append((data.name, md5_file(data.storage.data_file())))
+
+        return self.doc.wrapper.compiled_executables.key(
+                sorted(sources), command, self.version(), self.setting('env'))
+
+    def compile(self, env):
+        """
+        Compiles the code in the workspace, or links in the executable from
+        an earlier compilation of the same source.
+        """
         command = self.compile_command_string()
+
+        key = None
+        if self.setting('cache-compiled'):
+            store = self.doc.wrapper.compiled_executables
+            key = self.compiled_cache_key(command)
+            compiled = os.path.join(self.parent_work_dir(), self.compiled_filename())
+
+            if self.setting('use-wd') and not os.path.exists(self.workspace()):
+                self.populate_workspace()
+
+            if store.fetch(key, compiled):
+                self.log_debug("reusing compiled executable for %s" % self.key)
+                return
+
         proc, stdout = self.run_command(command, env)
 
         # test exitcode from the *compiler*
         self.handle_subprocess_proc_return(command, proc.returncode, stdout)
 
+        if key and proc.returncode == 0 and os.path.isfile(compiled):
+            store.add(key, compiled)
+
+    def process(self):
+        env = self.setup_env()
+
+        # Compile the code
+        self.compile(env)
+
         # Run the compiled code
         command = self.run_command_string()
         proc, stdout = self.run_command(command, env)
@@ -363,14 +473,15 @@ class SubprocessInputFilter(SubprocessFilter):
 
         if len(inputs) == 1:
             doc = inputs[0]
-            for section_name, section_input in doc.output_data().iteritems():
-                proc, stdout = self.run_command(command, self.setup_env(), unicode(section_input))
+            section_inputs = [(section_name, unicode(section_input))
+                    for section_name, section_input in doc.output_data().iteritems()]
+            for section_name, proc, stdout in self.run_command_for_inputs(command, section_inputs):
                 self.output_data[section_name] = stdout
         else:
-            for doc in inputs:
-                proc, stdout = self.run_command(command, self.setup_env(), unicode(doc.output_data()))
+            doc_inputs = [(doc.key, unicode(doc.output_data())) for doc in inputs]
+            for doc_key, proc, stdout in self.run_command_for_inputs(command, doc_inputs):
                 self.handle_subprocess_proc_return(command, proc.returncode, stdout)
-                self.output_data[doc.key] = stdout
+                self.output_data[doc_key] = stdout
 
         self.output_data.save()
 
@@ -416,9 +527,7 @@ class SubprocessCompileInputFilter(SubprocessCompileFilter):
 
     def process(self):
         # Compile the code
-        command = self.compile_command_string()
-        proc, stdout = self.run_command(command, self.setup_env())
-        self.handle_subprocess_proc_return(command, proc.returncode, stdout)
+        self.compile(self.setup_env())
 
         command = self.run_command_string()
 
@@ -426,15 +535,13 @@ class SubprocessCompileInputFilter(SubprocessCompileFilter):
 
         if len(inputs) == 1:
             doc = inputs[0]
-            for section_name, section_input in doc.output_data().iteritems():
-                proc, stdout = self.run_command(command, self.setup_env(), section_input)
-                self.handle_subprocess_proc_return(command, proc.returncode, stdout)
-                self.output_data[section_name] = stdout
+            named_inputs = list(doc.output_data().iteritems())
         else:
-            for doc in inputs:
-                proc, stdout = self.run_command(command, self.setup_env(), unicode(doc.output_data()))
-                self.handle_subprocess_proc_return(command, proc.returncode, stdout)
-                self.output_data[doc.key] = stdout
+            named_inputs = [(doc.key, unicode(doc.output_data())) for doc in inputs]
+
+        for name, proc, stdout in self.run_command_for_inputs(command, named_inputs):
+            self.handle_subprocess_proc_return(command, proc.returncode, stdout)
+            self.output_data[name] = stdout
 
         self.output_data.save()
 
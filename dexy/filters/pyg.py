@@ -274,13 +274,14 @@ class PygmentsFilter(DexyFilter):
 
             else:
                 formatter = self.create_formatter_instance()
+                highlight_cache = self.doc.wrapper.highlight_cache
                 for section_name, section_input in self.input_data.iteritems():
                     try:
-                        section_output = highlight(unicode(section_input).decode("utf-8"), lexer, formatter)
+                        section_output = highlight_cache.highlight(unicode(section_input).decode("utf-8"), lexer, formatter)
                     except UnicodeDecodeError:
                         if self.setting('allow-unprintable-input'):
                             section_input = self.setting('unprintable-input-text')
-                            section_output = highlight(section_input, lexer, formatter)
+                            section_output = highlight_cache.highlight(section_input, lexer, formatter)
                         else:
                             raise
                     self.output_data[section_name] = section_output
@@ -2,6 +2,7 @@ from dexy.filter import DexyFilter
 from dexy.utils import indent
 import copy
 import dexy.exceptions
+import itertools
 import json
 import os
 import re
@@ -15,17 +16,27 @@ class Resub(DexyFilter):
             'expressions' : ("Tuples of (regexp, replacement) to apply.", []),
             }
 
-    def process_text(self, input_text):
-        for regexp, replacement in self.setting('expressions'):
-            self.log_debug("Applying %s" % regexp)
-            working_text = []
+    def process_lines(self, lines):
+        expressions = self.setting('expressions')
+        if not expressions:
+            for line in lines:
+                yield line
+            return
 
-            for line in input_text.splitlines():
-                working_text.append(re.sub(regexp, replacement, line))
+        self.log_debug("Applying %s" % ", ".join(r for r, _ in expressions))
+        for i, line in enumerate(lines):
+            if line.endswith("\n"):
+                line = line[:-1]
 
-            input_text = "\n".join(working_text)
+            working_text = [line]
+            for regexp, replacement in expressions:
+                working_text = [re.sub(regexp, replacement, l)
+                        for text in working_text
+                        for l in (text.splitlines() or [text])]
 
-        return input_text
+            if i > 0:
+                yield "\n"
+            yield "\n".join(working_text)
 
 
 class PreserveDataClassFilter(DexyFilter):
@@ -285,8 +296,15 @@ class HeadFilter(DexyFilter):
     """
     aliases = ['head']
 
-    def process_text(self, input_text):
-        return "\n".join(input_text.split("\n")[0:10]) + "\n"
+    def process_lines(self, lines):
+        line = ""
+        n = 0
+        for line in itertools.islice(lines, 10):
+            n += 1
+            yield line
+
+        if n < 10 or not line.endswith("\n"):
+            yield "\n"
 
 class WordWrapFilter(DexyFilter):
     """
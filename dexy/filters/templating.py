@@ -1,3 +1,4 @@
+from UserDict import DictMixin
 from dexy.filter import DexyFilter
 from dexy.plugin import TemplatePlugin
 from jinja2 import FileSystemLoader
@@ -31,6 +32,181 @@ class PassThroughWhitelistUndefined(jinja2.StrictUndefined):
         else:
             self._fail_with_undefined_error(*args, **kwargs)
 
+class SharedTemplatesBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    Bytecode cache which skips templates under any of skip_dirs.
+
+    Templates in filter workspaces are specific to one run of one document,
+    so caching them would only fill up the cache directory.
+    """
+    def __init__(self, directory, skip_dirs):
+        jinja2.FileSystemBytecodeCache.__init__(self, directory)
+        self.skip_dirs = [os.path.join(os.path.abspath(d), '') for d in skip_dirs]
+
+    def skip(self, filename):
+        if not filename:
+            return True
+        filepath = os.path.abspath(filename)
+        return any(filepath.startswith(d) for d in self.skip_dirs)
+
+    def get_bucket(self, environment, name, filename, source):
+        if self.skip(filename):
+            key = self.get_cache_key(name, filename)
+            bucket = jinja2.bccache.Bucket(environment, key, self.get_source_checksum(source))
+            bucket.skip = True
+            return bucket
+        else:
+            return jinja2.FileSystemBytecodeCache.get_bucket(self, environment, name, filename, source)
+
+    def set_bucket(self, bucket):
+        if not getattr(bucket, 'skip', False):
+            jinja2.FileSystemBytecodeCache.set_bucket(self, bucket)
+
+class TemplateData(DictMixin):
+    """
+    Mapping of the names provided by template plugins to their values.
+
+    A plugin is only run when one of its names is first looked up. The names
+    each plugin provided are remembered for the rest of the batch so that
+    later lookups can go straight to the right plugin, and values of plugins
+    which don't depend on the document are reused for the whole batch.
+
+    Plugins whose names aren't known yet are run straight away, so that two
+    plugins providing the same name are always detected.
+    """
+    def __init__(self, filter_instance, plugins):
+        self.filter_instance = filter_instance
+        self.pending = list(plugins)
+        self.entries = {}
+        self.check_names()
+
+    def batch_cache(self):
+        return self.filter_instance.doc.wrapper.template_plugin_cache
+
+    def plugin_names(self, plugin):
+        """
+        Returns the names plugin provided when it last ran in this batch, or
+        None if it hasn't run yet.
+        """
+        return self.batch_cache().get(('names', plugin.__class__))
+
+    def check_names(self):
+        for plugin in list(self.pending):
+            if self.plugin_names(plugin) is None:
+                self.run_plugin(plugin)
+
+        names = set(self.entries)
+        for plugin in self.pending:
+            plugin_names = self.plugin_names(plugin)
+            if any(k in names for k in plugin_names):
+                self.raise_name_clash(plugin, plugin_names, names)
+            names.update(plugin_names)
+
+    def raise_name_clash(self, plugin, new_names, existing_names):
+        new_keys = ", ".join(sorted(new_names))
+        existing_keys = ", ".join(sorted(existing_names))
+        msg = "plugin class '%s' is trying to add new keys '%s', already have '%s'"
+        raise dexy.exceptions.InternalDexyProblem(msg % (plugin.__class__.__name__, new_keys, existing_keys))
+
+    def run_plugin(self, plugin):
+        self.pending.remove(plugin)
+
+        batch_cache = self.batch_cache()
+        batch_key = plugin.batch_key()
+        if batch_key is not None:
+            cache_key = ('values', plugin.__class__, batch_key)
+        else:
+            cache_key = None
+
+        if cache_key and cache_key in batch_cache:
+            new_env_vars = batch_cache[cache_key]
+        else:
+            msg = "Running template plugin %s"
+            self.filter_instance.log_debug(msg % plugin.__class__.__name__)
+            new_env_vars = plugin.run()
+            if new_env_vars is None:
+                msg = "%s did not return any values"
+                raise dexy.exceptions.InternalDexyProblem(msg % plugin.alias)
+            if cache_key:
+                batch_cache[cache_key] = new_env_vars
+
+        batch_cache[('names', plugin.__class__)] = set(new_env_vars)
+
+        # Names of plugins which haven't run for this document yet.
+        pending_names = set()
+        for pending_plugin in self.pending:
+            pending_names.update(self.plugin_names(pending_plugin) or [])
+
+        if any(v in self.entries or v in pending_names for v in new_env_vars):
+            self.raise_name_clash(plugin, new_env_vars, set(self.entries) | pending_names)
+
+        for k, v in new_env_vars.iteritems():
+            if not isinstance(v, tuple) or len(v) != 2:
+                msg = "Template plugin '%s' must return a tuple of length 2." % k
+                raise dexy.exceptions.InternalDexyProblem(msg)
+
+        self.entries.update(new_env_vars)
+
+    def run_all(self):
+        for plugin in list(self.pending):
+            self.run_plugin(plugin)
+
+    def entry(self, key):
+        """
+        Returns the (docstring, value) tuple for key.
+        """
+        if key in self.entries:
+            return self.entries[key]
+
+        # Try plugins which provided key before, or haven't run yet this
+        # batch, then the rest in case a plugin's names have changed.
+        batch_cache = self.batch_cache()
+        likely = [plugin for plugin in self.pending
+                if key in batch_cache.get(('names', plugin.__class__), (key,))]
+
+        for plugins in (likely, list(self.pending)):
+            for plugin in plugins:
+                if plugin in self.pending:
+                    self.run_plugin(plugin)
+                if key in self.entries:
+                    return self.entries[key]
+
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        return self.entry(key)[1]
+
+    def __contains__(self, key):
+        try:
+            self.entry(key)
+            return True
+        except KeyError:
+            return False
+
+    def keys(self):
+        self.run_all()
+        return self.entries.keys()
+
+    def iteritems(self):
+        self.run_all()
+        return ((k, v[1]) for k, v in self.entries.iteritems())
+
+class TemplateDataContext(jinja2.runtime.Context):
+    """
+    Jinja context which looks up names it doesn't have in the TemplateData
+    passed to the template under TEMPLATE_DATA_KEY.
+    """
+    TEMPLATE_DATA_KEY = '__dexy_template_data__'
+
+    def resolve_or_missing(self, key):
+        rv = jinja2.runtime.Context.resolve_or_missing(self, key)
+        if rv is jinja2.utils.missing:
+            template_data = self.vars.get(self.TEMPLATE_DATA_KEY) or \
+                    self.parent.get(self.TEMPLATE_DATA_KEY)
+            if template_data is not None and key in template_data:
+                return template_data[key]
+        return rv
+
 class TemplateFilter(DexyFilter):
     """
     Base class for templating system filters such as JinjaFilter. Templating
@@ -60,34 +236,16 @@ class TemplateFilter(DexyFilter):
                         if not instance.alias in self.setting('skip-plugins')]
 
     def run_plugins(self):
-        env = {}
-        for plugin in self.template_plugins():
-            self.log_debug("Running template plugin %s" % plugin.__class__.__name__)
-            new_env_vars = plugin.run()
-            if new_env_vars is None:
-                msg = "%s did not return any values"
-                raise dexy.exceptions.InternalDexyProblem(msg % plugin.alias)
-            if any(v in env.keys() for v in new_env_vars):
-                new_keys = ", ".join(sorted(new_env_vars))
-                existing_keys = ", ".join(sorted(env))
-                msg = "plugin class '%s' is trying to add new keys '%s', already have '%s'"
-                raise dexy.exceptions.InternalDexyProblem(msg % (plugin.__class__.__name__, new_keys, existing_keys))
-            env.update(new_env_vars)
-
-        return env
+        template_data = TemplateData(self, self.template_plugins())
+        template_data.run_all()
+        return template_data.entries
 
     def template_data(self):
-        plugin_output = self.run_plugins()
-
-        template_data = {}
-
-        for k, v in plugin_output.iteritems():
-            if not isinstance(v, tuple) or len(v) != 2:
-                msg = "Template plugin '%s' must return a tuple of length 2." % k
-                raise dexy.exceptions.InternalDexyProblem(msg)
-            template_data[k] = v[1]
-
-        return template_data
+        """
+        Returns a TemplateData mapping, plugins are run as their names are
+        looked up.
+        """
+        return TemplateData(self, self.template_plugins())
 
     def process_text(self, input_text):
         template_data = self.template_data()
@@ -146,6 +304,13 @@ class JinjaFilter(TemplateFilter):
             }
 
     def setup_jinja_env(self, loader=None):
+        """
+        Returns a jinja environment for this document. Documents with the
+        same jinja settings in a run share a base environment, with template
+        filters and a bytecode cache, and get their own overlay of it for
+        loader. Base environments are kept on the wrapper, since template
+        filters are bound to it.
+        """
         env_attrs = {}
 
         for k, v in self.setting_values().iteritems():
@@ -169,12 +334,35 @@ class JinjaFilter(TemplateFilter):
                     self.log_debug("setting %s to %s" % (underscore_k, v))
                     env_attrs[underscore_k] = v
 
-        if loader:
-            env_attrs['loader'] = loader
+        wrapper = self.doc.wrapper
+        env_key = (
+                tuple(sorted(env_attrs.iteritems())),
+                tuple(self.setting('filters'))
+                )
+
+        with wrapper.jinja_envs_lock:
+            env = wrapper.jinja_envs.get(env_key)
+            if env is None:
+                debug_attr_string = ", ".join("%s: %r" % (k, v) for k, v in env_attrs.iteritems())
+                self.log_debug("creating jinja2 environment with: %s" % debug_attr_string)
+                env = jinja2.Environment(**env_attrs)
+                env.context_class = TemplateDataContext
+
+                self.log_debug("setting up jinja template filters")
+                env.filters.update(self.jinja_template_filters())
 
-        debug_attr_string = ", ".join("%s: %r" % (k, v) for k, v in env_attrs.iteritems())
-        self.log_debug("creating jinja2 environment with: %s" % debug_attr_string)
-        return jinja2.Environment(**env_attrs)
+                cache_dir = os.path.join(wrapper.artifacts_dir, "jinja")
+                if not os.path.exists(cache_dir):
+                    os.makedirs(cache_dir)
+                skip_dirs = [wrapper.work_cache_dir(), wrapper.trash_dir()]
+                env.bytecode_cache = SharedTemplatesBytecodeCache(cache_dir, skip_dirs)
+
+                wrapper.jinja_envs[env_key] = env
+
+        if loader:
+            return env.overlay(loader=loader)
+        else:
+            return env
 
     def handle_jinja_exception(self, e, input_text, template_data):
         result = []
@@ -233,6 +421,7 @@ class JinjaFilter(TemplateFilter):
         for alias in self.setting('filters'):
             self.log_debug("  creating filters from template plugin %s" % alias)
             template_plugin = TemplatePlugin.create_instance(alias)
+            template_plugin.wrapper = self.doc.wrapper
 
             if not template_plugin.is_active():
                 self.log_debug("    skipping %s - not active" % alias)
@@ -259,19 +448,17 @@ class JinjaFilter(TemplateFilter):
 
         self.log_debug("setting up jinja environment")
         env = self.setup_jinja_env(loader=loader)
-        self.log_debug("setting up jinja template filters")
-        env.filters.update(self.jinja_template_filters())
 
         self.log_debug("initializing template")
 
         template_data = self.template_data()
-        self.log_debug("jinja template data keys are %s" % ", ".join(sorted(template_data)))
+        template_vars = { TemplateDataContext.TEMPLATE_DATA_KEY : template_data }
 
         try:
             self.log_debug("about to create jinja template")
             template = env.get_template(self.work_input_filename())
             self.log_debug("about to process jinja template")
-            template.stream(template_data).dump(self.output_filepath(), encoding="utf-8")
+            template.stream(template_vars).dump(self.output_filepath(), encoding="utf-8")
         except (TemplateSyntaxError, UndefinedError, TypeError) as e:
             try:
                 self.log_debug("removing %s since jinja had an error" % self.output_filepath())
@@ -6,6 +6,7 @@ from dexy.plugin import TemplatePlugin
 from dexy.utils import levenshtein
 from dexy.version import DEXY_VERSION
 from pygments.styles import get_all_styles
+import bisect
 import calendar
 import dexy.commands
 import dexy.commands.cite
@@ -14,6 +15,7 @@ import dexy.exceptions
 import dexy.plugin
 import inflection
 import inspect
+import itertools
 import jinja2
 import json
 import markdown
@@ -176,6 +178,9 @@ class Bibtex(TemplatePlugin):
     """
     Produces a bibtex entry for dexy.
     """
+    def batch_key(self):
+        return ()
+
     def run(self):
         return { 'dexy_bibtex' : dexy.commands.cite.bibtex_text() }
 
@@ -467,6 +472,9 @@ class PythonBuiltins(TemplatePlugin):
             reduce, repr, reversed, round, set, slice, sorted, str, sum, tuple,
             type, xrange, unicode, zip]
 
+    def batch_key(self):
+        return ()
+
     def run(self):
         return dict((f.__name__, ("The python builtin function %s" % f.__name__, f,)) for f in self.PYTHON_BUILTINS)
 
@@ -479,12 +487,18 @@ class PygmentsStylesheet(TemplatePlugin):
     # TODO rewrite this so it's a function rather than pre-generating all
     # of the stylesheets. Detect document format automatically.
 
-    def generate_stylesheets(self):
-        pygments_stylesheets = {}
+    def formatter_args(self):
         if hasattr(self, 'filter_instance') and self.filter_instance.doc.args.has_key('pygments'):
-            formatter_args = self.filter_instance.doc.args['pygments']
+            return dict(self.filter_instance.doc.args['pygments'])
         else:
-            formatter_args = {}
+            return {}
+
+    def batch_key(self):
+        return json.dumps(self.formatter_args(), sort_keys=True, default=repr)
+
+    def generate_stylesheets(self):
+        pygments_stylesheets = {}
+        formatter_args = self.formatter_args()
 
         for style_name in get_all_styles():
             for formatter_class in [pygments.formatters.LatexFormatter, pygments.formatters.HtmlFormatter]:
@@ -523,7 +537,16 @@ class PygmentsHighlight(TemplatePlugin):
             formatter_options['style'] = style
         lexer = pygments.lexers.get_lexer_by_name(lexer_name)
         formatter = pygments.formatters.get_formatter_by_name(fmt, **formatter_options)
-        return pygments.highlight(text, lexer, formatter)
+        if hasattr(self, 'filter_instance'):
+            wrapper = self.filter_instance.doc.wrapper
+        else:
+            # Set for plugins used as jinja filters.
+            wrapper = getattr(self, 'wrapper', None)
+
+        if wrapper:
+            return wrapper.highlight_cache.highlight(text, lexer, formatter)
+        else:
+            return pygments.highlight(text, lexer, formatter)
 
     def run(self):
         return {
@@ -573,6 +596,9 @@ class Globals(TemplatePlugin):
     using the --globals option
     """
     aliases = ['globals']
+    def batch_key(self):
+        return self.filter_instance.doc.wrapper.globals
+
     def run(self):
         raw_globals = self.filter_instance.doc.wrapper.globals
         env = {}
@@ -619,8 +645,20 @@ class D(DictMixin):
         self._parent_dir = doc.output_data().parent_dir()
         self._input_docs = input_docs.values()
         self._input_doc_keys = [d.key for d in self._input_docs]
-        self._input_doc_names = [d.output_data().long_name() for d in self._input_docs]
-        self._input_doc_titles = ["title:%s" % d.output_data().title() for d in self._input_docs]
+
+        # Maps from keys and long names to positions in _input_docs. Titles
+        # can require reading file contents, so they are only indexed when a
+        # title: reference is looked up.
+        self._key_index = {}
+        for i, key in enumerate(self._input_doc_keys):
+            self._key_index.setdefault(key, i)
+
+        self._name_index = {}
+        for i, d in enumerate(self._input_docs):
+            self._name_index.setdefault(d.output_data().long_name(), i)
+
+        self._title_index = None
+        self._sorted_keys = sorted((k, i) for i, k in enumerate(self._input_doc_keys))
 
         self._ref_cache = {}
 
@@ -628,13 +666,19 @@ class D(DictMixin):
         return self._input_doc_keys
 
     def key_or_name_index(self, ref):
-        if ref in self._input_doc_keys:
-            return self._input_doc_keys.index(ref)
-        elif ref in self._input_doc_names:
-            return self._input_doc_names.index(ref)
+        if ref in self._key_index:
+            return self._key_index[ref]
+        elif ref in self._name_index:
+            return self._name_index[ref]
 
     def matching_keys(self, ref):
-        return [(i, k) for (i, k) in enumerate(self._input_doc_keys) if k.startswith(ref)]
+        matches = []
+        start = bisect.bisect_left(self._sorted_keys, (ref,))
+        for k, i in itertools.islice(self._sorted_keys, start, None):
+            if not k.startswith(ref):
+                break
+            matches.append((i, k))
+        return sorted(matches)
 
     def unique_matching_key(self, ref):
         """
@@ -645,8 +689,12 @@ class D(DictMixin):
             return matching_keys[0]
 
     def title_index(self, ref):
-        if ref in self._input_doc_titles:
-            return self._input_doc_titles[ref]
+        if self._title_index is None:
+            self._title_index = {}
+            for i, d in enumerate(self._input_docs):
+                title = "title:%s" % d.output_data().title()
+                self._title_index.setdefault(title, i)
+        return self._title_index.get(ref)
 
     def path_to(self, other):
         if self._parent_dir:
@@ -0,0 +1,98 @@
+from dexy.utils import md5_file
+from dexy.utils import mtime_is_racy
+import os
+import time
+
+class HashIndex(object):
+    """
+    Persistent index of content digests used to detect changed documents.
+
+    Digests of project files are saved along with the file's size, mtime and
+    inode and are only recalculated when one of these changes. The digest of
+    each document's source contents is also saved when the document runs, so
+    later runs can tell whether the source has really changed.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.files = None
+        self.sources = None
+
+    def index_filename(self):
+        return os.path.join(self.wrapper.artifacts_dir, "hashindex.pickle")
+
+    def load(self):
+        if self.files is not None:
+            return
+
+        try:
+            with open(self.index_filename(), 'rb') as f:
+                pickle = self.wrapper.pickle_lib()
+                info = pickle.load(f)
+            self.files = info['files']
+            self.sources = info['sources']
+        except IOError:
+            self.files = {}
+            self.sources = {}
+
+    def save(self):
+        """
+        Saves the index, dropping entries for files and documents no longer
+        in the project and for files whose mtime is too recent to trust
+        (see dexy.utils.mtime_is_racy).
+        """
+        self.load()
+
+        now = time.time()
+        filemap = getattr(self.wrapper, 'filemap', None) or {}
+        ospaths = set(info['ospath'] for info in filemap.values())
+
+        files = {}
+        for filepath, (signature, digest) in self.files.iteritems():
+            if filepath in ospaths and not mtime_is_racy(signature[1], now):
+                files[filepath] = (signature, digest)
+
+        nodes = getattr(self.wrapper, 'nodes', None)
+        if nodes:
+            hashids = set(node.hashid for node in nodes.values())
+            sources = dict((k, v) for k, v in self.sources.iteritems() if k in hashids)
+        else:
+            sources = self.sources
+
+        info = {
+            'files' : files,
+            'sources' : sources
+            }
+
+        with open(self.index_filename(), 'wb') as f:
+            pickle = self.wrapper.pickle_lib()
+            pickle.dump(info, f)
+
+    def file_digest(self, filepath, stat=None):
+        """
+        Returns the digest of the file's contents, only reading the file if
+        its size, mtime or inode differ from when it was last hashed.
+        """
+        self.load()
+
+        if stat is None:
+            stat = os.stat(filepath)
+
+        signature = (stat.st_size, stat.st_mtime, stat.st_ino)
+        entry = self.files.get(filepath)
+        if entry and entry[0] == signature:
+            return entry[1]
+
+        digest = md5_file(filepath)
+        self.files[filepath] = (signature, digest)
+        return digest
+
+    def source_digest(self, node_hashid):
+        """
+        Returns the source digest saved when the node last ran, or None.
+        """
+        self.load()
+        return self.sources.get(node_hashid)
+
+    def set_source_digest(self, node_hashid, digest):
+        self.load()
+        self.sources[node_hashid] = digest
@@ -0,0 +1,107 @@
+from dexy.utils import md5_hash
+import json
+import os
+import pygments
+import threading
+
+class HighlightCache(object):
+    """
+    On-disk cache of pygments output, shared by all documents and runs.
+
+    Entries are keyed by the pygments version, the lexer and formatter
+    classes and their options and by a digest of the highlighted text. When
+    there are more entries than highlight_cache_entries, the least recently
+    used ones are removed at the end of a run.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.lock = threading.Lock()
+        self.added = 0
+        self.used = set()
+
+    def cache_dir(self):
+        return os.path.join(self.wrapper.artifacts_dir, "highlight")
+
+    def entry_filepath(self, key):
+        return os.path.join(self.cache_dir(), key[0:2], key)
+
+    def key(self, text, lexer, formatter):
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+
+        info = [
+                pygments.__version__,
+                lexer.__class__.__name__, lexer.options,
+                formatter.__class__.__name__, formatter.options
+                ]
+        settings = json.dumps(info, sort_keys=True, default=repr)
+        return md5_hash("%s:%s" % (md5_hash(settings), md5_hash(text)))
+
+    def highlight(self, text, lexer, formatter):
+        """
+        Returns the same as pygments.highlight(text, lexer, formatter),
+        reusing saved output if this text has been highlighted before.
+        """
+        pickle = self.wrapper.pickle_lib()
+        filepath = self.entry_filepath(self.key(text, lexer, formatter))
+
+        try:
+            with open(filepath, 'rb') as f:
+                output = pickle.load(f)
+            self.mark_used(filepath)
+            return output
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+        output = pygments.highlight(text, lexer, formatter)
+
+        try:
+            os.makedirs(os.path.dirname(filepath))
+        except OSError:
+            pass
+
+        tmp_filepath = "%s-%s" % (filepath, threading.current_thread().ident)
+        with open(tmp_filepath, 'wb') as f:
+            pickle.dump(output, f)
+        os.rename(tmp_filepath, filepath)
+
+        with self.lock:
+            self.added += 1
+            self.used.add(filepath)
+
+        return output
+
+    def mark_used(self, filepath):
+        """
+        Refreshes the mtime of an entry the first time it is used in a run.
+        """
+        with self.lock:
+            if filepath in self.used:
+                return
+            self.used.add(filepath)
+        os.utime(filepath, None)
+
+    def collect_garbage(self):
+        """
+        Removes the least recently used entries if there are too many.
+        """
+        self.used = set()
+        if not self.added:
+            return
+
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(self.cache_dir()):
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                try:
+                    entries.append((os.stat(filepath).st_mtime, filepath))
+                except OSError:
+                    pass
+
+        max_entries = int(self.wrapper.highlight_cache_entries)
+        if len(entries) > max_entries:
+            entries.sort()
+            for mtime, filepath in entries[0:len(entries)-max_entries]:
+                os.remove(filepath)
+
+        self.added = 0
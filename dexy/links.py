@@ -0,0 +1,149 @@
+from dexy.utils import md5_hash
+from dexy.utils import mtime_is_racy
+import json
+import os
+import time
+
+class LinkIndex(object):
+    """
+    Persistent index of the documents and sections which can be linked to.
+
+    For each output document the index records its key, output name, title,
+    description and the ids of its sections, so links can be resolved
+    without loading documents. Entries are saved between runs and only
+    recalculated when a document's data file or settings change.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.entries = None
+        self.docs = {}
+        self.sections = {}
+
+    def index_filename(self):
+        return os.path.join(self.wrapper.artifacts_dir, "links.pickle")
+
+    def load(self):
+        if self.entries is not None:
+            return
+
+        pickle = self.wrapper.pickle_lib()
+        try:
+            with open(self.index_filename(), 'rb') as f:
+                self.entries = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            self.entries = {}
+
+    def save(self):
+        """
+        Saves the index, leaving out entries for data files whose mtime is
+        too recent to trust (see dexy.utils.mtime_is_racy).
+        """
+        if not os.path.isdir(self.wrapper.artifacts_dir):
+            return
+
+        now = time.time()
+        entries = dict((k, entry) for k, entry in self.entries.iteritems()
+                if entry['file'] and not mtime_is_racy(entry['file'][1], now))
+
+        pickle = self.wrapper.pickle_lib()
+        with open(self.index_filename(), 'wb') as f:
+            pickle.dump(entries, f)
+
+    def data_file_info(self, data):
+        try:
+            stat = os.stat(data.storage.data_file())
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime)
+
+    def settings_digest(self, data):
+        return md5_hash(json.dumps(data.setting_values(), sort_keys=True, default=repr))
+
+    def calculate_entry(self, data, file_info, settings_digest):
+        data.storage.connect()
+
+        sections = {}
+        section_names = []
+        for section_name in data.keys():
+            if section_name == '1':
+                continue
+            try:
+                sections[section_name] = data.section_id(section_name)
+            except (KeyError, TypeError):
+                sections[section_name] = None
+            section_names.append(section_name)
+
+        return {
+                'storage-key' : data.storage_key,
+                'key' : data.key,
+                'output-name' : data.output_name(),
+                'title' : data.title(),
+                'description' : data.safe_setting('description'),
+                'canonical' : bool(data.setting('canonical-output')),
+                'sections' : sections,
+                'section-names' : section_names,
+                'file' : file_info,
+                'settings' : settings_digest
+                }
+
+    def update(self, batch):
+        """
+        Records entries for the output documents in batch, reusing saved
+        entries for documents which have not changed, and saves the index.
+        """
+        self.load()
+
+        entries = {}
+        self.docs = {}
+        self.sections = {}
+
+        for doc_key in batch.doc_keys_excluding_states('uncached'):
+            data = batch.data(doc_key, connect=False)
+            file_info = self.data_file_info(data)
+            settings_digest = self.settings_digest(data)
+
+            entry = self.entries.get(data.storage_key)
+            if not file_info or not entry or entry['file'] != file_info \
+                    or entry['settings'] != settings_digest:
+                entry = self.calculate_entry(data, file_info, settings_digest)
+            entries[data.storage_key] = entry
+
+            if entry['canonical']:
+                for name in (entry['key'], entry['output-name'], entry['title']):
+                    self.add(self.docs, name, entry['storage-key'])
+                for section_name in entry['section-names']:
+                    self.add(self.sections, section_name, entry['storage-key'])
+
+        self.entries = entries
+        self.save()
+
+    def add(self, lookup, name, storage_key):
+        if not name in lookup:
+            lookup[name] = []
+        if not storage_key in lookup[name]:
+            lookup[name].append(storage_key)
+
+    def find_docs(self, name):
+        """
+        Returns entries for the documents which can be looked up by name.
+        """
+        return [self.entries[storage_key] for storage_key in self.docs.get(name, [])]
+
+    def find_sections(self, section_name):
+        """
+        Returns entries for the documents with a section named section_name.
+        """
+        return [self.entries[storage_key] for storage_key in self.sections.get(section_name, [])]
+
+    def lookup_datas(self, lookup):
+        """
+        Returns a copy of lookup with data objects in place of storage keys.
+        """
+        datas = {}
+        result = {}
+        for name, storage_keys in lookup.iteritems():
+            for storage_key in storage_keys:
+                if not storage_key in datas:
+                    datas[storage_key] = self.wrapper.batch.data_for_storage_key(storage_key)
+            result[name] = [datas[storage_key] for storage_key in storage_keys]
+        return result
@@ -2,7 +2,6 @@ from dexy.utils import md5_hash
 from dexy.utils import os_to_posix
 import dexy.doc
 import dexy.plugin
-import fnmatch
 import json
 import re
 
@@ -40,6 +39,9 @@ class Node(dexy.plugin.Plugin):
         self.children = []
         self.additional_docs = []
 
+        self._input_closure_version = None
+        self._walk_inputs_version = None
+
         self.hashid = md5_hash(self.key)
 
         self.state = 'new'
@@ -70,22 +72,33 @@ class Node(dexy.plugin.Plugin):
     def arg_value(self, key, default=None):
         return self.args.get(key, default) or self.args.get(key.replace("-", "_"), default)
 
-    def walk_inputs(self):
+    def input_closure(self):
         """
-        Yield all direct inputs and their inputs.
+        Returns a list of all inputs and children of this node, their inputs
+        and children, and so on, without duplicates. The list is cached until
+        the wrapper's input graph changes.
         """
-        children = []
-        def walk(inputs):
-            for inpt in inputs:
-                children.append(inpt)
-                walk(inpt.inputs + inpt.children)
+        version = self.wrapper.input_graph_version
+        if self._input_closure_version != version:
+            self._input_closure = closure_of(self.inputs + self.children)
+            self._input_closure_version = version
+        return self._input_closure
 
+    def walk_inputs(self):
+        """
+        Returns a list of all direct inputs and their inputs, without
+        duplicates, in the order in which they are first reached.
+        """
         if self.inputs:
-            walk(self.inputs)
+            version = self.wrapper.input_graph_version
+            if self._walk_inputs_version != version:
+                self._walk_inputs = closure_of(self.inputs)
+                self._walk_inputs_version = version
+            return list(self._walk_inputs)
         elif hasattr(self, 'parent'):
-            children = self.parent.walk_inputs()
-
-        return children
+            return self.parent.walk_inputs()
+        else:
+            return []
 
     def walk_input_docs(self):
         """
@@ -112,15 +125,15 @@ class Node(dexy.plugin.Plugin):
         Checks if args have changed by comparing calculated hash against the
         archived calculated hash from last run.
         """
-        saved_args = self.wrapper.saved_args.get(self.key_with_class())
-        if not saved_args:
+        saved_digest = self.wrapper.arg_index.saved_digest(self.key_with_class())
+        if not saved_digest:
             self.log_debug("no saved args, will return True for args_changed")
             return True
         else:
-            self.log_debug("    saved args '%s' (%s)" % (saved_args, saved_args.__class__))
-            self.log_debug("    sorted args '%s' (%s)" % (self.sorted_arg_string(), self.sorted_arg_string().__class__))
-            self.log_debug("  args unequal: %s" % (saved_args != self.sorted_arg_string()))
-            return saved_args != self.sorted_arg_string()
+            args_digest = self.args_digest()
+            self.log_debug("    saved args digest '%s'" % saved_digest)
+            self.log_debug("    args digest '%s'" % args_digest)
+            return saved_digest != args_digest
 
     def sorted_args(self, skip=['contents']):
         """
@@ -141,6 +154,12 @@ class Node(dexy.plugin.Plugin):
         """
         return unicode(json.dumps(self.sorted_args()))
 
+    def args_digest(self):
+        """
+        Returns a digest of the sorted arg string.
+        """
+        return md5_hash(self.sorted_arg_string())
+
     def additional_doc_info(self):
         additional_doc_info = []
         for doc in self.additional_docs:
@@ -171,6 +190,7 @@ class Node(dexy.plugin.Plugin):
         self.log_debug("adding additional doc '%s'" % doc.key)
         doc.created_by_doc = self
         self.children.append(doc)
+        self.wrapper.input_graph_changed()
         self.wrapper.add_node(doc)
         self.wrapper.batch.add_doc(doc)
         self.additional_docs.append(doc)
@@ -213,6 +233,10 @@ class Node(dexy.plugin.Plugin):
 
             if is_cached and cache_elements_present:
                 self.transition('cached')
+            elif not any_inputs_not_cached and self.restore_from_artifact_store():
+                self.log_debug("  restored from artifact store")
+                self.doc_changed = False
+                self.transition('cached')
             else:
                 self.transition('uncached')
 
@@ -220,6 +244,32 @@ class Node(dexy.plugin.Plugin):
             self.wrapper.add_node(self)
             self.wrapper.batch.add_doc(self)
 
+    def artifact_key_info(self):
+        """
+        Returns the information which determines this node's artifact key.
+        """
+        return [
+                self.key_with_class(),
+                self.sorted_arg_string(),
+                [node.artifact_key() for node in self.input_nodes(True)]
+                ]
+
+    def artifact_key(self):
+        """
+        Returns a digest identifying the output of this node, based on its
+        own contents and arguments and on the artifact keys of its inputs.
+        """
+        if not hasattr(self, '_artifact_key'):
+            self._artifact_key = md5_hash(json.dumps(self.artifact_key_info()))
+        return self._artifact_key
+
+    def restore_from_artifact_store(self):
+        """
+        Attempts to restore cache files from the artifact store, returns a
+        boolean to indicate success.
+        """
+        return False
+
     def load_runtime_info(self):
         pass
 
@@ -272,6 +322,20 @@ class Node(dexy.plugin.Plugin):
             for task in child:
                 task()
 
+def closure_of(nodes):
+    """
+    Returns a list of nodes and all of their inputs and children, each node
+    appearing once, in depth-first order.
+    """
+    closure = []
+    seen = set()
+    for node in nodes:
+        for n in [node] + node.input_closure():
+            if not n in seen:
+                seen.add(n)
+                closure.append(n)
+    return closure
+
 class BundleNode(Node):
     """
     Acts as a wrapper for other nodes.
@@ -297,6 +361,7 @@ class ScriptNode(BundleNode):
             doc.parent = self
             doc.inputs = doc.inputs + siblings
             siblings.append(doc)
+        self.wrapper.input_graph_changed()
 
 #        self.doc_changed = self.check_doc_changed()
 #
@@ -320,24 +385,24 @@ class PatternNode(Node):
         file_pattern = self.key.split("|")[0]
         filter_aliases = self.key.split("|")[1:]
 
-        for filepath, fileinfo in self.wrapper.filemap.iteritems():
-            if fnmatch.fnmatch(filepath, file_pattern):
-                except_p = self.args.get('except')
-                if except_p and re.search(except_p, filepath):
-                    msg = "not creating child of patterndoc for file '%s' because it matches except '%s'"
-                    msgargs = (filepath, except_p)
-                    self.log_debug(msg % msgargs)
+        except_p = self.args.get('except')
+
+        for filepath in self.wrapper.files_matching(file_pattern):
+            if except_p and re.search(except_p, filepath):
+                msg = "not creating child of patterndoc for file '%s' because it matches except '%s'"
+                msgargs = (filepath, except_p)
+                self.log_debug(msg % msgargs)
+            else:
+                if len(filter_aliases) > 0:
+                    doc_key = "%s|%s" % (filepath, "|".join(filter_aliases))
                 else:
-                    if len(filter_aliases) > 0:
-                        doc_key = "%s|%s" % (filepath, "|".join(filter_aliases))
-                    else:
-                        doc_key = filepath
-
-                    msg = "creating child of patterndoc %s: %s"
-                    msgargs = (self.key, doc_key)
-                    self.log_debug(msg % msgargs)
-                    doc = dexy.doc.Doc(doc_key, self.wrapper, [], **self.args)
-                    doc.parent = self
-                    self.children.append(doc)
-                    self.wrapper.add_node(doc)
-                    self.wrapper.batch.add_doc(doc)
+                    doc_key = filepath
+
+                msg = "creating child of patterndoc %s: %s"
+                msgargs = (self.key, doc_key)
+                self.log_debug(msg % msgargs)
+                doc = dexy.doc.Doc(doc_key, self.wrapper, [], **self.args)
+                doc.parent = self
+                self.children.append(doc)
+                self.wrapper.add_node(doc)
+                self.wrapper.batch.add_doc(doc)
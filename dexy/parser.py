@@ -108,11 +108,24 @@ class AbstractSyntaxTree():
 
         return env
 
+    def file_patterns(self):
+        """
+        Returns the file matching patterns of all pattern nodes in the tree.
+        """
+        patterns = set()
+        for node_key in self.lookup_table:
+            alias, pattern = node_key.split(":", 1)
+            if alias == 'pattern':
+                patterns.add(pattern.split("|")[0])
+        return patterns
+
     def walk(self):
         """
         Creates Node objects for all elements in tree. Returns a list of root
         nodes and a dict of all nodes referenced by qualified keys.
         """
+        self.wrapper.match_file_patterns(self.file_patterns())
+
         if self.wrapper.nodes:
             self.log_warn("nodes are not empty: %s" % ", ".join(self.wrapper.nodes))
         if self.wrapper.roots:
@@ -68,5 +68,13 @@ class TemplatePlugin(Plugin):
         if filter_instance:
             self.filter_instance = filter_instance
 
+    def batch_key(self):
+        """
+        If the values returned by run() don't depend on the document being
+        processed, returns a key for them so they can be reused for the rest
+        of the batch. Returns None otherwise.
+        """
+        return None
+
     def run(self):
         return {}
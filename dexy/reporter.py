@@ -132,6 +132,128 @@ class Reporter(dexy.plugin.Plugin):
         with open(self.readme_filepath(), "w") as f:
             f.write(self.setting('readme-contents') % self.settings_and_attributes())
 
+    def manifest_filepath(self):
+        return os.path.join(self.cache_reports_dir(), "%s-manifest.pickle" % self.aliases[0])
+
+    def load_manifest(self):
+        """
+        Returns the files written by this reporter's last incremental run,
+        or None if there is no record of them for the current report dir.
+        """
+        pickle = self.wrapper.pickle_lib()
+        try:
+            with open(self.manifest_filepath(), 'rb') as f:
+                info = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+        if info['dir'] != self.report_dir():
+            return None
+        return info['files']
+
+    def save_manifest(self, files):
+        self.create_cache_reports_dir()
+        info = {
+                'dir' : self.report_dir(),
+                'files' : files
+                }
+
+        pickle = self.wrapper.pickle_lib()
+        with open(self.manifest_filepath(), 'wb') as f:
+            pickle.dump(info, f)
+
+    def remove_manifest(self):
+        if file_exists(self.manifest_filepath()):
+            os.remove(self.manifest_filepath())
+
+    def output_digest(self, data):
+        """
+        Returns a string which changes whenever data's stored contents are
+        rewritten, or None if data has no stored contents.
+        """
+        try:
+            stat = os.stat(data.storage.data_file())
+        except OSError:
+            return None
+        return "%s:%s:%s:%s:%s" % (data.alias, data.storage_key,
+                stat.st_size, stat.st_mtime, stat.st_ino)
+
+    def output_file_unchanged(self, fp, entry):
+        """
+        Returns True if the file at fp has the size and mtime recorded in its
+        manifest entry, i.e. it has not been modified since it was written.
+        """
+        try:
+            stat = os.stat(fp)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime) == tuple(entry[1:3])
+
+    def output_file_entry(self, fp, digest):
+        """
+        Returns the manifest entry for a file which has just been written.
+        """
+        stat = os.stat(fp)
+        return (digest, stat.st_size, stat.st_mtime)
+
+    def prepare_output_file(self, fp):
+        try:
+            os.makedirs(os.path.dirname(fp))
+        except os.error:
+            pass
+
+        if os.path.lexists(fp):
+            os.remove(fp)
+
+    def remove_stale_output_files(self, files, manifest):
+        """
+        Removes files listed in manifest which are not in files.
+        """
+        for fp in manifest:
+            if not fp in files and os.path.lexists(fp):
+                self.log_debug("  removing %s" % fp)
+                os.remove(fp)
+                self.remove_empty_parent_dirs(fp)
+
+    def write_output_files(self, outputs, manifest):
+        """
+        Writes each data object in outputs to the file path it is keyed by.
+
+        Files listed in manifest whose data has not changed since they were
+        written, and which have not been modified since, are left alone.
+        Returns the new manifest.
+        """
+        files = {}
+        for fp, data in outputs.iteritems():
+            files[fp] = self.write_output_file(fp, data, manifest)
+        return files
+
+    def write_output_file(self, fp, data, manifest):
+        """
+        Writes data to fp unless the file listed in manifest is up to date.
+        Returns the file's manifest entry.
+        """
+        digest = self.output_digest(data)
+        entry = manifest.get(fp)
+
+        if digest and entry and entry[0] == digest:
+            if self.output_file_unchanged(fp, entry):
+                return entry
+
+        self.prepare_output_file(fp)
+        self.log_debug("  writing %s to %s" % (data.key, fp))
+        data.output_to_file(fp)
+        return self.output_file_entry(fp, digest)
+
+    def remove_empty_parent_dirs(self, fp):
+        parent_dir = os.path.dirname(fp)
+        while parent_dir and parent_dir != self.report_dir():
+            try:
+                os.rmdir(parent_dir)
+            except OSError:
+                return
+            parent_dir = os.path.dirname(parent_dir)
+
     def create_cache_reports_dir(self):
         if not file_exists(self.cache_reports_dir()):
             os.makedirs(self.cache_reports_dir())
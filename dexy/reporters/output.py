@@ -7,10 +7,16 @@ class Output(Reporter):
     """
     aliases = ['output']
     _settings = {
-            'dir' : 'output'
+            'dir' : 'output',
+            'incremental' : ("""Whether to only write files whose contents
+                changed since the last run, leaving unchanged files in place
+                and removing files which are no longer generated.""", True)
             }
 
-    def write_canonical_data(self, doc):
+    def canonical_filepath(self, doc):
+        """
+        Returns the path to write doc's canonical output to, or None.
+        """
         output_name = doc.output_data().output_name()
 
         if output_name:
@@ -22,6 +28,12 @@ class Output(Reporter):
                 self.locations[fp] = []
             self.locations[fp].append(doc.key)
 
+            return fp
+
+    def write_canonical_data(self, doc):
+        fp = self.canonical_filepath(doc)
+
+        if fp:
             parent_dir = os.path.dirname(fp)
             try:
                 os.makedirs(parent_dir)
@@ -32,14 +44,15 @@ class Output(Reporter):
 
             doc.output_data().output_to_file(fp)
 
-    def run(self, wrapper):
-        self.wrapper=wrapper
+    def canonical_outputs(self):
+        """
+        Returns a dict of file paths and the data objects to write to them.
+        """
         self.locations = {}
+        outputs = {}
 
-        self.remove_reports_dir(self.wrapper, keep_empty_dir=True)
-        self.create_reports_dir()
-        for doc in wrapper.nodes.values():
-            if not doc.key_with_class() in wrapper.batch.docs:
+        for doc in self.wrapper.nodes.values():
+            if not doc.key_with_class() in self.wrapper.batch.docs:
                 continue
             if not doc.state in ('ran', 'consolidated'):
                 continue
@@ -47,7 +60,31 @@ class Output(Reporter):
                 continue
 
             if doc.output_data().is_canonical_output():
-                self.write_canonical_data(doc)
+                fp = self.canonical_filepath(doc)
+                if fp:
+                    outputs[fp] = doc.output_data()
+
+        return outputs
+
+    def run(self, wrapper):
+        self.wrapper=wrapper
+
+        if self.setting('incremental'):
+            manifest = self.load_manifest()
+        else:
+            manifest = None
+            self.remove_manifest()
+
+        if manifest is None:
+            self.remove_reports_dir(self.wrapper, keep_empty_dir=True)
+        self.create_reports_dir()
+
+        manifest = manifest or {}
+        files = self.write_output_files(self.canonical_outputs(), manifest)
+        self.remove_stale_output_files(files, manifest)
+
+        if self.setting('incremental'):
+            self.save_manifest(files)
 
 class LongOutput(Reporter):
     """
@@ -56,14 +93,19 @@ class LongOutput(Reporter):
     aliases = ['long']
     _settings = {
             'default' : False,
-            'dir' : 'output-long'
+            'dir' : 'output-long',
+            'incremental' : ("""Whether to only write files whose contents
+                changed since the last run, leaving unchanged files in
+                place.""", True)
             }
 
-    def run(self, wrapper):
-        self.wrapper=wrapper
-        self.create_reports_dir()
-        for doc in wrapper.nodes.values():
-            if not doc.key_with_class() in wrapper.batch.docs:
+    def long_outputs(self):
+        """
+        Returns a dict of file paths and the data objects to write to them.
+        """
+        outputs = {}
+        for doc in self.wrapper.nodes.values():
+            if not doc.key_with_class() in self.wrapper.batch.docs:
                 continue
             if not doc.state in ('ran', 'consolidated'):
                 continue
@@ -71,11 +113,20 @@ class LongOutput(Reporter):
                 continue
 
             fp = os.path.join(self.setting('dir'), doc.output_data().long_name())
+            outputs[fp] = doc.output_data()
+        return outputs
 
-            try:
-                os.makedirs(os.path.dirname(fp))
-            except os.error:
-                pass
+    def run(self, wrapper):
+        self.wrapper=wrapper
+        self.create_reports_dir()
 
-            self.log_debug("  writing %s to %s" % (doc.key, fp))
-            doc.output_data().output_to_file(fp)
+        if self.setting('incremental'):
+            manifest = self.load_manifest() or {}
+        else:
+            manifest = {}
+            self.remove_manifest()
+
+        files = self.write_output_files(self.long_outputs(), manifest)
+
+        if self.setting('incremental'):
+            self.save_manifest(files)
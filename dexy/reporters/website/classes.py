@@ -2,17 +2,23 @@ from dexy.commands.utils import print_indented
 from dexy.reporters.output import Output
 from dexy.utils import file_exists
 from dexy.utils import iter_paths
+from dexy.utils import md5_hash
 from dexy.utils import reverse_iter_paths
 from functools import partial
 from jinja2 import Environment
 from jinja2 import FileSystemLoader
+import Queue
 import dexy.data
 import dexy.exceptions
 import dexy.filters.templating_plugins
 import inspect
 import jinja2
+import jinja2.meta
+import json
 import os
 import posixpath
+import sys
+import threading
 import urlparse
 
 class Website(Output):
@@ -21,6 +27,10 @@ class Website(Output):
 
     Templates are applied to all files with .html extension which don't already
     contain "<head" or "<body" tags.
+
+    Pages are rendered by up to 'jobs' threads at a time. When running
+    incrementally, a page is only rendered again if its content, its
+    template, the navigation tree or a page it links to has changed.
     """
     aliases = ['ws']
     _other_class_settings = {
@@ -65,16 +75,29 @@ class Website(Output):
         "dir" : "output-site",
         "default-template" : ("Path to the default template to apply.", "_template.html"),
         "root" : ("Path to which the webserver will be deployed. Dexy doesn't do anything with this, but it is available to your templates", ''),
-        "default" : False
+        "default" : False,
+        "incremental" : ("""Whether to only render pages whose content, template,
+            navigation or linked pages changed since the last run. Other
+            inputs to templates, such as documents reached through 'd' or the
+            wrapper, or the current time, are not tracked, so only use this
+            if templates don't depend on them.""", False)
     }
 
     def run(self, wrapper):
         self.wrapper=wrapper
 
-        self.remove_reports_dir(self.wrapper, keep_empty_dir=True)
+        if self.setting('incremental'):
+            manifest = self.load_manifest()
+        else:
+            manifest = None
+            self.remove_manifest()
+
+        if manifest is None:
+            self.remove_reports_dir(self.wrapper, keep_empty_dir=True)
         self.create_reports_dir()
 
         self.setup()
+        self.manifest = manifest or {}
 
         if self.wrapper.target:
             msg = "Not running website reporter because a target has been specified."
@@ -85,11 +108,27 @@ class Website(Output):
             if self.should_process(doc):
                 self.process_doc(doc)
 
+        self.render_pages()
+        self.remove_stale_output_files(self.files, self.manifest)
+
+        if self.setting('incremental'):
+            self.save_manifest(self.files)
+
         self.log_debug("finished")
 
     def setup(self):
         self.keys_to_outfiles = []
         self.locations = {}
+        self.manifest = {}
+        self.files = {}
+        self.pages = []
+        self.lock = threading.Lock()
+        self.page_deps = threading.local()
+        self.template_paths = {}
+        self.jinja_envs = {}
+        self.template_digests = {}
+        self._plugin_env_data = None
+        self._site_digest = None
         self.create_reports_dir()
         self.setup_navobj()
 
@@ -122,7 +161,7 @@ class Website(Output):
 
         elif isinstance(doc.output_data(), dexy.data.Sectioned):
             assert output_ext == ".json"
-            self.apply_and_render_template(doc)
+            self.add_page(doc)
 
         else:
             self.write_canonical_data(doc)
@@ -137,13 +176,16 @@ class Website(Output):
             self.write_canonical_data(doc)
 
         else:
-            self.apply_and_render_template(doc)
+            self.add_page(doc)
+
+    def write_canonical_data(self, doc):
+        fp = self.canonical_filepath(doc)
+        if fp:
+            self.files[fp] = self.write_output_file(fp, doc.output_data(),
+                    self.manifest)
 
     def detect_html_header(self, doc):
-        fragments = ('<html', '<body', '<head')
-        return any(html_fragment
-                      in unicode(doc.output_data())
-                      for html_fragment in fragments)
+        return doc.output_data().has_html_header()
 
     def create_navobj(self):
         navobj = Navigation()
@@ -158,11 +200,16 @@ class Website(Output):
         else:
             template_file = self.setting('default-template')
 
-        template_path = None
-        for subpath in reverse_iter_paths(doc.name):
-            template_path = os.path.join(subpath, template_file)
-            if file_exists(template_path):
-                break
+        # Documents in the same directory use the same template.
+        template_key = (posixpath.dirname(doc.name), template_file)
+        template_path = self.template_paths.get(template_key)
+
+        if not template_path:
+            for subpath in reverse_iter_paths(doc.name):
+                template_path = os.path.join(subpath, template_file)
+                if file_exists(template_path):
+                    break
+            self.template_paths[template_key] = template_path
 
         if not template_path:
             msg = "no template path for %s" % doc.key
@@ -192,6 +239,103 @@ class Website(Output):
 
         return env
 
+    def cached_jinja_environment(self, template_path):
+        """
+        Returns a jinja Environment shared by all templates in the same
+        directory, so compiled templates are reused between pages.
+        """
+        template_dir = os.path.dirname(template_path)
+        with self.lock:
+            if not template_dir in self.jinja_envs:
+                self.jinja_envs[template_dir] = self.jinja_environment(template_path)
+            return self.jinja_envs[template_dir]
+
+    def template_digest(self, template_path):
+        """
+        Returns a digest of the template at template_path and all templates
+        it extends, includes or imports, or None if these can't be found.
+        """
+        if template_path in self.template_digests:
+            return self.template_digests[template_path]
+
+        env = self.cached_jinja_environment(template_path)
+        sources = {}
+        pending = [template_path]
+        digest = None
+
+        try:
+            while pending:
+                name = pending.pop()
+                if name in sources:
+                    continue
+
+                source = env.loader.get_source(env, name)[0]
+                sources[name] = md5_hash(source.encode('utf-8'))
+
+                for ref in jinja2.meta.find_referenced_templates(env.parse(source)):
+                    if ref is None:
+                        raise jinja2.TemplateNotFound(name)
+                    pending.append(ref)
+
+            digest = md5_hash(json.dumps(sorted(sources.items())))
+        except jinja2.TemplateError:
+            pass
+
+        self.template_digests[template_path] = digest
+        return digest
+
+    def site_digest(self):
+        """
+        Returns a digest of the navigation tree and the reporter settings,
+        which every page can make use of.
+        """
+        if self._site_digest is None:
+            nav = []
+            for path in sorted(self._navobj.nodes):
+                node = self._navobj.nodes[path]
+                nav.append([path,
+                    [(data.output_name(), data.title()) for data in node.docs],
+                    node.index_page and node.index_page.output_name()])
+
+            info = [self.setting_values(), self.wrapper.globals, nav]
+            self._site_digest = md5_hash(json.dumps(info, sort_keys=True, default=repr))
+        return self._site_digest
+
+    def page_fingerprint(self, doc, template_path):
+        """
+        Returns a digest of everything a page's rendering depends on, apart
+        from the pages it links to, or None if this can't be determined.
+        """
+        data = doc.output_data()
+        content_digest = self.output_digest(data)
+        template_digest = self.template_digest(template_path)
+        if not content_digest or not template_digest:
+            return None
+
+        ws_settings = [doc.safe_setting(k) for k in sorted(doc.setting_values())
+                if k.startswith('apply-ws-to-content') or k == 'ws-template']
+
+        info = [content_digest, template_digest, template_path,
+                self.site_digest(), data.setting_values(), ws_settings]
+        return md5_hash(json.dumps(info, sort_keys=True, default=repr))
+
+    def add_page_dependency(self, link_to):
+        """
+        Records that the page being rendered in this thread uses the
+        document with link index entry link_to.
+        """
+        deps = getattr(self.page_deps, 'deps', None)
+        if deps is not None:
+            deps[link_to['storage-key']] = link_to['file']
+
+    def dependencies_unchanged(self, deps):
+        entries = self.wrapper.link_index.entries or {}
+        for storage_key, file_info in deps:
+            entry = entries.get(storage_key)
+            if not entry or entry['file'] != file_info:
+                return False
+        return True
+
     def apply_jinja_to_page_content(self, doc, env_data):
         args = {
                 'undefined' : jinja2.StrictUndefined
@@ -217,8 +361,18 @@ class Website(Output):
             self.log_debug("Env args:\n%s" % args)
             raise
 
+    def plugin_env_data(self):
+        """
+        Runs the template plugins once and returns their output for all
+        pages to share.
+        """
+        with self.lock:
+            if self._plugin_env_data is None:
+                self._plugin_env_data = self.run_plugins()
+            return self._plugin_env_data
+
     def template_environment(self, doc, template_path):
-        raw_env_data = self.run_plugins()
+        raw_env_data = dict(self.plugin_env_data())
         raw_env_data.update(self.website_specific_template_environment(doc.output_data(), {
             'template_source' : ("The directory containing the template file used.",
                 template_path)
@@ -239,28 +393,95 @@ class Website(Output):
         basename, ext = os.path.splitext(filename)
         return "%s.html" % basename
 
-    def apply_and_render_template(self, doc):
-        template_info = self.template_file_and_path(doc)
-        template_file, template_path = template_info
-        env_data = self.template_environment(doc, template_path)
+    def page_output_path(self, doc):
+        output_file = self.fix_ext(doc.output_data().output_name())
+        return os.path.join(self.setting('dir'), output_file)
+
+    def add_page(self, doc):
+        """
+        Queues doc to be rendered with its template, unless the page written
+        last time is still up to date.
+        """
+        template_file, template_path = self.template_file_and_path(doc)
+        output_path = self.page_output_path(doc)
+        fingerprint = self.page_fingerprint(doc, template_path)
 
-        self.log_debug("  creating jinja environment")
-        env = self.jinja_environment(template_path)
+        entry = self.manifest.get(output_path)
+        if fingerprint and entry and entry[0][0] == fingerprint:
+            if self.dependencies_unchanged(entry[0][1]) and \
+                    self.output_file_unchanged(output_path, entry):
+                self.log_debug("  %s is up to date" % output_path)
+                self.files[output_path] = entry
+                return
+
+        self.pages.append((doc, template_path, output_path, fingerprint))
+
+    def render_pages(self):
+        """
+        Renders the queued pages, using up to 'jobs' threads.
+        """
+        pages = Queue.Queue()
+        for page in self.pages:
+            pages.put(page)
+
+        errors = []
+        def worker():
+            while not errors:
+                try:
+                    page = pages.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    self.render_queued_page(*page)
+                except Exception as e:
+                    errors.append((e, sys.exc_info()[2]))
+
+        jobs = min(int(self.wrapper.jobs), len(self.pages))
+        if jobs > 1:
+            threads = [threading.Thread(target=worker) for i in range(jobs)]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            for t in threads:
+                t.join()
+        else:
+            worker()
+
+        self.pages = []
+        if errors:
+            e, tb = errors[0]
+            raise e, None, tb
+
+    def render_queued_page(self, doc, template_path, output_path, fingerprint):
+        self.page_deps.deps = {}
+        try:
+            self.render_page(doc, template_path, output_path)
+            deps = tuple(sorted(self.page_deps.deps.iteritems()))
+        finally:
+            self.page_deps.deps = None
+
+        entry = self.output_file_entry(output_path, (fingerprint, deps))
+        with self.lock:
+            self.files[output_path] = entry
+
+    def render_page(self, doc, template_path, output_path):
+        env_data = self.template_environment(doc, template_path)
+        env = self.cached_jinja_environment(template_path)
 
         self.log_debug("  loading jinja template at %s" % template_path)
         template = env.get_template(template_path)
-       
-        output_file = self.fix_ext(doc.output_data().output_name())
-        output_path = os.path.join(self.setting('dir'), output_file)
 
-        try:
-            os.makedirs(os.path.dirname(output_path))
-        except os.error:
-            pass
+        self.prepare_output_file(output_path)
 
         self.log_debug("  writing to %s" % (output_path))
         template.stream(env_data).dump(output_path, encoding="utf-8")
 
+    def apply_and_render_template(self, doc):
+        template_info = self.template_file_and_path(doc)
+        template_file, template_path = template_info
+        self.render_page(doc, template_path, self.page_output_path(doc))
+
     def help(self, data):
         nodoc = ('navobj', 'navigation',)
         print_indented("Website Template Environment Variables:", 4)
@@ -356,53 +577,53 @@ class Website(Output):
         Returns an HTML link to section without needing to specify which
         document it is in (section name must be globally unique).
         """
-        matching_nodes = self.wrapper.lookup_sections.get(section_name)
+        matching_entries = self.wrapper.link_index.find_sections(section_name)
 
-        if not matching_nodes:
+        if not matching_entries:
             msg = "Trying to create a link in %s but no section found matching '%s'"
             msgargs = (data.key, section_name,)
             raise dexy.exceptions.UserFeedback(msg % msgargs)
-        elif len(matching_nodes) > 1:
+        elif len(matching_entries) > 1:
             # TODO make it an option to select a default where there is
             # more than one option
             msg = "Trying to create a link in %s to '%s' but multiple docs match."
             msgargs = (data.key, section_name,)
             raise dexy.exceptions.UserFeedback(msg % msgargs)
 
-        assert len(matching_nodes) == 1
-        link_to_data = matching_nodes[0]
-        section = link_to_data[section_name]
-        anchor = section['id']
+        assert len(matching_entries) == 1
+        link_to = matching_entries[0]
+        self.add_page_dependency(link_to)
+        anchor = link_to['sections'][section_name]
         if not link_text:
             link_text = section_name
 
-        return self.link_for(url_base, data.relative_path_to(link_to_data.output_name()), link_text, anchor)
+        return self.link_for(url_base, data.relative_path_to(link_to['output-name']), link_text, anchor)
 
     def link(self, data, doc_key, section_name=None, url_base=None, link_text = None, description=False):
         """
         Returns an HTML link to document, optionally with an anchor linking to section.
         """
-        matching_nodes = self.wrapper.lookup_nodes.get(doc_key)
+        matching_entries = self.wrapper.link_index.find_docs(doc_key)
 
-        if not matching_nodes:
+        if not matching_entries:
             msg = "Trying to create a link in %s but no doc found matching '%s'"
             msgargs = (data.key, doc_key,)
             raise dexy.exceptions.UserFeedback(msg % msgargs)
-        elif len(matching_nodes) > 1:
+        elif len(matching_entries) > 1:
             # TODO make it an option to select a default where there is
             # more than one option
             msg = "Trying to create a link to '%s' but multiple docs match."
             msgargs = (doc_key,)
             raise dexy.exceptions.UserFeedback(msg % msgargs)
 
-        assert len(matching_nodes) == 1
-        link_to_data = matching_nodes[0]
+        assert len(matching_entries) == 1
+        link_to = matching_entries[0]
+        self.add_page_dependency(link_to)
         anchor = None
 
         if section_name:
-            if section_name in link_to_data.keys():
-                section = link_to_data[section_name]
-                anchor = section['id']
+            if section_name in link_to['sections']:
+                anchor = link_to['sections'][section_name]
                 if not link_text:
                     link_text = section_name
             else:
@@ -411,15 +632,15 @@ class Website(Output):
                 raise dexy.exceptions.UserFeedback(msg % msgargs)
         else:
             if not link_text:
-                link_text = link_to_data.title()
+                link_text = link_to['title']
 
 
-        relative_link_to = data.relative_path_to(link_to_data.output_name())
+        relative_link_to = data.relative_path_to(link_to['output-name'])
 
         link_html = self.link_for(url_base, relative_link_to, link_text, anchor)
 
-        if description and link_to_data.safe_setting('description'):
-            return "%s\n<p>%s</p>" % (link_html, link_to_data.setting('description'))
+        if description and link_to['description']:
+            return "%s\n<p>%s</p>" % (link_html, link_to['description'])
         else:
             return link_html
 
@@ -106,6 +106,88 @@ class GenericStorage(Storage):
         with open(self.data_file(read=True), "rb") as f:
             return f.read()
 
+    def index_files(self, this):
+        """
+        Files other than the data file which need to move with it between
+        the last/ and this/ cache dirs.
+        """
+        if this:
+            return [self.metadata_file(self.this_data_file())]
+        else:
+            return [self.metadata_file(self.last_data_file())]
+
+    def metadata_file(self, data_file):
+        return "%s-meta" % data_file
+
+    def read_metadata(self):
+        """
+        Returns the dict of metadata saved for the data file, or None if
+        there is no metadata matching the current data file.
+        """
+        data_file = self.data_file()
+        try:
+            with open(self.metadata_file(data_file), "rb") as f:
+                metadata = json.load(f)
+            stat = os.stat(data_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if metadata['size'] != stat.st_size or metadata['mtime'] != stat.st_mtime:
+            return None
+        return metadata['info']
+
+    def write_metadata(self, info):
+        """
+        Saves a dict of metadata which stays valid until the data file
+        changes.
+        """
+        data_file = self.data_file()
+        try:
+            stat = os.stat(data_file)
+        except OSError:
+            return
+
+        metadata = {
+                'info' : info,
+                'size' : stat.st_size,
+                'mtime' : stat.st_mtime
+                }
+        with open(self.metadata_file(data_file), "wb") as f:
+            json.dump(metadata, f)
+
+    def open_data(self, mode="rb"):
+        """
+        Returns an open file object for the data file. Files opened for
+        writing are always in the this/ cache dir.
+        """
+        if "r" in mode:
+            return open(self.data_file(read=True), mode)
+        else:
+            filepath = self.data_file(read=False)
+            self.assert_location_is_in_project_dir(filepath)
+            return open(filepath, mode)
+
+    def iter_data(self, chunk_size=65536):
+        """
+        Yields the contents of the data file in chunks of chunk_size bytes.
+        """
+        with self.open_data("rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def write_chunks(self, chunks):
+        """
+        Writes an iterable of str or unicode chunks to the data file.
+        """
+        with self.open_data("wb") as f:
+            for chunk in chunks:
+                if isinstance(chunk, unicode):
+                    chunk = chunk.encode("utf-8")
+                f.write(chunk)
+
     def copy_file(self, filepath):
         """
         If data file exists, copy file and return true. Otherwise return false.
@@ -123,6 +205,10 @@ import json
 class JsonSectionedStorage(GenericStorage):
     """
     Storage for sectional data using JSON.
+
+    Alongside the JSON file, an index file records the position of each
+    section within it, so single sections can be read without loading the
+    whole document.
     """
     aliases = ['jsonsectioned']
 
@@ -135,13 +221,78 @@ class JsonSectionedStorage(GenericStorage):
             return data
 
     def write_data(self, data, filepath=None):
+        write_index = not filepath
         if not filepath:
             filepath = self.data_file()
 
         self.assert_location_is_in_project_dir(filepath)
 
+        # Same output as json.dump, but recording where each item starts.
+        offsets = []
         with open(filepath, "wb") as f:
-            json.dump(data, f)
+            f.write("[")
+            for i, item in enumerate(data):
+                if i > 0:
+                    f.write(", ")
+                item_json = json.dumps(item)
+                offsets.append((f.tell(), len(item_json)))
+                f.write(item_json)
+            f.write("]")
+
+        if write_index:
+            self.write_index(filepath, data, offsets)
+
+    def index_file(self, data_file):
+        return "%s-index" % data_file
+
+    def index_files(self, this):
+        if this:
+            data_file = self.this_data_file()
+        else:
+            data_file = self.last_data_file()
+        return GenericStorage.index_files(self, this) + [self.index_file(data_file)]
+
+    def write_index(self, data_file, data, offsets):
+        stat = os.stat(data_file)
+        index = {
+                'names' : [section.get('name') for section in data[1:]],
+                'ids' : [section.get('id') for section in data[1:]],
+                'offsets' : offsets,
+                'size' : stat.st_size,
+                'mtime' : stat.st_mtime
+                }
+        with open(self.index_file(data_file), "wb") as f:
+            json.dump(index, f)
+
+    def read_index(self):
+        """
+        Returns the index for the data file, or None if there is no index
+        matching the current data file.
+        """
+        data_file = self.data_file()
+        try:
+            with open(self.index_file(data_file), "rb") as f:
+                index = json.load(f)
+            stat = os.stat(data_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if index['size'] != stat.st_size or index['mtime'] != stat.st_mtime:
+            return None
+
+        index['positions'] = {}
+        for i, name in enumerate(index['names']):
+            index['positions'].setdefault(name, i)
+        return index
+
+    def read_item(self, index, i):
+        """
+        Reads item i of the stored list (section i-1, item 0 is metadata).
+        """
+        offset, length = index['offsets'][i]
+        with open(self.data_file(), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
 
 # Key Value Data
 class JsonKeyValueStorage(GenericStorage):
@@ -156,6 +307,9 @@ class JsonKeyValueStorage(GenericStorage):
     def append(self, key, value):
         self._data[key] = value
 
+    def append_many(self, items):
+        self._data.update(items)
+
     def keys(self):
         return self.data().keys()
 
@@ -207,12 +361,15 @@ class Sqlite3KeyValueStorage(GenericStorage):
                 )
         return os.path.join(*pathargs)
 
+    # Number of appended rows to hold before inserting them in one batch.
+    append_batch_size = 1000
+
     def connect(self):
-        self._append_counter = 0
+        self._pending = []
         if self.wrapper.state in ('walked', 'checked', 'running'):
             if file_exists(self.this_data_file()):
                 self.connected_to = 'existing'
-                self._storage = sqlite3.connect(self.this_data_file())
+                self._storage = sqlite3.connect(self.this_data_file(), check_same_thread=False)
                 self._cursor = self._storage.cursor()
             elif file_exists(self.last_data_file()):
                 msg ="Should not only have last data file %s"
@@ -222,52 +379,77 @@ class Sqlite3KeyValueStorage(GenericStorage):
                 assert not os.path.exists(self.working_file())
                 assert os.path.exists(os.path.dirname(self.working_file()))
                 self.connected_to = 'working'
-                self._storage = sqlite3.connect(self.working_file())
+                self._storage = sqlite3.connect(self.working_file(), check_same_thread=False)
                 self._cursor = self._storage.cursor()
+                # The working file is only moved into the cache once it is
+                # complete, so it does not need a rollback journal.
+                self._cursor.execute("PRAGMA journal_mode = OFF")
+                self._cursor.execute("PRAGMA synchronous = OFF")
                 self._cursor.execute("CREATE TABLE kvstore (key TEXT, value TEXT)")
         elif self.wrapper.state == 'walked':
             raise dexy.exceptions.InternalDexyProblem("connect should not be called in 'walked' state")
         else:
             if file_exists(self.last_data_file()):
-                self._storage = sqlite3.connect(self.last_data_file())
+                self._storage = sqlite3.connect(self.last_data_file(), check_same_thread=False)
                 self._cursor = self._storage.cursor()
             elif file_exists(self.this_data_file()):
-                self._storage = sqlite3.connect(self.this_data_file())
+                self._storage = sqlite3.connect(self.this_data_file(), check_same_thread=False)
                 self._cursor = self._storage.cursor()
             else:
                 raise dexy.exceptions.InternalDexyProblem("no data for %s" % self.storage_key)
 
     def append(self, key, value):
-        self._cursor.execute("INSERT INTO kvstore VALUES (?, ?)", (key, value))
-        self._append_counter += 1
-        if self._append_counter > 1000:
-            self.wrapper.log.debug("intermediate commit to sqlite db, resetting append counter to 0")
-            self._storage.commit()
-            self._append_counter = 0
+        self._pending.append((key, value))
+        if len(self._pending) >= self.append_batch_size:
+            self.flush()
+
+    def append_many(self, items):
+        """
+        Appends an iterable of (key, value) pairs.
+        """
+        self.flush()
+        self._cursor.executemany("INSERT INTO kvstore VALUES (?, ?)", items)
+
+    def flush(self):
+        """
+        Inserts any rows held by append.
+        """
+        if self._pending:
+            self._cursor.executemany("INSERT INTO kvstore VALUES (?, ?)", self._pending)
+            self._pending = []
+
+    def execute(self, sql, params=()):
+        """
+        Runs a query on a new cursor, so results can be iterated over while
+        other queries are made.
+        """
+        self.flush()
+        return self._storage.execute(sql, params)
 
     def keys(self):
-        self._cursor.execute("SELECT key from kvstore")
-        return [unicode(k[0]) for k in self._cursor.fetchall()]
+        return [unicode(k) for (k,) in self.execute("SELECT key from kvstore")]
 
     def iteritems(self):
-        self._cursor.execute("SELECT key, value from kvstore")
-        for k in self._cursor.fetchall():
-            yield (unicode(k[0]), k[1])
+        for k, v in self.execute("SELECT key, value from kvstore"):
+            yield (unicode(k), v)
 
     def items(self):
         return [(key, value) for (key, value) in self.iteritems()]
 
     def value(self, key):
-        self._cursor.execute("SELECT value from kvstore where key = ?", (key,))
-        row = self._cursor.fetchone()
+        row = self.execute("SELECT value from kvstore where key = ?", (key,)).fetchone()
         if not row:
             raise Exception("No value found for key '%s'" % key)
         else:
             return row[0]
 
     def like(self, key):
-        self._cursor.execute("SELECT value from kvstore where key LIKE ?", (key,))
-        row = self._cursor.fetchone()
+        row = None
+        if not "%" in key and not "_" in key:
+            # Try an exact match first, which can use the index on key.
+            row = self.execute("SELECT value from kvstore where key = ?", (key,)).fetchone()
+        if not row:
+            row = self.execute("SELECT value from kvstore where key LIKE ?", (key,)).fetchone()
         if not row:
             raise Exception("No value found for key '%s'" % key)
         else:
@@ -276,19 +458,30 @@ class Sqlite3KeyValueStorage(GenericStorage):
     def query(self, query):
         if not '%' in query:
             query = "%%%s%%" % query
-        self._cursor.execute("SELECT * from kvstore where key like ?", (query,))
-        return self._cursor.fetchall()
+        return self.execute("SELECT * from kvstore where key like ?", (query,)).fetchall()
 
     def __getitem__(self, key):
         return self.value(key)
 
     def persist(self):
+        self.flush()
         if self.connected_to == 'existing':
             assert os.path.exists(self.data_file(read=False))
+            self._storage.commit()
         elif self.connected_to == 'working':
-            self.assert_location_is_in_project_dir(self.data_file(read=False))
+            data_file = self.data_file(read=False)
+            self.assert_location_is_in_project_dir(data_file)
+            self._cursor.execute("CREATE INDEX IF NOT EXISTS kvstore_key ON kvstore (key)")
             self._storage.commit()
-            shutil.copyfile(self.working_file(), self.data_file(read=False))
+            self._storage.close()
+            try:
+                os.rename(self.working_file(), data_file)
+            except OSError:
+                shutil.copyfile(self.working_file(), data_file)
+
+            self.connected_to = 'existing'
+            self._storage = sqlite3.connect(data_file, check_same_thread=False)
+            self._cursor = self._storage.cursor()
         else:
             msg = "Unexpected 'connected_to' value %s"
             msgargs = self.connected_to
@@ -26,6 +26,7 @@ def copy_or_link(data, destination, use_links=True, read_only_links=True):
 
 defaults = {
     'artifacts_dir' : '.dexy',
+    'artifact_store_runs' : 10,
     'config_file' : 'dexy.conf',
     'configs' : '',
     'debug' : False,
@@ -38,8 +39,10 @@ defaults = {
     'full' : False,
     'globals' : '',
     'hashfunction' : 'md5',
+    'highlight_cache_entries' : 10000,
     'ignore_nonzero_exit' : False,
     'include' : '',
+    'jobs' : 1,
     'log_dir' : '.dexy',
     'log_file' : 'dexy.log',
     'log_format' : "%(name)s - %(levelname)s - %(message)s",
@@ -112,6 +115,27 @@ def logging_log_level(log_level):
 def md5_hash(text):
     return hashlib.md5(text).hexdigest()
 
+def md5_file(filepath, chunk_size=65536):
+    """
+    Returns the md5 hex digest of a file's contents, read in chunks.
+    """
+    h = hashlib.md5()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def mtime_is_racy(mtime, now=None, interval=2):
+    """
+    Returns True if a file or directory with this mtime was modified too
+    recently for information saved with its stat to be trusted on the next
+    run, since a further change within the same mtime tick would not alter
+    its stat.
+    """
+    if now is None:
+        now = time.time()
+    return now - mtime <= interval
+
 def dict_from_string(text):
     """
     Creates a dict from string like "key1=value1,k2=v2"
@@ -0,0 +1,172 @@
+import json
+import os
+import Queue
+import subprocess
+import threading
+
+class VersionProbes(object):
+    """
+    Cache of the output of filters' version commands.
+
+    Results are keyed by the version command and the path, mtime and inode
+    of the executable it calls, so a result is reused until the executable
+    is replaced. Commands whose executable can't be found are keyed by the
+    PATH they were looked up on. Results are saved to a file so they carry
+    over to later runs, and each command's result is remembered for the
+    rest of the run once it has been looked up.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filename = None
+        self.results = {}
+        self.saved = {}
+        self.memo = {}
+
+    def load(self, filename):
+        """
+        Loads results saved in filename, and saves new results there. Called
+        at the start of each run.
+        """
+        filename = os.path.abspath(filename)
+        with self.lock:
+            self.memo = {}
+            if filename == self.filename:
+                return
+
+            self.filename = filename
+            try:
+                with open(filename, "rb") as f:
+                    self.saved = json.load(f)
+            except (IOError, ValueError):
+                self.saved = {}
+
+    def save(self):
+        with self.lock:
+            if not self.filename or not os.path.isdir(os.path.dirname(self.filename)):
+                return
+
+            tmp_filename = "%s-tmp" % self.filename
+            with open(tmp_filename, "wb") as f:
+                json.dump(self.saved, f)
+            os.rename(tmp_filename, self.filename)
+
+    def executable_path(self, command):
+        """
+        Returns the absolute path of the executable called by command, or
+        None if it can't be found.
+        """
+        name = command.split()[0]
+        if os.path.dirname(name):
+            paths = [os.path.abspath(name)]
+        else:
+            paths = [os.path.join(d, name)
+                    for d in os.environ.get('PATH', '').split(os.pathsep)]
+
+        for path in paths:
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                return os.path.realpath(path)
+
+    def key(self, command):
+        """
+        Returns the key for command's result.
+        """
+        path = self.executable_path(command)
+        if path:
+            stat = os.stat(path)
+            return "%s\t%s\t%s\t%s" % (command, path, stat.st_mtime, stat.st_ino)
+        else:
+            return "%s\tnot found\t%s" % (command, os.environ.get('PATH', ''))
+
+    def run(self, command):
+        proc = subprocess.Popen(
+                   command,
+                   shell=True,
+                   stdout=subprocess.PIPE,
+                   stderr=subprocess.STDOUT
+               )
+
+        stdout, stderr = proc.communicate()
+        if proc.returncode > 0:
+            return False
+        else:
+            return stdout.strip().split("\n")[0]
+
+    def cached(self, key):
+        with self.lock:
+            if key in self.results:
+                return (True, self.results[key])
+            elif key in self.saved:
+                return (True, self.saved[key])
+            else:
+                return (False, None)
+
+    def store(self, key, version):
+        with self.lock:
+            self.results[key] = version
+            self.saved[key] = version
+
+    def version(self, command):
+        """
+        Returns the first line of output of command, or False if it fails.
+        """
+        with self.lock:
+            if command in self.memo:
+                return self.memo[command]
+
+        key = self.key(command)
+        found, version = self.cached(key)
+        if not found:
+            version = self.run(command)
+            self.store(key, version)
+            self.save()
+
+        with self.lock:
+            self.memo[command] = version
+        return version
+
+    def probe_all(self, commands, jobs=8):
+        """
+        Runs any of commands which don't have a cached result, with up to
+        jobs commands running at a time.
+        """
+        pending = Queue.Queue()
+        for command in set(commands):
+            key = self.key(command)
+            if not self.cached(key)[0]:
+                pending.put((command, key))
+
+        if pending.empty():
+            return
+
+        def worker():
+            while True:
+                try:
+                    command, key = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                self.store(key, self.run(command))
+
+        threads = [threading.Thread(target=worker)
+                for i in range(min(jobs, pending.qsize()))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.save()
+
+probes = VersionProbes()
+
+def probe_filter_versions(filter_instances, jobs=8):
+    """
+    Runs the version commands of all filter_instances which have them in
+    parallel, so later calls to their version() methods use cached results.
+    """
+    commands = []
+    for filter_instance in filter_instances:
+        if hasattr(filter_instance, 'version_command'):
+            command = filter_instance.version_command()
+            if command:
+                commands.append(command)
+    probes.probe_all(commands, jobs)
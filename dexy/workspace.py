@@ -0,0 +1,107 @@
+from dexy.utils import copy_or_link
+from dexy.utils import md5_hash
+import json
+import os
+import posixpath
+import shutil
+import threading
+
+class InputTrees(object):
+    """
+    Directory trees holding the outputs of sets of input documents under
+    their canonical names.
+
+    Filter workspaces symlink to directories in these trees instead of
+    linking each input file separately. A tree is identified by the names
+    and file identities of its inputs, so it is kept and reused in later
+    runs for as long as none of its inputs change.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.lock = threading.Lock()
+        self.used = set()
+
+    def trees_dir(self):
+        return os.path.join(self.wrapper.artifacts_dir, "inputs")
+
+    def tree_key(self, datas):
+        info = []
+        for data in datas:
+            stat = os.stat(data.storage.data_file())
+            info.append((data.name, stat.st_ino, stat.st_size, stat.st_mtime))
+        return md5_hash(json.dumps(sorted(info)))
+
+    def tree(self, datas):
+        """
+        Returns the path to a tree containing datas, building it if it does
+        not already exist.
+        """
+        key = self.tree_key(datas)
+        tree_dir = os.path.join(self.trees_dir(), key)
+
+        with self.lock:
+            self.used.add(key)
+            if not os.path.exists(tree_dir):
+                self.build_tree(datas, tree_dir)
+
+        return tree_dir
+
+    def build_tree(self, datas, tree_dir):
+        tmp_dir = "%s-tmp" % tree_dir
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+
+        for data in datas:
+            filepath = os.path.join(tmp_dir, data.name)
+            parent_dir = os.path.dirname(filepath)
+            if not os.path.exists(parent_dir):
+                os.makedirs(parent_dir)
+
+            try:
+                copy_or_link(data, filepath)
+            except OSError as e:
+                self.wrapper.log.debug("problem adding %s to input tree" % data.key)
+                self.wrapper.log.debug(e)
+
+        os.rename(tmp_dir, tree_dir)
+
+    def collect_garbage(self):
+        """
+        Removes trees which were not used in this run.
+        """
+        trees_dir = self.trees_dir()
+        if not os.path.exists(trees_dir):
+            return
+
+        for key in os.listdir(trees_dir):
+            if not key in self.used:
+                shutil.rmtree(os.path.join(trees_dir, key))
+
+def must_be_real_dir(dirpath, protected_dirs):
+    """
+    Returns True if dirpath is one of protected_dirs, or is inside or is a
+    parent of one of them. Files may be written into these directories when
+    a filter runs, so they can't be symlinks into a shared input tree.
+    """
+    for protected in protected_dirs:
+        if not protected:
+            return True
+        elif dirpath == protected:
+            return True
+        elif dirpath.startswith(protected + "/"):
+            return True
+        elif protected.startswith(dirpath + "/"):
+            return True
+    return False
+
+def symlinked_dir(filepath, protected_dirs):
+    """
+    Returns the outermost parent directory of filepath which can be a
+    symlink into an input tree, or None if the file must be linked directly.
+    """
+    parts = posixpath.dirname(filepath).split("/")
+    for i in range(1, len(parts)+1):
+        dirpath = "/".join(parts[0:i])
+        if dirpath and not must_be_real_dir(dirpath, protected_dirs):
+            return dirpath
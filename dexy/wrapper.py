@@ -1,21 +1,33 @@
+from dexy.exceptions import CircularDependency
 from dexy.exceptions import DeprecatedException
 from dexy.exceptions import InternalDexyProblem
 from dexy.exceptions import UserFeedback
 from dexy.utils import file_exists
 from dexy.utils import s
 import chardet
+import dexy.argindex
+import dexy.artifacts
 import dexy.batch
+import dexy.compiled
 import dexy.doc
+import dexy.filemap
+import dexy.hashindex
+import dexy.highlight
+import dexy.links
 import dexy.parser
 import dexy.reporter
 import dexy.utils
+import dexy.versions
+import dexy.workspace
 import logging
 import logging.handlers
 import os
 import posixpath
+import Queue
 import shutil
 import sys
 import textwrap
+import threading
 import time
 import uuid
 
@@ -83,8 +95,20 @@ class Wrapper(object):
         self.project_root_ts = "%s%s" % (self.project_root, os.sep)
         self.state = None
         self.current_task = None
-        self.lookup_nodes = {} # map of shortcuts/keys to all nodes which can match
-        self.lookup_sections = {} # map of section names to nodes
+        self._lookup_nodes = None
+        self._lookup_sections = None
+        self.link_index = dexy.links.LinkIndex(self)
+        self.artifact_store = dexy.artifacts.ArtifactStore(self)
+        self.hash_index = dexy.hashindex.HashIndex(self)
+        self.arg_index = dexy.argindex.ArgIndex(self)
+        self.input_trees = dexy.workspace.InputTrees(self)
+        self.compiled_executables = dexy.compiled.CompiledExecutables(self)
+        self.highlight_cache = dexy.highlight.HighlightCache(self)
+        self.template_plugin_cache = {}
+        self.jinja_envs = {}
+        self.jinja_envs_lock = threading.Lock()
+        self.input_graph_version = 0
+        self.input_graph_lock = threading.Lock()
         self.transition('new')
 
     def state_message(self):
@@ -124,12 +148,11 @@ class Wrapper(object):
     def check(self):
         # Clean and reset working dirs.
         self.reset_work_cache_dir()
-        if not os.path.exists(self.this_cache_dir()):
-            self.create_cache_dir_with_sub_dirs(self.this_cache_dir())
 
         # Load information about arguments from previous batch.
         self.load_node_argstrings()
 
+        self.load_version_probes()
         self.check_cache()
         self.consolidate_cache()
 
@@ -147,10 +170,49 @@ class Wrapper(object):
         """
         Move all cache files from last/ cache to this/ cache
         """
-        for node in self.roots:
-            node.consolidate_cache_files()
+        if os.path.exists(self.this_cache_dir()) or not os.path.exists(self.last_cache_dir()):
+            # Move cached documents' files one by one.
+            if not os.path.exists(self.this_cache_dir()):
+                self.create_cache_dir_with_sub_dirs(self.this_cache_dir())
+
+            for node in self.roots:
+                node.consolidate_cache_files()
+
+            self.trash(self.last_cache_dir())
+
+        else:
+            # Rename the whole cache dir, then remove files which don't
+            # belong to a cached document.
+            os.rename(self.last_cache_dir(), self.this_cache_dir())
 
-        self.trash(self.last_cache_dir())
+            for node in self.roots:
+                node.consolidate_cache_files()
+
+            self.remove_uncached_files()
+
+    def remove_uncached_files(self):
+        """
+        Removes files from this/ cache which don't belong to documents that
+        are being reused from the cache.
+        """
+        keep = set()
+        for doc in self.documents():
+            if doc.state == 'consolidated':
+                keep.update(doc.cache_file_relpaths())
+
+        cache_dir = self.this_cache_dir()
+        for subdir in os.listdir(cache_dir):
+            for filename in os.listdir(os.path.join(cache_dir, subdir)):
+                relpath = os.path.join(subdir, filename)
+                if not relpath in keep:
+                    os.remove(os.path.join(cache_dir, relpath))
+
+    def load_version_probes(self):
+        """
+        Loads saved results of filter version commands. Version commands are
+        only run when a filter's version is needed for an artifact key.
+        """
+        dexy.versions.probes.load(os.path.join(self.artifacts_dir, "versions.json"))
 
     def to_checked(self):
         self.check()
@@ -224,9 +286,12 @@ class Wrapper(object):
             matches = self.roots
 
         try:
-            for node in matches:
-                for task in node:
-                    task()
+            if self.jobs > 1:
+                self.run_in_parallel(matches)
+            else:
+                for node in matches:
+                    for task in node:
+                        task()
 
         except Exception as e:
             self.error = e
@@ -244,18 +309,148 @@ class Wrapper(object):
         else:
             self.after_successful_run()
 
+    def dependency_graph(self, matches):
+        """
+        Returns a dict mapping each node reachable from matches to the list of
+        nodes which must have finished before that node can run.
+        """
+        graph = {}
+
+        def visit(node):
+            if not node in graph:
+                graph[node] = node.input_nodes(True)
+                for inpt in graph[node]:
+                    visit(inpt)
+
+        for node in matches:
+            visit(node)
+
+        return graph
+
+    def run_in_parallel(self, matches):
+        """
+        Runs nodes using a pool of worker threads, dispatching each node as
+        soon as all the nodes it depends on have finished.
+        """
+        graph = self.dependency_graph(matches)
+
+        waiting_on = dict((node, set(deps)) for node, deps in graph.iteritems())
+        dependents = dict((node, []) for node in graph)
+        for node, deps in graph.iteritems():
+            for dep in deps:
+                dependents[dep].append(node)
+
+        ready = Queue.Queue()
+        finished = Queue.Queue()
+
+        def worker():
+            while True:
+                node = ready.get()
+                if node is None:
+                    break
+                try:
+                    for task in node:
+                        task()
+                    finished.put((node, None))
+                except Exception as e:
+                    finished.put((node, (e, sys.exc_info()[2])))
+
+        workers = [threading.Thread(target=worker) for i in range(self.jobs)]
+        for t in workers:
+            t.daemon = True
+            t.start()
+
+        running = 0
+        for node, deps in waiting_on.iteritems():
+            if not deps:
+                ready.put(node)
+                running += 1
+
+        failed = None
+        remaining = len(graph)
+        try:
+            while remaining and not failed:
+                if not running:
+                    # Nothing can become ready, the remaining nodes depend
+                    # on each other.
+                    keys = sorted(n.key for n, deps in waiting_on.iteritems() if deps)
+                    raise CircularDependency(", ".join(keys))
+
+                node, error = finished.get()
+                remaining -= 1
+                running -= 1
+
+                if error:
+                    failed = (node, error)
+                else:
+                    for dependent in dependents[node]:
+                        waiting_on[dependent].discard(node)
+                        if not waiting_on[dependent]:
+                            ready.put(dependent)
+                            running += 1
+        finally:
+            for t in workers:
+                ready.put(None)
+            for t in workers:
+                t.join()
+
+        if failed:
+            node, (e, tb) = failed
+            self.current_task = node
+            raise e, None, tb
+
     def after_successful_run(self):
         self.transition('ran')
         self.batch.end_time = time.time()
         self.batch.save_to_file()
+        self.update_artifact_store()
+        self.hash_index.save()
+        self.input_trees.collect_garbage()
+        self.compiled_executables.collect_garbage()
+        self.highlight_cache.collect_garbage()
         shutil.move(self.this_cache_dir(), self.last_cache_dir())
         self.empty_trash()
         self.add_lookups()
 
+    def update_artifact_store(self):
+        """
+        Records the output of documents which ran in this batch in the
+        artifact store, and marks entries for cached documents as still in use.
+        """
+        for doc in self.documents():
+            if hasattr(doc, 'created_by_doc'):
+                # stored along with the doc which created it
+                continue
+            elif doc.state == 'ran':
+                doc.add_to_artifact_store()
+            elif doc.state == 'consolidated':
+                self.artifact_store.touch(doc.hashid)
+
+        self.artifact_store.collect_garbage()
+        self.artifact_store.save()
+
     def add_lookups(self):
-        for data in self.batch:
-            data.add_to_lookup_sections()
-            data.add_to_lookup_nodes()
+        self.link_index.update(self.batch)
+        self._lookup_nodes = None
+        self._lookup_sections = None
+
+    @property
+    def lookup_nodes(self):
+        """
+        Map of shortcuts/keys to all nodes which can match.
+        """
+        if self._lookup_nodes is None:
+            self._lookup_nodes = self.link_index.lookup_datas(self.link_index.docs)
+        return self._lookup_nodes
+
+    @property
+    def lookup_sections(self):
+        """
+        Map of section names to nodes.
+        """
+        if self._lookup_sections is None:
+            self._lookup_sections = self.link_index.lookup_datas(self.link_index.sections)
+        return self._lookup_sections
 
     def bundle_docs(self):
         from dexy.node import BundleNode
@@ -331,32 +526,20 @@ class Wrapper(object):
         return dexy.utils.pickle_lib(self)
 
     def node_argstrings_filename(self):
-        return os.path.join(self.artifacts_dir, 'batch.args.pickle')
+        return self.arg_index.index_filename()
 
     def save_node_argstrings(self):
         """
-        Save string representation of node args to check if they have changed.
+        Save digests of node args to check if they have changed.
         """
-        arg_info = {}
-
-        for node in self.nodes.values():
-            arg_info[node.key_with_class()] = node.sorted_arg_string()
-
-        with open(self.node_argstrings_filename(), 'wb') as f:
-            pickle = self.pickle_lib()
-            pickle.dump(arg_info, f)
+        self.arg_index.save(self.nodes.values())
 
     def load_node_argstrings(self):
         """
-        Load saved node arg strings into a hash so nodes can check if their
-        args have changed.
+        Discard any arg digests read so far, so nodes check their args against
+        those most recently saved. Digests are read as nodes request them.
         """
-        try:
-            with open(self.node_argstrings_filename(), 'rb') as f:
-                pickle = self.pickle_lib()
-                self.saved_args = pickle.load(f)
-        except IOError:
-            self.saved_args = {}
+        self.arg_index.close()
 
     # Dexy Dirs
     def iter_dexy_dirs(self):
@@ -556,11 +739,18 @@ class Wrapper(object):
     def map_files(self):
         """
         Generates a map of files present in the project directory.
+
+        Directory listings are reused from the previous run's snapshot where
+        a directory has not changed, and file stats are only calculated when
+        needed.
         """
         exclude = self.exclude_dirs()
         filemap = {}
 
-        for dirpath, dirnames, filenames in os.walk('.', followlinks=True):
+        snapshot = dexy.filemap.DirectorySnapshot(self)
+        snapshot.load()
+
+        for dirpath, dirnames, filenames in snapshot.walk('.'):
             for x in exclude:
                 if x in dirnames and not x in self.include:
                     dirnames.remove(x)
@@ -574,13 +764,39 @@ class Wrapper(object):
             else:
                 for filename in filenames:
                     filepath = posixpath.normpath(posixpath.join(dirpath, filename))
-                    filemap[filepath] = {}
-                    filemap[filepath]['stat'] = os.stat(os.path.join(dirpath, filename))
-                    filemap[filepath]['ospath'] = os.path.normpath(os.path.join(dirpath, filename))
-                    filemap[filepath]['dir'] = os.path.normpath(dirpath)
+                    filemap[filepath] = dexy.filemap.FileInfo(
+                            ospath = os.path.normpath(os.path.join(dirpath, filename)),
+                            dir = os.path.normpath(dirpath))
 
+        snapshot.save()
         return filemap
 
+    def file_index(self):
+        """
+        Returns a FileIndex for the current filemap.
+        """
+        file_index = getattr(self, '_file_index', None)
+        index_is_stale = file_index is None or \
+                file_index.filemap is not self.filemap or \
+                len(file_index.paths) != len(self.filemap)
+        if index_is_stale:
+            file_index = dexy.filemap.FileIndex(self.filemap)
+            self._file_index = file_index
+        return file_index
+
+    def match_file_patterns(self, patterns):
+        """
+        Matches all the glob patterns against the filemap in a single pass,
+        so later calls to files_matching can use the results.
+        """
+        self.file_index().match_patterns(patterns)
+
+    def files_matching(self, pattern):
+        """
+        Returns a sorted list of keys in filemap which match the glob pattern.
+        """
+        return self.file_index().matching(pattern)
+
     def file_available(self, filepath):
         """
         Does the file exist and is it available to dexy?
@@ -588,6 +804,14 @@ class Wrapper(object):
         return filepath in self.filemap
 
     # Running Dexy
+    def input_graph_changed(self):
+        """
+        Called when inputs or children of nodes change after creation, so
+        that cached input closures are recalculated.
+        """
+        with self.input_graph_lock:
+            self.input_graph_version += 1
+
     def add_node(self, node):
         """
         Add new nodes which are not children of other nodes.
@@ -595,18 +819,6 @@ class Wrapper(object):
         key = node.key_with_class()
         self.nodes[key] = node
 
-    def add_data_to_lookup_nodes(self, key, data):
-        if not key in self.lookup_nodes:
-            self.lookup_nodes[key] = []
-        if not data in self.lookup_nodes[key]:
-            self.lookup_nodes[key].append(data)
-
-    def add_data_to_lookup_sections(self, key, data):
-        if not key in self.lookup_sections:
-            self.lookup_sections[key] = []
-        if not data in self.lookup_sections[key]:
-            self.lookup_sections[key].append(data)
-
     def qualify_key(self, key):
         """
         A full node key is of the form alias:pattern where alias indicates
@@ -733,13 +945,16 @@ class Wrapper(object):
     def is_location_in_project_dir(self, filepath):
         return self.writeanywhere or (self.project_root_ts in os.path.abspath(filepath))
 
-    def decode_encoded(self, text):
+    def detect_encoding(self, text):
+        """
+        Returns the encoding to use for decoding text, which may be a sample
+        taken from the start of a longer stream.
+        """
         if self.encoding == 'chardet':
-            encoding = chardet.detect(text)['encoding']
-            if not encoding:
-                return text.decode("utf-8")
-            else:
-                return text.decode(encoding)
+            return chardet.detect(text)['encoding'] or "utf-8"
         else:
-            return text.decode(self.encoding)
+            return self.encoding
+
+    def decode_encoded(self, text):
+        return text.decode(self.detect_encoding(text))
 
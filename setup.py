@@ -47,7 +47,7 @@ setup(
             'cashew>=0.2.7',
             'chardet',
             'inflection>=0.2.0',
-            'jinja2',
+            'jinja2>=2.9',
             'ply>=3.4',
             'pygments',
             'python-modargs>=1.7',
@@ -1,6 +1,7 @@
 from tests.utils import assert_output
 from tests.utils import wrap
 from dexy.doc import Doc
+import os
 
 FORTRAN_HELLO_WORLD = """program hello
    print *, "Hello World!"
@@ -117,3 +118,20 @@ def test_clang_multiple_inputs():
         wrapper.run_docs(node)
         assert unicode(node.output_data()['input1.txt']) == u'hello, c'
         assert unicode(node.output_data()['input2.txt']) == u'more data'
+
+def test_c_filter_reuses_compiled_executable():
+    with wrap() as wrapper:
+        doc1 = Doc("a/hello.c|c", contents=C_HELLO_WORLD, wrapper=wrapper)
+        doc2 = Doc("b/hello.c|c", contents=C_HELLO_WORLD, wrapper=wrapper,
+                args="extra")
+        wrapper.run_docs(doc1, doc2)
+
+        assert str(doc1.output_data()) == "HELLO, world\n"
+        assert str(doc2.output_data()) == "HELLO, world\n"
+
+        store = wrapper.compiled_executables
+        assert len(store.entries) == 1
+
+        compiled = [os.path.join(doc.filters[-1].parent_work_dir(), "hello.o")
+                for doc in (doc1, doc2)]
+        assert os.stat(compiled[0]).st_ino == os.stat(compiled[1]).st_ino
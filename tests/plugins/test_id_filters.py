@@ -1,9 +1,11 @@
 from dexy.doc import Doc
 from dexy.exceptions import UserFeedback
+from dexy.filters.id import join_section_contents
 from dexy.filters.id import lexer as id_lexer
 from dexy.filters.id import parser as id_parser
 from dexy.filters.id import start_new_section, token_info
 from tests.utils import TEST_DATA_DIR
+from tests.utils import make_wrapper
 from tests.utils import wrap
 import os
 
@@ -34,6 +36,7 @@ def setup_parser():
 def parse(text):
     for id_parser, _lexer in setup_parser():
         id_parser.parse(text, lexer=_lexer)
+        join_section_contents(_lexer)
         return _lexer.sections
 
 def tokens(text):
@@ -185,3 +188,43 @@ def test_parse_php_mixed_tags():
     assert "assign-variables" in section_names
     assert "compare" in section_names
     assert "display-variables" in section_names
+
+def test_idio_reuses_highlighted_sections():
+    with wrap() as wrapper:
+        contents = "### @export one\nx = 1\n### @export two\ny = 2\n"
+        doc = Doc("example.py|idio", wrapper, [], contents=contents)
+        wrapper.run_docs(doc)
+
+        # Mark the saved output so we can tell whether it is reused.
+        pickle = wrapper.pickle_lib()
+        cache_dir = wrapper.highlight_cache.cache_dir()
+        for dirpath, dirnames, filenames in os.walk(cache_dir):
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                with open(filepath, 'rb') as f:
+                    output = pickle.load(f)
+                if "x" in output:
+                    with open(filepath, 'wb') as f:
+                        pickle.dump("reused", f)
+
+        wrapper = make_wrapper()
+        contents = contents.replace("y = 2", "y = 3")
+        doc = Doc("example.py|idio", wrapper, [], contents=contents)
+        wrapper.run_docs(doc)
+
+        assert unicode(doc.output_data()['one']) == "reused"
+        assert "3" in unicode(doc.output_data()['two'])
+
+def test_idio_section_contents_are_joined():
+    with wrap() as wrapper:
+        contents = "### @export one\nx = 1\n\n### @export two\ny = 2"
+        docs = dict((ending, Doc("example%s.py|idio" % len(ending), wrapper, [],
+                contents=contents + ending, idio={'highlight' : False}))
+                for ending in ("\n", ""))
+        wrapper.run_docs(*docs.values())
+
+        for ending, doc in docs.iteritems():
+            sections = doc.output_data().data()[1:]
+            assert [s['name'] for s in sections] == ['1', 'one', 'two']
+            assert [s['contents'] for s in sections] == ['', 'x = 1\n\n', 'y = 2%s' % ending]
+            assert all(isinstance(s['contents'], unicode) for s in sections)
@@ -134,3 +134,28 @@ x*y
 >>> x*y
 42"""
 
+
+PYCON_SESSION_SRC = """
+x = 6
+y = 7
+for i in range(2):
+    print i * x
+
+x*y
+"""
+
+def run_pycon_docs(settings):
+    with wrap() as wrapper:
+        first = Doc("first.py|pycon", wrapper, [], contents=PYCON_SESSION_SRC, pycon=settings)
+        second = Doc("second.py|pycon", wrapper, [], contents="'x' in dir()\nimport os\nos.path.basename(os.getcwd())", pycon=settings)
+        wrapper.run_docs(first, second)
+        return str(first.output_data()), str(second.output_data())
+
+def test_pycon_batch_send_and_reuse_session():
+    expected = run_pycon_docs({})
+    assert "42" in expected[0]
+    assert "False" in expected[1]
+
+    assert run_pycon_docs({'batch-send' : True}) == expected
+    assert run_pycon_docs({'reuse-session' : True}) == expected
+    assert run_pycon_docs({'reuse-session' : True, 'batch-send' : True}) == expected
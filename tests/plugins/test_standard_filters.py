@@ -31,6 +31,20 @@ def test_join_filter():
 def test_head_filter():
     assert_output("head", "1\n2\n3\n4\n5\n6\n7\n8\n9\n10\n11\n", "1\n2\n3\n4\n5\n6\n7\n8\n9\n10\n")
 
+def test_head_filter_short_input():
+    with wrap() as wrapper:
+        node = Doc("example.txt|head", wrapper, [], contents="1\n2\n")
+        wrapper.run_docs(node)
+        assert str(node.output_data()) == "1\n2\n\n"
+
+def test_resub_filter():
+    with wrap() as wrapper:
+        node = Doc("example.txt|resub", wrapper, [],
+                contents="foo\nbar\n\nfoo food",
+                resub={"expressions" : [["foo", "baz"], ["^baz$", "qux"]]})
+        wrapper.run_docs(node)
+        assert str(node.output_data()) == "qux\nbar\n\nbaz bazd"
+
 def test_word_wrap_filter():
     with wrap() as wrapper:
         node = Doc("example.txt|wrap", wrapper, [], contents="this is a line of text", wrap={"width" : 5})
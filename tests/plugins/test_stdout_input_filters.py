@@ -117,3 +117,21 @@ def test_sed_filter_multiple_inputs():
         wrapper.run_docs(node)
         assert str(node.output_data()['foo.txt']) == 'hEllo'
         assert str(node.output_data()['bar.txt']) == 'tElEphonE'
+
+def test_sed_filter_jobs():
+    with wrap() as wrapper:
+        inputs = [Doc("input%s.txt" % i, wrapper, [], contents="hello %s\n" % i)
+                for i in range(6)]
+        node = Doc("example.sed|sed",
+                wrapper,
+                inputs,
+                contents="s/hello/goodbye/",
+                sed={'jobs' : 3}
+                )
+
+        wrapper.run_docs(node)
+
+        if not wrapper.state == 'error':
+            assert node.output_data().keys() == ["input%s.txt" % i for i in range(6)]
+            for i in range(6):
+                assert str(node.output_data()["input%s.txt" % i]) == "goodbye %s\n" % i
@@ -1,8 +1,10 @@
 from dexy.doc import Doc
 from dexy.filters.templating import TemplateFilter
 from dexy.filters.templating_plugins import TemplatePlugin
+from tests.utils import make_wrapper
 from tests.utils import wrap
 from dexy.exceptions import UserFeedback
+import os
 
 def test_jinja_invalid_attribute():
     def make_sections_doc(wrapper):
@@ -328,3 +330,39 @@ def test_jinja_filter_using_inflection():
 
         wrapper.run_docs(node)
         assert node.output_data().as_text() == "Abc def"
+
+def test_jinja_shares_environment_and_caches_layout_bytecode():
+    with wrap() as wrapper:
+        with open("_layout.jinja", "w") as f:
+            f.write("[{% block content %}{% endblock %}]")
+
+        contents = "{% extends '_layout.jinja' %}{% block content %}%s{% endblock %}"
+        doc1 = Doc("one.txt|jinja", wrapper, [], contents=contents.replace("%s", "one"))
+        doc2 = Doc("two.txt|jinja", wrapper, [], contents=contents.replace("%s", "two"))
+        wrapper.run_docs(doc1, doc2)
+
+        assert unicode(doc1.output_data()) == "[one]"
+        assert unicode(doc2.output_data()) == "[two]"
+
+        env1 = doc1.filters[-1].setup_jinja_env()
+        env2 = doc2.filters[-1].setup_jinja_env()
+        assert env1 is env2
+        assert 'highlight' in env1.filters
+
+        # Only the shared layout is in the bytecode cache.
+        cache_dir = os.path.join(wrapper.artifacts_dir, "jinja")
+        assert len(os.listdir(cache_dir)) == 1
+
+def test_jinja_environment_is_not_shared_between_wrappers():
+    with wrap() as wrapper:
+        doc = Doc("hello.txt|jinja", wrapper, [], contents="{{ 'x' | highlight('python') }}")
+        wrapper.run_docs(doc)
+        env1 = doc.filters[-1].setup_jinja_env()
+        assert env1.filters['highlight'].__self__.wrapper is wrapper
+
+        wrapper = make_wrapper()
+        doc = Doc("hello.txt|jinja", wrapper, [], contents="{{ 'x' | highlight('python') }}")
+        wrapper.run_docs(doc)
+        env2 = doc.filters[-1].setup_jinja_env()
+        assert not env2 is env1
+        assert env2.filters['highlight'].__self__.wrapper is wrapper
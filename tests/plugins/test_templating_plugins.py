@@ -1,4 +1,7 @@
 from dexy.doc import Doc
+from dexy.exceptions import InternalDexyProblem
+from dexy.exceptions import UserFeedback
+from dexy.filters.templating import TemplateData
 from dexy.filters.templating import TemplateFilter
 from dexy.filters.templating_plugins import TemplatePlugin
 from tests.utils import run_templating_plugin as run
@@ -25,6 +28,91 @@ def test_d_object():
         # items() method is created by DictMixin from __getitem__
         assert len(d.items()) == 1
 
+def test_d_object_lookups():
+    with wrap() as wrapper:
+        node = Doc("template.txt|jinja",
+                wrapper,
+                [
+                    Doc("abc.txt", wrapper, [], contents="abc"),
+                    Doc("abd.txt", wrapper, [], contents="abd"),
+                    Doc("other-doc.txt", wrapper, [], contents="other")
+                    ],
+                contents = "{{ d['abc.txt'] }}")
+
+        wrapper.run_docs(node)
+        d = node.filters[0].run_plugins()['d'][1]
+
+        assert unicode(d['abc.txt']) == "abc"
+        assert unicode(d['/abd.txt']) == "abd"
+        assert unicode(d['other']) == "other"
+        assert unicode(d['title:Other Doc']) == "other"
+        assert [k for i, k in d.matching_keys('ab')] == ['abc.txt', 'abd.txt']
+        assert d.unique_matching_key('ab') is None
+
+        try:
+            d['ab']
+            assert False, 'should raise UserFeedback'
+        except UserFeedback as e:
+            assert "No document named 'ab'" in e.message
+
+def test_template_data_runs_plugins_lazily():
+    with wrap() as wrapper:
+        node = Doc("template.txt|jinja",
+                wrapper,
+                [],
+                contents = "Version {{ DEXY_VERSION }}")
+
+        wrapper.run_docs(node)
+        assert unicode(node.output_data()).startswith("Version ")
+
+        f = node.filters[-1]
+        template_data = TemplateData(f, f.template_plugins())
+        assert template_data['DEXY_VERSION']
+        assert template_data.entries.keys() == ['DEXY_VERSION']
+
+        # Values which don't depend on the document are reused.
+        stylesheets = template_data['pygments']
+        template_data = TemplateData(f, f.template_plugins())
+        assert template_data['pygments'] is stylesheets
+
+class ClashingPluginA(TemplatePlugin):
+    """
+    Provides a name which ClashingPluginB also provides.
+    """
+    def run(self):
+        return { 'clash' : ("A", 'a'), 'onlya' : ("A", 'a') }
+
+class ClashingPluginB(TemplatePlugin):
+    """
+    Provides a name which ClashingPluginA also provides.
+    """
+    def run(self):
+        return { 'clash' : ("B", 'b') }
+
+def test_template_data_detects_name_clash_up_front():
+    with wrap() as wrapper:
+        node = Doc("template.txt|jinja",
+                wrapper,
+                [],
+                contents = "hello")
+        wrapper.run_docs(node)
+
+        f = node.filters[-1]
+        plugins = [ClashingPluginA(f), ClashingPluginB(f)]
+        try:
+            TemplateData(f, plugins)
+            assert False, 'should raise InternalDexyProblem'
+        except InternalDexyProblem as e:
+            assert "ClashingPluginB" in e.message
+
+        # Names are known once the plugins have run, so the clash is
+        # detected without running them again.
+        try:
+            TemplateData(f, plugins)
+            assert False, 'should raise InternalDexyProblem'
+        except InternalDexyProblem as e:
+            assert "ClashingPluginB" in e.message
+
 def test_base():
     run(TemplatePlugin)
 
@@ -0,0 +1,45 @@
+from dexy.doc import Doc
+from tests.utils import make_wrapper
+from tests.utils import wrap
+import os
+
+def test_output_reporter_only_rewrites_changed_files():
+    with wrap() as wrapper:
+        wrapper.run_docs(
+                Doc("hello.txt", wrapper, [], contents="hello"),
+                Doc("goodbye.txt", wrapper, [], contents="goodbye")
+                )
+        wrapper.report()
+
+        hello_path = os.path.join('output', 'hello.txt')
+        goodbye_path = os.path.join('output', 'goodbye.txt')
+        with open(hello_path, "rb") as f:
+            assert f.read() == "hello"
+        hello_ino = os.stat(hello_path).st_ino
+
+        wrapper = make_wrapper()
+        wrapper.run_docs(
+                Doc("hello.txt", wrapper, [], contents="hello"),
+                Doc("new.txt", wrapper, [], contents="new")
+                )
+        wrapper.report()
+
+        # Unchanged file is left in place, stale file is removed.
+        assert os.stat(hello_path).st_ino == hello_ino
+        assert not os.path.exists(goodbye_path)
+        with open(os.path.join('output', 'new.txt'), "rb") as f:
+            assert f.read() == "new"
+
+        # Files modified outside dexy are rewritten.
+        with open(hello_path, "wb") as f:
+            f.write("changed by hand")
+
+        wrapper = make_wrapper()
+        wrapper.run_docs(
+                Doc("hello.txt", wrapper, [], contents="hello"),
+                Doc("new.txt", wrapper, [], contents="new")
+                )
+        wrapper.report()
+
+        with open(hello_path, "rb") as f:
+            assert f.read() == "hello"
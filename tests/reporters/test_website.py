@@ -1,5 +1,11 @@
+from dexy.doc import Doc
+from dexy.reporter import Reporter
 from dexy.reporters.website.classes import Navigation
 from dexy.reporters.website.classes import Node
+from tests.utils import make_wrapper
+from tests.utils import wrap
+import os
+import time
 
 def test_navigation():
    nav = Navigation()
@@ -12,3 +18,63 @@ def test_iter():
 
     for n in [n2, n3]:
         nav.add_node(n)
+
+def run_incremental_website(wrapper):
+    reporter = Reporter.create_instance('ws')
+    reporter.update_settings({'incremental' : True})
+    reporter.run(wrapper)
+
+def test_website_only_renders_changed_pages():
+    with wrap() as wrapper:
+        with open("_template.html", "w") as f:
+            f.write("{{ content }} {{ link('other.html') }}")
+
+        wrapper.jobs = 2
+        wrapper.run_docs(
+                Doc("index.html", wrapper, [], contents="index"),
+                Doc("other.html", wrapper, [], contents="other")
+                )
+        run_incremental_website(wrapper)
+
+        index_path = os.path.join("output-site", "index.html")
+        other_path = os.path.join("output-site", "other.html")
+        with open(index_path, "rb") as f:
+            assert f.read() == """index <a href="other.html">Other</a>"""
+        index_mtime = os.stat(index_path).st_mtime
+        other_mtime = os.stat(other_path).st_mtime
+
+        time.sleep(0.01)
+        wrapper = make_wrapper()
+        wrapper.run_docs(
+                Doc("index.html", wrapper, [], contents="index"),
+                Doc("other.html", wrapper, [], contents="other")
+                )
+        run_incremental_website(wrapper)
+
+        assert os.stat(index_path).st_mtime == index_mtime
+        assert os.stat(other_path).st_mtime == other_mtime
+
+        # Changing a linked page renders the pages linking to it again.
+        time.sleep(0.01)
+        wrapper = make_wrapper()
+        wrapper.run_docs(
+                Doc("index.html", wrapper, [], contents="index"),
+                Doc("other.html", wrapper, [], contents="changed")
+                )
+        run_incremental_website(wrapper)
+
+        assert os.stat(index_path).st_mtime != index_mtime
+        with open(other_path, "rb") as f:
+            assert f.read().startswith("changed")
+
+def test_website_not_incremental_by_default():
+    with wrap() as wrapper:
+        with open("_template.html", "w") as f:
+            f.write("{{ content }}")
+
+        wrapper.run_docs(Doc("index.html", wrapper, [], contents="index"))
+        reporter = Reporter.create_instance('ws')
+        reporter.run(wrapper)
+
+        assert os.path.exists(os.path.join("output-site", "index.html"))
+        assert not os.path.exists(reporter.manifest_filepath())
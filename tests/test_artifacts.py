@@ -0,0 +1,118 @@
+from tests.utils import tempdir
+from dexy.wrapper import Wrapper
+import os
+import time
+
+def write_project(contents):
+    with open("dexy.yaml", "w") as f:
+        f.write("hello.txt|dexy")
+
+    with open("hello.txt", "w") as f:
+        f.write(contents)
+
+def test_artifacts_recorded_after_run():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        write_project("hello")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+
+        doc = wrapper.nodes['doc:hello.txt|dexy']
+        assert doc.artifact_key() in wrapper.artifact_store
+        assert os.path.exists(wrapper.artifact_store.index_filename())
+
+def test_restore_previous_contents_from_store():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        write_project("hello")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        assert wrapper.nodes['doc:hello.txt|dexy'].state == 'ran'
+
+        time.sleep(1.1)
+        write_project("goodbye")
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        doc = wrapper.nodes['doc:hello.txt|dexy']
+        assert doc.state == 'ran'
+        assert str(doc.output_data()) == "goodbye"
+
+        # Switching back to earlier contents uses the stored artifacts.
+        time.sleep(1.1)
+        write_project("hello")
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        doc = wrapper.nodes['doc:hello.txt|dexy']
+        assert doc.state == 'consolidated'
+        assert str(doc.output_data()) == "hello"
+
+def test_garbage_collection():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        write_project("hello")
+
+        wrapper = Wrapper(artifact_store_runs=1)
+        wrapper.run_from_new()
+        old_key = wrapper.nodes['doc:hello.txt|dexy'].artifact_key()
+
+        time.sleep(1.1)
+        write_project("goodbye")
+        wrapper = Wrapper(artifact_store_runs=1)
+        wrapper.run_from_new()
+
+        assert not old_key in wrapper.artifact_store
+        store_dir = wrapper.artifact_store.store_dir()
+        object_files = [f for d in os.listdir(store_dir)
+                if os.path.isdir(os.path.join(store_dir, d))
+                for f in os.listdir(os.path.join(store_dir, d))]
+        assert sorted(object_files) == sorted(wrapper.artifact_store.refcounts)
+
+def test_stored_objects_are_not_linked_to_cache_files():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        write_project("hello")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+
+        doc = wrapper.nodes['doc:hello.txt|dexy']
+        entry = wrapper.artifact_store.entries[doc.artifact_key()]
+        data_file = doc.output_data().storage.data_file()
+        relpath = os.path.relpath(data_file, wrapper.last_cache_dir())
+        object_filepath = wrapper.artifact_store.object_filepath(entry['files'][relpath])
+        assert os.stat(data_file).st_ino != os.stat(object_filepath).st_ino
+
+        with open(data_file, "w") as f:
+            f.write("changed in place")
+
+        with open(object_filepath, "r") as f:
+            assert f.read() == "hello"
+
+def test_files_of_removed_docs_leave_cache():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        write_project("hello")
+        with open("dexy.yaml", "w") as f:
+            f.write("- hello.txt|dexy\n- goodbye.txt|dexy\n")
+        with open("goodbye.txt", "w") as f:
+            f.write("goodbye")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        goodbye_file = wrapper.nodes['doc:goodbye.txt|dexy'].output_data().storage.data_file()
+        assert os.path.exists(goodbye_file)
+
+        write_project("hello")
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        doc = wrapper.nodes['doc:hello.txt|dexy']
+        assert doc.state == 'consolidated'
+        assert str(doc.output_data()) == "hello"
+        assert not os.path.exists(goodbye_file)
@@ -38,3 +38,44 @@ def test_batch_with_docs():
         for doc_key in batch.docs:
             assert batch.input_data(doc_key)
             assert batch.output_data(doc_key)
+
+def test_saved_batch_queries():
+    with tempdir():
+        wrapper = Wrapper(log_level='DEBUG', debug=True)
+        wrapper.create_dexy_dirs()
+
+        with open("hello.txt", "w") as f:
+            f.write("hello")
+
+        with open("hello.md", "w") as f:
+            f.write("hello")
+
+        with open("dexy.yaml", "w") as f:
+            f.write("- hello.txt\n- hello.md|pyg\n")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        storage_keys = dict((v, k) for k, v in wrapper.batch.doc_keys.iteritems())
+
+        batch = dexy.batch.Batch.load_most_recent(wrapper)
+        assert batch.filename() in os.listdir(".dexy/batches")
+        assert sorted(batch.docs) == ["doc:hello.md|pyg", "doc:hello.txt"]
+        assert "doc:hello.txt" in batch.docs
+        assert not "doc:missing.txt" in batch.docs
+        state = wrapper.batch.docs["doc:hello.txt"]['state']
+        assert batch.docs["doc:hello.txt"] == wrapper.batch.docs["doc:hello.txt"]
+        assert batch.doc_key(storage_keys["doc:hello.txt"]) == "doc:hello.txt"
+
+        assert batch.doc_keys_with_filter('pyg') == ["doc:hello.md|pyg"]
+        assert sorted(batch.doc_keys_with_state(state)) == sorted(batch.docs)
+        assert batch.filters_used == wrapper.batch.filters_used
+
+        matches = batch.output_datas_matching(expr="hello")
+        assert sorted(data.key for data in matches) == ["hello.md|pyg", "hello.txt"]
+        matches = batch.output_datas_matching(key="hello.txt")
+        assert [data.key for data in matches] == ["hello.txt"]
+        assert len(list(batch)) == 2
+
+        batch.close()
+        assert batch._db is None
+        batch.close()
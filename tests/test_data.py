@@ -49,6 +49,44 @@ def test_sectioned_data_setitem_delitem():
         assert len(data) == 1
         assert data.keys() == ["Welcome"]
 
+def test_sectioned_data_reads_sections_from_index():
+    with wrap() as wrapper:
+        contents=[
+                {"title" : "Example"},
+                {
+                    "name" : "Welcome",
+                    "contents" : u"This is the first section \u2042."
+                },
+                {
+                    "name" : "Conclusions",
+                    "contents" : "This is the final section."
+                }
+            ]
+
+        doc = Doc("hello.txt",
+                wrapper,
+                [],
+                data_type="sectioned",
+                contents=contents
+                )
+
+        wrapper.run_docs(doc)
+        data = doc.output_data()
+        data.clear_data()
+
+        assert data.keys() == ["Welcome", "Conclusions"]
+        assert len(data) == 2
+        assert data.keyindex("Conclusions") == 1
+        assert unicode(data["Conclusions"]) == "This is the final section."
+        assert unicode(data["Welcome"]) == u"This is the first section \u2042."
+        assert data["title"] == "Example"
+        assert not data._data
+
+        # Changing a section loads all sections.
+        data["Welcome"]["contents"] = "Changed."
+        assert data._data[1]["contents"] == "Changed."
+        assert unicode(data["Welcome"]) == "Changed."
+
 def test_generic_data_unicode():
     with wrap() as wrapper:
         doc = Doc("hello.txt",
@@ -190,6 +228,30 @@ def test_key_value_data_sqlite():
         assert data.value('foo') == 'bar'
         assert ["%s: %s" % (k, v) for k, v in data.storage.iteritems()][0] == "foo: bar"
 
+def test_key_value_data_sqlite_append_many_and_persist():
+    with wrap() as wrapper:
+        wrapper.to_walked()
+        wrapper.to_checked()
+
+        settings = {
+                'canonical-name' : 'doc.sqlite3'
+                }
+
+        data = dexy.data.KeyValue("doc.sqlite3", ".sqlite3", "abc000", settings, wrapper)
+        data.setup_storage()
+        data.storage.connect()
+
+        data.append_many(("key%s" % i, "value%s" % i) for i in range(2500))
+        data.append('Foo', 'bar')
+        assert len(data.keys()) == 2501
+        assert data.like('foo') == 'bar'
+        assert data.like('key12') == 'value12'
+
+        data.save()
+        assert not os.path.exists(data.storage.working_file())
+        assert os.path.exists(data.storage.data_file())
+        assert data.value('key2499') == 'value2499'
+
 def test_generic_data():
     with wrap() as wrapper:
         wrapper.to_walked()
@@ -239,3 +301,36 @@ def test_init_data():
 
         assert not data.has_data()
         assert not data.is_cached()
+
+def test_generic_iterlines():
+    with wrap() as wrapper:
+        doc = Doc("hello.txt", wrapper, [], contents=u"one\ntw\u00f6\nthree")
+        wrapper.run_docs(doc)
+        data = doc.output_data()
+
+        data.clear_data()
+        lines = list(data.iterlines(chunk_size=3))
+        assert lines == [u"one\n", u"tw\u00f6\n", u"three"]
+
+def test_generic_data_html_header_saved_in_metadata():
+    with wrap() as wrapper:
+        page = Doc("page.html", wrapper, [], contents="<p>%s</p>" % ("x" * 70000))
+        full = Doc("full.html", wrapper, [], contents="%s<body></body>" % ("x" * 65534))
+        wrapper.run_docs(page, full)
+
+        page_data = page.output_data()
+        full_data = full.output_data()
+        page_data.clear_data()
+        full_data.clear_data()
+
+        assert not page_data.has_html_header()
+        assert full_data.has_html_header()
+        assert not full_data._data
+        assert full_data.storage.read_metadata() == {'html-header' : True}
+
+        # Metadata is ignored once the data file changes.
+        with open(full_data.storage.data_file(), "wb") as f:
+            f.write("<p>no header</p>")
+        assert full_data.storage.read_metadata() is None
+        full_data.clear_data()
+        assert not full_data.has_html_header()
@@ -0,0 +1,70 @@
+from dexy.filemap import FileIndex
+from dexy.filemap import PatternMatcher
+from dexy.filemap import file_ext
+from tests.utils import tempdir
+from dexy.wrapper import Wrapper
+import fnmatch
+import os
+
+FILES = [
+    "foo.txt",
+    "bar.abc",
+    "s1/s1.abc",
+    "s1/s1.def",
+    "s1/s2/.abc",
+    "s1/s2/x.tar.gz",
+    "s2/s2.abc",
+    "s2/README"
+    ]
+
+def test_file_ext():
+    assert file_ext("foo.txt") == ".txt"
+    assert file_ext("s1/s2/.abc") == ".abc"
+    assert file_ext("s1/x.tar.gz") == ".gz"
+    assert file_ext("s2/README") == ""
+    assert file_ext("s2.d/README") == ""
+
+def test_file_index_matches_fnmatch():
+    index = FileIndex(dict((f, {}) for f in FILES))
+    patterns = ["*.abc", "s1/*.abc", "s1/*", "*", "*.tar.gz", "s?/*.def",
+            "s[12]/*.abc", "foo.txt", "missing.txt", "*README", "s1/s2/*"]
+    for pattern in patterns:
+        expected = sorted(f for f in FILES if fnmatch.fnmatch(f, pattern))
+        assert index.matching(pattern) == expected, pattern
+
+def test_pattern_matcher_matches_fnmatch():
+    patterns = ["*.abc", "s1/*.abc", "s1/*", "*", "*.tar.gz", "s?/*.def",
+            "s[12]/*.abc", "foo.txt", "missing.txt", "*README", "s1/s2/*"]
+    matches = PatternMatcher(patterns).match(sorted(FILES))
+    for pattern in patterns:
+        expected = sorted(f for f in FILES if fnmatch.fnmatch(f, pattern))
+        assert matches[pattern] == expected, pattern
+
+def test_file_index_uses_precomputed_matches():
+    index = FileIndex(dict((f, {}) for f in FILES))
+    index.match_patterns(["*.abc", "s1/*"])
+    assert sorted(index.matches) == ["*.abc", "s1/*"]
+    assert index.matching("s1/*") == ["s1/s1.abc", "s1/s1.def", "s1/s2/.abc", "s1/s2/x.tar.gz"]
+    assert index.matching("*.def") == ["s1/s1.def"]
+
+def test_map_files_uses_snapshot():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        os.makedirs("s1")
+        with open("s1/hello.txt", "w") as f:
+            f.write("hello")
+
+        wrapper = Wrapper()
+        wrapper.to_valid()
+        filemap = wrapper.map_files()
+        assert sorted(filemap) == ['s1/hello.txt']
+        assert not 'stat' in filemap['s1/hello.txt']
+        assert filemap['s1/hello.txt']['stat'].st_size == 5
+
+        with open("s1/goodbye.txt", "w") as f:
+            f.write("goodbye")
+
+        filemap = wrapper.map_files()
+        assert sorted(filemap) == ['s1/goodbye.txt', 's1/hello.txt']
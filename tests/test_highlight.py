@@ -0,0 +1,94 @@
+from dexy.doc import Doc
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import PythonLexer
+from tests.utils import wrap
+import os
+import pygments
+import time
+
+def cache_entries(wrapper):
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(wrapper.highlight_cache.cache_dir()):
+        entries.extend(os.path.join(dirpath, f) for f in filenames)
+    return entries
+
+def test_highlight_cache_reuses_output():
+    with wrap() as wrapper:
+        cache = wrapper.highlight_cache
+        lexer = PythonLexer()
+
+        output = cache.highlight(u"x = 1\n", lexer, HtmlFormatter())
+        assert "x" in output
+        assert len(cache_entries(wrapper)) == 1
+
+        assert cache.highlight(u"x = 1\n", lexer, HtmlFormatter()) == output
+        assert len(cache_entries(wrapper)) == 1
+
+        # Different formatter options need a new entry.
+        numbered = cache.highlight(u"x = 1\n", lexer, HtmlFormatter(linenos=True))
+        assert numbered != output
+        assert len(cache_entries(wrapper)) == 2
+
+def test_highlight_cache_removes_least_recently_used():
+    with wrap() as wrapper:
+        wrapper.highlight_cache_entries = 2
+        cache = wrapper.highlight_cache
+        lexer = PythonLexer()
+        formatter = HtmlFormatter()
+
+        for i in range(3):
+            cache.highlight(u"x = %s\n" % i, lexer, formatter)
+
+        # Make the second entry the least recently used.
+        first = cache.entry_filepath(cache.key(u"x = 0\n", lexer, formatter))
+        second = cache.entry_filepath(cache.key(u"x = 1\n", lexer, formatter))
+        os.utime(second, (time.time() - 100, time.time() - 100))
+        cache.highlight(u"x = 0\n", lexer, formatter)
+
+        cache.collect_garbage()
+        assert len(cache_entries(wrapper)) == 2
+        assert os.path.exists(first)
+        assert not os.path.exists(second)
+
+def test_highlight_cache_key_includes_pygments_version():
+    with wrap() as wrapper:
+        cache = wrapper.highlight_cache
+        key = cache.key(u"x = 1\n", PythonLexer(), HtmlFormatter())
+
+        version = pygments.__version__
+        try:
+            pygments.__version__ = "0.0"
+            assert cache.key(u"x = 1\n", PythonLexer(), HtmlFormatter()) != key
+        finally:
+            pygments.__version__ = version
+
+def test_highlight_cache_refreshes_mtime_once_per_run():
+    with wrap() as wrapper:
+        cache = wrapper.highlight_cache
+        lexer = PythonLexer()
+        formatter = HtmlFormatter()
+
+        cache.highlight(u"x = 1\n", lexer, formatter)
+        cache.collect_garbage()
+
+        filepath = cache.entry_filepath(cache.key(u"x = 1\n", lexer, formatter))
+        old = time.time() - 100
+        os.utime(filepath, (old, old))
+        cache.highlight(u"x = 1\n", lexer, formatter)
+        assert os.stat(filepath).st_mtime > old
+
+        os.utime(filepath, (old, old))
+        cache.highlight(u"x = 1\n", lexer, formatter)
+        assert os.stat(filepath).st_mtime < old + 1
+
+def test_jinja_highlight_filter_uses_cache():
+    with wrap() as wrapper:
+        doc = Doc("hello.txt|jinja",
+                wrapper,
+                [],
+                contents = "{{ 'x = 1' | highlight('python') }}"
+                )
+        wrapper.run_docs(doc)
+
+        assert "highlight" in unicode(doc.output_data())
+        assert len(cache_entries(wrapper)) == 1
@@ -0,0 +1,68 @@
+from dexy.doc import Doc
+from tests.utils import make_wrapper
+from tests.utils import wrap
+import os
+import time
+
+def run_docs(wrapper):
+    contents = [
+            {},
+            {"name" : "Intro", "contents" : "intro", "id" : "intro-1"}
+            ]
+    wrapper.run_docs(
+            Doc("guide.json", wrapper, [], data_type="sectioned",
+                contents=contents, title="The Guide"),
+            Doc("notes.txt", wrapper, [], contents="notes")
+            )
+
+def set_saved_title(wrapper, entry, title, age):
+    """
+    Changes the title in a link index entry and saves the index, after
+    setting the entry's data file mtime to age seconds ago.
+    """
+    data = wrapper.batch.data_for_storage_key(entry['storage-key'])
+    data_file = data.storage.data_file()
+    mtime = time.time() - age
+    os.utime(data_file, (mtime, mtime))
+
+    entry['file'] = wrapper.link_index.data_file_info(data)
+    entry['title'] = title
+    wrapper.link_index.save()
+
+def test_link_index():
+    with wrap() as wrapper:
+        run_docs(wrapper)
+
+        link_index = wrapper.link_index
+        guide = link_index.find_docs("The Guide")
+        assert len(guide) == 1
+        assert guide[0]['output-name'] == "guide.json"
+        assert guide[0]['sections'] == {"Intro" : "intro-1"}
+        assert link_index.find_docs("guide.json") == guide
+        assert link_index.find_sections("Intro") == guide
+        assert link_index.find_docs("notes.txt")[0]['title'] == "Notes"
+        assert link_index.find_docs("missing") == []
+
+        assert [d.key for d in wrapper.lookup_sections["Intro"]] == ["guide.json"]
+
+        # Entries for unchanged documents are reused by later runs.
+        entry = link_index.entries[guide[0]['storage-key']]
+        set_saved_title(wrapper, entry, "Saved Title", age=60)
+
+        wrapper = make_wrapper()
+        run_docs(wrapper)
+        assert wrapper.link_index.find_docs("Saved Title")
+
+def test_link_index_does_not_reuse_racy_entries():
+    with wrap() as wrapper:
+        run_docs(wrapper)
+
+        # The data file was just written, so a change within the same mtime
+        # tick could leave its size and mtime unchanged.
+        guide = wrapper.link_index.find_docs("The Guide")
+        set_saved_title(wrapper, guide[0], "Saved Title", age=0)
+
+        wrapper = make_wrapper()
+        run_docs(wrapper)
+        assert not wrapper.link_index.find_docs("Saved Title")
+        assert wrapper.link_index.find_docs("The Guide")
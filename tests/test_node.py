@@ -50,6 +50,21 @@ def test_node_arg_caching():
         wrapper.load_node_argstrings()
         assert not node.check_args_changed()
 
+def test_arg_index_only_keeps_current_nodes():
+    with wrap() as wrapper:
+        foo = dexy.node.Node("foo", wrapper, [], foo='bar')
+        bar = dexy.node.Node("bar", wrapper, [], bar='baz')
+        wrapper.nodes = { foo.key_with_class() : foo, bar.key_with_class() : bar }
+        wrapper.save_node_argstrings()
+
+        wrapper.nodes = { foo.key_with_class() : foo }
+        wrapper.save_node_argstrings()
+        wrapper.load_node_argstrings()
+
+        assert wrapper.arg_index.saved_digest(foo.key_with_class()) == foo.args_digest()
+        assert wrapper.arg_index.saved_digest(bar.key_with_class()) is None
+        assert bar.check_args_changed()
+
 SCRIPT_YAML = """
 script:scriptnode:
     - start.sh|shint
@@ -257,3 +272,56 @@ def test_pattern_node_one_filter():
         assert doc.key == "foo.txt|dexy"
         assert doc.filter_aliases == ['dexy']
         assert doc.parent == node
+
+def test_touched_file_not_rerun():
+    with wrap():
+        with open("hello.txt", "w") as f:
+            f.write("hello")
+
+        wrapper = Wrapper()
+        doc = Doc("hello.txt|dexy", wrapper)
+        wrapper.run_docs(doc)
+        assert doc.state == 'ran'
+
+        future = time.time() + 10
+        os.utime("hello.txt", (future, future))
+
+        wrapper = Wrapper()
+        doc = Doc("hello.txt|dexy", wrapper)
+        wrapper.run_docs(doc)
+        assert not doc.doc_changed
+        assert doc.state == 'consolidated'
+
+def test_virtual_doc_contents_changed():
+    with wrap():
+        wrapper = Wrapper()
+        doc = Doc("hello.txt|dexy", wrapper, [], contents="hello")
+        wrapper.run_docs(doc)
+        assert doc.state == 'ran'
+
+        wrapper = Wrapper()
+        doc = Doc("hello.txt|dexy", wrapper, [], contents="hello")
+        wrapper.run_docs(doc)
+        assert doc.state == 'consolidated'
+
+        wrapper = Wrapper()
+        doc = Doc("hello.txt|dexy", wrapper, [], contents="goodbye")
+        wrapper.run_docs(doc)
+        assert doc.doc_changed
+        assert doc.state == 'ran'
+        assert str(doc.output_data()) == "goodbye"
+
+def test_walk_inputs_diamond():
+    with wrap() as wrapper:
+        base = Doc("base.txt", wrapper, [], contents="base")
+        left = Doc("left.txt", wrapper, [base], contents="left")
+        right = Doc("right.txt", wrapper, [base], contents="right")
+        top = Doc("top.txt", wrapper, [left, right], contents="top")
+
+        assert top.walk_inputs() == [left, base, right]
+        assert top.walk_inputs() is not top.walk_inputs()
+
+        extra = Doc("extra.txt", wrapper, [], contents="extra")
+        base.children.append(extra)
+        wrapper.input_graph_changed()
+        assert top.walk_inputs() == [left, base, extra, right]
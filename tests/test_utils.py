@@ -5,6 +5,7 @@ from nose.tools import raises
 from dexy.utils import s
 from dexy.utils import split_path
 from dexy.utils import iter_paths
+from dexy.utils import mtime_is_racy
 
 def test_iter_path():
     full_path = "/foo/bar/baz"
@@ -27,6 +28,11 @@ def test_split_path_with_root():
     path = "/foo/bar/baz"
     assert split_path(path) == ['', 'foo', 'bar', 'baz']
 
+def test_mtime_is_racy():
+    assert mtime_is_racy(100, now=101)
+    assert mtime_is_racy(100, now=102)
+    assert not mtime_is_racy(100, now=103)
+
 def test_s():
     text = """This is some text
     which goes onto
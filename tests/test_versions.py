@@ -0,0 +1,61 @@
+from dexy.utils import tempdir
+from dexy.versions import VersionProbes
+import os
+
+def make_script(filename, version):
+    with open(filename, "w") as f:
+        f.write("#!/bin/sh\necho run >> calls.txt\necho %s\n" % version)
+    os.chmod(filename, 0755)
+
+def calls():
+    with open("calls.txt", "r") as f:
+        return len(f.readlines())
+
+def test_version_probes_cached_until_executable_changes():
+    with tempdir():
+        make_script("tool", "tool 1.0")
+
+        probes = VersionProbes()
+        probes.load("versions.json")
+        assert probes.version("./tool --version") == "tool 1.0"
+        assert probes.version("./tool --version") == "tool 1.0"
+        assert calls() == 1
+
+        # Saved results are used by a new cache.
+        probes = VersionProbes()
+        probes.load("versions.json")
+        probes.probe_all(["./tool --version"])
+        assert probes.version("./tool --version") == "tool 1.0"
+        assert calls() == 1
+
+        # Replacing the executable invalidates the result in the next run.
+        make_script("tool-new", "tool 2.0")
+        os.rename("tool-new", "tool")
+        assert probes.version("./tool --version") == "tool 1.0"
+        probes.load("versions.json")
+        assert probes.version("./tool --version") == "tool 2.0"
+        assert calls() == 2
+
+def test_version_probes_cache_missing_executables():
+    with tempdir():
+        probes = VersionProbes()
+        probes.load("versions.json")
+        assert probes.version("notreal-dexy-tool --version") is False
+
+        probes = VersionProbes()
+        probes.load("versions.json")
+        probes.run = None # must not be called
+        assert probes.version("notreal-dexy-tool --version") is False
+
+def test_version_probes_probe_all():
+    with tempdir():
+        for i in range(4):
+            make_script("tool%s" % i, "tool%s 1.0" % i)
+
+        probes = VersionProbes()
+        commands = ["./tool%s" % i for i in range(4)]
+        probes.probe_all(commands + commands)
+        assert calls() == 4
+
+        assert probes.version("./tool2") == "tool2 1.0"
+        assert calls() == 4
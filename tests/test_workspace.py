@@ -0,0 +1,65 @@
+from dexy.doc import Doc
+from dexy.workspace import must_be_real_dir
+from dexy.workspace import symlinked_dir
+from tests.utils import wrap
+import dexy.utils
+import os
+
+def test_must_be_real_dir():
+    protected = ["s1/s2", "out"]
+    assert must_be_real_dir("s1", protected)
+    assert must_be_real_dir("s1/s2", protected)
+    assert must_be_real_dir("s1/s2/s3", protected)
+    assert must_be_real_dir("out", protected)
+    assert not must_be_real_dir("s1/other", protected)
+    assert not must_be_real_dir("s1/s2-other", protected)
+    assert not must_be_real_dir("data", protected)
+    assert must_be_real_dir("data", [""])
+
+def test_symlinked_dir():
+    protected = ["s1/s2"]
+    assert symlinked_dir("data/x/input.txt", protected) == "data"
+    assert symlinked_dir("s1/other/input.txt", protected) == "s1/other"
+    assert symlinked_dir("s1/input.txt", protected) is None
+    assert symlinked_dir("s1/s2/s3/input.txt", protected) is None
+    assert symlinked_dir("input.txt", protected) is None
+
+def test_workspace_symlinks_input_dirs():
+    if dexy.utils.is_windows:
+        return
+
+    with wrap() as wrapper:
+        doc = Doc("s1/script.sh|sh",
+                wrapper,
+                [
+                    Doc("data/input.txt", wrapper, [], contents="input contents"),
+                    Doc("s1/local.txt", wrapper, [], contents="local contents")
+                ],
+                contents="cat ../data/input.txt local.txt",
+                sh={"symlink-input-dirs" : True}
+                )
+        wrapper.run_docs(doc)
+
+        assert unicode(doc.output_data()) == "input contentslocal contents"
+
+        ws = doc.filters[-1].workspace()
+        assert os.path.islink(os.path.join(ws, "data"))
+        assert not os.path.islink(os.path.join(ws, "s1"))
+        assert not os.path.islink(os.path.join(ws, "s1", "local.txt"))
+        assert len(os.listdir(wrapper.input_trees.trees_dir())) == 1
+
+def test_filter_writing_into_input_dir():
+    with wrap() as wrapper:
+        doc = Doc("s1/script.sh|sh",
+                wrapper,
+                [Doc("data/input.txt", wrapper, [], contents="input contents")],
+                contents="echo new > ../data/new.txt",
+                sh={"add-new-files" : True}
+                )
+        wrapper.run_docs(doc)
+
+        ws = doc.filters[-1].workspace()
+        assert not os.path.islink(os.path.join(ws, "data"))
+        assert not os.path.exists(wrapper.input_trees.trees_dir())
+
+        assert str(wrapper.nodes['doc:data/new.txt'].output_data()) == "new" + os.linesep
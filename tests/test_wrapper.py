@@ -1,4 +1,6 @@
 from dexy.commands.utils import init_wrapper
+from dexy.doc import Doc
+from dexy.exceptions import CircularDependency
 from dexy.exceptions import InternalDexyProblem
 from dexy.exceptions import UserFeedback
 from dexy.parser import AbstractSyntaxTree
@@ -399,3 +401,73 @@ def test_run_target_ba():
         assert wrapper.nodes['bundle:baz'].state == 'ran'
         assert wrapper.nodes['bundle:foob'].state == 'uncached'
         assert wrapper.nodes['bundle:foobar'].state == 'uncached'
+
+def test_run_in_parallel():
+    with tempdir():
+        with open("dexy.yaml", "w") as f:
+            f.write("""
+            index.txt|jinja:
+                - .abc|dexy
+                - foo.txt
+            """)
+
+        with open("index.txt", "w") as f:
+            f.write("{{ d['foo.txt'] }}")
+
+        with open("foo.txt", "w") as f:
+            f.write("foo")
+
+        for i in range(10):
+            with open("%s.abc" % i, "w") as f:
+                f.write("abc %s" % i)
+
+        wrapper = Wrapper(jobs=4)
+        wrapper.create_dexy_dirs()
+        wrapper.run_from_new()
+        wrapper.validate_state('ran')
+
+        graph = wrapper.dependency_graph(wrapper.roots)
+        assert len(graph) == 13
+        for node in graph:
+            assert node.state == 'ran'
+
+        assert str(wrapper.nodes['doc:index.txt|jinja'].output_data()) == "foo"
+
+        wrapper = Wrapper(jobs=4)
+        wrapper.run_from_new()
+        wrapper.validate_state('ran')
+        for node in wrapper.roots:
+            assert node.state == 'consolidated'
+
+def test_run_in_parallel_with_error():
+    with tempdir():
+        with open("dexy.yaml", "w") as f:
+            f.write("""
+            - foo.txt|jinja
+            - bar.txt|dexy
+            """)
+
+        with open("foo.txt", "w") as f:
+            f.write("{{ missing.attribute }}")
+
+        with open("bar.txt", "w") as f:
+            f.write("bar")
+
+        wrapper = Wrapper(jobs=2)
+        wrapper.create_dexy_dirs()
+        wrapper.run_from_new()
+        wrapper.validate_state('error')
+        assert wrapper.current_task.key == 'foo.txt|jinja'
+
+def test_run_in_parallel_with_circular_dependency():
+    with wrap() as wrapper:
+        wrapper.jobs = 2
+        abc = Doc("abc.txt", wrapper, [], contents="abc")
+        doc = Doc("def.txt", wrapper, [abc], contents="def")
+        abc.inputs.append(doc)
+
+        try:
+            wrapper.run_in_parallel([doc])
+            assert False, "should raise CircularDependency"
+        except CircularDependency as e:
+            assert e.message == "abc.txt, def.txt"